@@ -0,0 +1,93 @@
+"""
+Measures how long it takes to build a Workflow's DAG with Workflow.add_task, using the stage name and uid indexes
+(:class:`cosmos.util.sqla.CollectionIndex`) or the linear scans of Workflow.stages and Stage.tasks they replaced.
+
+Tasks are added a Stage at a time, each with a parent in the previous Stage, and are not committed to the database.
+
+usage: python bench_add_task.py [--sizes 10k,100k,500k]
+"""
+from __future__ import print_function
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+from cosmos.api import Cosmos
+from cosmos.models import Workflow as workflow_module, Stage as stage_module
+from dags import parse_sizes
+
+
+def echo(word):
+    return 'echo %s' % word
+
+
+class LinearScan(object):
+    """Looks members up the way add_task and Stage.get_task did before they were indexed"""
+
+    def __init__(self, collection_attr, key_attr):
+        self.collection_attr = collection_attr
+        self.key_attr = key_attr
+
+    def get(self, owner):
+        members = getattr(owner, self.collection_attr)
+        key_attr = self.key_attr
+
+        class Scan(object):
+            def get(self, key, default=None):
+                for m in members:
+                    if getattr(m, key_attr) == key:
+                        return m
+                return default
+        return Scan()
+
+
+def build(num_tasks, num_stages):
+    """:returns: seconds spent in add_task"""
+    cosmos = Cosmos('sqlite://')
+    cosmos.initdb()
+    wf = cosmos.start('bench', skip_confirm=True, primary_log_path=None)
+
+    per_stage = num_tasks // num_stages
+    start = time.time()
+    previous = None
+    for s in range(num_stages):
+        stage_name = 'stage_%s' % s
+        current = []
+        for i in range(per_stage):
+            parents = [previous[i]] if previous else []
+            current.append(wf.add_task(echo, dict(word=i), parents=parents, uid=str(i), stage_name=stage_name))
+        previous = current
+    return time.time() - start
+
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument('--sizes', type=parse_sizes, default='10k,100k,500k')
+    p.add_argument('--stages', type=int, default=10)
+    p.add_argument('--baseline-max', type=parse_sizes, default='30k',
+                   help='skip the (quadratic) linear scans for DAGs larger than this')
+    args = p.parse_args()
+
+    indexed = workflow_module.stages_by_name, stage_module.tasks_by_uid
+    linear = LinearScan('stages', 'name'), LinearScan('tasks', 'uid')
+
+    tmp = tempfile.mkdtemp()
+    os.chdir(tmp)
+    try:
+        print('%-10s %-8s %12s %14s' % ('tasks', 'lookups', 'total (s)', 'tasks/s'))
+        for n in args.sizes:
+            for name, (by_name, by_uid) in [('indexed', indexed), ('linear', linear)]:
+                if name == 'linear' and n > args.baseline_max[0]:
+                    continue
+                workflow_module.stages_by_name, stage_module.tasks_by_uid = by_name, by_uid
+                secs = build(n, args.stages)
+                print('%-10s %-8s %12.2f %14.0f' % (n, name, secs, n / secs))
+    finally:
+        workflow_module.stages_by_name, stage_module.tasks_by_uid = indexed
+        shutil.rmtree(tmp)
+
+
+if __name__ == '__main__':
+    main()
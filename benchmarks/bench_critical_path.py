@@ -0,0 +1,146 @@
+"""
+Measures the makespan of Workflows run under a core limit, simulating the scheduler with these priorities:
+
+id
+    Ready Tasks in the order they were added to the Workflow, which is Workflow.run's default.
+critical_path (unit)
+    The longest path of dependent Tasks first, counting each Task as 1.  This is what priority='critical_path'
+    does for Stages that have never run before.
+critical_path (history)
+    The longest path first, weighting each Task by the mean wall time of its Stage in a previous run of the same
+    Workflow (with different random wall times).
+critical_path (exact)
+    The longest path first, weighting each Task by its actual wall time.  Not achievable, but shows how much is
+    lost to estimation.
+
+Two kinds of Workflows are simulated.  `pipeline` has a chain of long per-sample Tasks (align -> sort -> call) which
+were added after a large number of short QC Tasks, followed by a joint step over every sample; `layered` is a
+random layered DAG whose Tasks belong to Stages with typical wall times from 30 seconds to an hour.  The lower
+bound is the larger of the longest path and the total work divided by the cores.
+
+usage: python bench_critical_path.py [--cores 64] [--samples 48]
+"""
+from __future__ import print_function
+
+import argparse
+import heapq
+import itertools as it
+import random
+from collections import defaultdict
+
+from cosmos import TaskStatus
+from cosmos.core.scheduler import TaskQueue, ResourceLimits, critical_path_lengths
+from dags import FakeTask, layered_dag
+
+
+def pipeline(num_samples, seed):
+    """
+    :returns: (tasks, edges)
+    """
+    rnd = random.Random(seed)
+    tasks = []
+    edges = []
+
+    def add(stage_name, wall_time, parents=()):
+        task = FakeTask(len(tasks) + 1, stage_name=stage_name, wall_time=max(1, int(wall_time)))
+        tasks.append(task)
+        edges.extend((p, task) for p in parents)
+        return task
+
+    # Tasks are added a Stage at a time, like most Workflow scripts do
+    qc = [[add('fastqc', rnd.lognormvariate(5, 0.5)) for _ in range(16)] for _ in range(num_samples)]
+    sizes = [rnd.lognormvariate(0, 0.5) for _ in range(num_samples)]
+    aligned = [add('align', 3600 * size) for size in sizes]
+    qc_reports = [add('qc_report', 60, qc[i]) for i in range(num_samples)]
+    sorted_ = [add('sort', 900 * size, [aligned[i]]) for i, size in enumerate(sizes)]
+    called = [add('call', 2400 * size, [sorted_[i], qc_reports[i]]) for i, size in enumerate(sizes)]
+    add('joint_genotype', 1800, called)
+    return tasks, edges
+
+
+# the typical wall time of each Stage of the layered Workflow
+LAYERED_STAGE_WALL_TIMES = [30, 60, 120, 300, 600, 1200, 3600]
+
+
+def layered(num_tasks, seed):
+    n, index_edges = layered_dag(num_tasks, width=num_tasks // 10, max_parents=3, seed=seed)
+    rnd = random.Random(seed)
+    tasks = []
+    for i in range(n):
+        stage = i % len(LAYERED_STAGE_WALL_TIMES)
+        wall_time = LAYERED_STAGE_WALL_TIMES[stage] * rnd.lognormvariate(0, 0.7)
+        tasks.append(FakeTask(i + 1, stage_name='stage_%s' % stage, wall_time=max(1, int(wall_time))))
+    return tasks, [(tasks[p], tasks[c]) for p, c in index_edges]
+
+
+def simulate(tasks, edges, cores, key):
+    """
+    Run `tasks` the way Workflow.run does with max_cores, and the given TaskQueue key.
+
+    :returns: the makespan
+    """
+    for t in tasks:
+        t.status = TaskStatus.no_attempt
+    queue = TaskQueue(tasks, edges, key=key)
+    limits = ResourceLimits(dict(cores=cores), key=key)
+    running = set()
+    finish_heap = []
+    counter = it.count()
+    now = 0
+    while len(queue):
+        selected = limits.admit(queue.pop_ready(), running, now)
+        for t in selected:
+            t.status = TaskStatus.submitted
+            running.add(t)
+            heapq.heappush(finish_heap, (now + t.wall_time, next(counter), t))
+
+        now = finish_heap[0][0]
+        while finish_heap and finish_heap[0][0] == now:
+            t = heapq.heappop(finish_heap)[2]
+            running.remove(t)
+            t.status = TaskStatus.successful
+            queue.complete(t)
+    return now
+
+
+def stage_means(tasks):
+    by_stage = defaultdict(list)
+    for t in tasks:
+        by_stage[t.stage_name].append(t.wall_time)
+    return {name: float(sum(times)) / len(times) for name, times in by_stage.items()}
+
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument('--cores', type=int, default=64)
+    p.add_argument('--samples', type=int, default=48, help='number of samples in the pipeline Workflow')
+    p.add_argument('--layered-tasks', type=int, default=2000, help='number of Tasks in the layered Workflow')
+    p.add_argument('--seed', type=int, default=0)
+    args = p.parse_args()
+
+    workflows = [('pipeline', lambda seed: pipeline(args.samples, seed)),
+                 ('layered', lambda seed: layered(args.layered_tasks, seed))]
+
+    print('%-10s %-26s %12s %12s' % ('workflow', 'priority', 'makespan (s)', 'vs bound'))
+    for name, make in workflows:
+        tasks, edges = make(args.seed)
+        history = stage_means(make(args.seed + 1)[0])
+
+        exact = critical_path_lengths(tasks, edges, lambda t: t.wall_time)
+        bound = max(max(exact.values()), sum(t.wall_time for t in tasks) / float(args.cores))
+
+        priorities = [('id', lambda t: t.id)]
+        for weight_name, weight in [('unit', lambda t: 1),
+                                    ('history', lambda t: history[t.stage_name]),
+                                    ('exact', lambda t: t.wall_time)]:
+            lengths = critical_path_lengths(tasks, edges, weight)
+            priorities.append(('critical_path (%s)' % weight_name,
+                               lambda t, lengths=lengths: (-lengths[t], t.id)))
+
+        for priority_name, key in priorities:
+            makespan = simulate(tasks, edges, args.cores, key)
+            print('%-10s %-26s %12d %11.1f%%' % (name, priority_name, makespan, 100. * makespan / bound))
+
+
+if __name__ == '__main__':
+    main()
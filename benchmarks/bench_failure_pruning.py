@@ -0,0 +1,84 @@
+"""
+Measures how long it takes to prune the descendants of failed Tasks from a DAG, when one bad input breaks every
+sample: a reference Task feeds a chain of Tasks per sample, which are joined by one last Task, and the first Task
+of every chain fails.
+
+DAG
+    :meth:`cosmos.graph.dag.DAG.remove_with_descendants`, which TaskQueue.remove and Task.delete use.  Tasks that
+    were already removed are never visited again, so the total time is proportional to the size of the DAG.
+rebuild
+    The way Task.descendants used to work: building a networkx graph of the whole Workflow for every failed Task,
+    then removing its descendants.
+
+usage: python bench_failure_pruning.py [--samples 1k,5k,100k] [--chain 5]
+"""
+from __future__ import print_function
+
+import argparse
+import time
+
+import networkx as nx
+
+from cosmos.graph.dag import DAG
+from dags import parse_sizes
+
+
+def wide_dag(num_samples, chain_length):
+    """:returns: (nodes, edges, the first node of each chain)"""
+    edges = []
+    heads = []
+    joined = []
+    next_id = 2
+    for _ in range(num_samples):
+        chain = range(next_id, next_id + chain_length)
+        next_id += chain_length
+        edges.append((1, chain[0]))
+        edges.extend(zip(chain, chain[1:]))
+        heads.append(chain[0])
+        joined.append(chain[-1])
+    edges.extend((t, next_id) for t in joined)
+    return range(1, next_id + 1), edges, heads
+
+
+def prune_dag(nodes, edges, failed):
+    dag = DAG(nodes, edges)
+    for t in failed:
+        if t in dag:
+            dag.remove_with_descendants(t)
+    return len(dag)
+
+
+def prune_rebuild(nodes, edges, failed):
+    removed = set()
+    for t in failed:
+        g = nx.DiGraph()
+        g.add_nodes_from(n for n in nodes if n not in removed)
+        g.add_edges_from((p, c) for p, c in edges if p not in removed and c not in removed)
+        if t in g:
+            removed.update(nx.descendants(g, t) | {t})
+    return len(nodes) - len(removed)
+
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument('--samples', type=parse_sizes, default='1k,5k,100k')
+    p.add_argument('--chain', type=int, default=5, help='the number of Tasks per sample')
+    p.add_argument('--rebuild-max', type=parse_sizes, default='5k',
+                   help='skip the (quadratic) rebuild method for more samples than this')
+    args = p.parse_args()
+
+    print('%-10s %-10s %-10s %10s' % ('samples', 'tasks', 'method', 'secs'))
+    for n in args.samples:
+        nodes, edges, heads = wide_dag(n, args.chain)
+        for name, prune in [('DAG', prune_dag), ('rebuild', prune_rebuild)]:
+            if name == 'rebuild' and n > args.rebuild_max[0]:
+                continue
+            start = time.time()
+            remaining = prune(nodes, edges, heads)
+            secs = time.time() - start
+            assert remaining == 1, remaining
+            print('%-10s %-10s %-10s %10.2f' % (n, len(nodes), name, secs))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+"""
+Measures how long it takes DRM_Local to start a Task after its parent exits, by running a chain of short Tasks
+with and without the SIGCHLD wakeup (``drm_options={'local': {'event_driven': False}}``).
+
+usage: python bench_local_latency.py [--length 50] [--task-time 0.1]
+"""
+from __future__ import print_function
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+from cosmos.api import Cosmos
+
+
+def sleep(secs):
+    return 'sleep %s' % secs
+
+
+def run_chain(length, task_time, event_driven):
+    """
+    :returns: seconds of overhead per Task
+    """
+    root = tempfile.mkdtemp()
+    try:
+        os.chdir(root)
+        cosmos = Cosmos('sqlite:///%s/sqlite.db' % root, default_drm='local',
+                        drm_options={'local': {'event_driven': event_driven}})
+        cosmos.initdb()
+        workflow = cosmos.start('bench_local_latency', skip_confirm=True)
+
+        parent = None
+        for i in range(length):
+            parent = workflow.add_task(func=sleep, params=dict(secs=task_time), uid=str(i),
+                                       parents=[parent] if parent else [])
+
+        start = time.time()
+        workflow.run()
+        assert workflow.successful
+        return (time.time() - start) / length - task_time
+    finally:
+        shutil.rmtree(root)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--length', type=int, default=50, help='number of Tasks in the chain')
+    parser.add_argument('--task-time', type=float, default=0.1, help='seconds each Task sleeps for')
+    args = parser.parse_args()
+
+    for event_driven in [False, True]:
+        print('%-20s %.1fms overhead per Task' % ('event_driven=%s' % event_driven,
+                                                   run_chain(args.length, args.task_time, event_driven) * 1000))
+
+
+if __name__ == '__main__':
+    main()
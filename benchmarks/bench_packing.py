@@ -0,0 +1,161 @@
+"""
+Measures how well Tasks are packed onto a node by simulating a run of a task mix under these admission policies:
+
+max_cores
+    The policy Workflow.run used before ResourceLimits: ready Tasks in ascending core_req order, stopping at the
+    first that does not fit in max_cores.  mem_req is ignored, so memory can be overcommitted.
+no reservation
+    :class:`cosmos.core.scheduler.ResourceLimits` with both max_cores and max_mem, which never reserves resources
+    for starving Tasks.
+resource_limits
+    ResourceLimits with its default starvation_time.
+
+The mix is either recorded from the successful Tasks of a Cosmos database (core_req, mem_req and wall_time), a csv
+with those three columns, or a synthetic mix of many small Tasks and a few memory hungry ones.  Tasks become ready
+at random times, at a rate which would keep `--load` of the cores busy, or all at once if it is 0.  Waits are
+reported separately for big Tasks (those needing over 1/8th of the memory) and the rest.
+
+usage: python bench_packing.py [--db sqlite:///cosmos.sqlite | --csv mix.csv] [--cores 32] [--mem 262144] [--load 0.9]
+"""
+from __future__ import print_function
+
+import argparse
+import csv
+import heapq
+import random
+
+from cosmos.core.scheduler import ResourceLimits
+from dags import FakeTask
+
+
+def synthetic_mix(n=2000, seed=0):
+    rnd = random.Random(seed)
+    tasks = []
+    for i in range(n):
+        if rnd.random() < 0.05:
+            # ie an aligner or assembler
+            tasks.append(FakeTask(i, core_req=rnd.choice([8, 16]), mem_req=rnd.randint(64, 160) * 1024,
+                                  wall_time=rnd.randint(600, 3600)))
+        else:
+            tasks.append(FakeTask(i, core_req=rnd.choice([1, 1, 2, 4]), mem_req=rnd.randint(1, 16) * 1024,
+                                  wall_time=rnd.randint(30, 600)))
+    return tasks
+
+
+def recorded_mix(database_url):
+    from cosmos.api import Cosmos, Task
+    cosmos = Cosmos(database_url)
+    q = cosmos.session.query(Task.core_req, Task.mem_req, Task.wall_time).filter(Task.successful == True)
+    return [FakeTask(i, core_req=c or 1, mem_req=m, wall_time=w or 0) for i, (c, m, w) in enumerate(q)]
+
+
+def csv_mix(path):
+    with open(path) as fh:
+        return [FakeTask(i, core_req=int(row['core_req']), mem_req=int(row['mem_req'] or 0),
+                         wall_time=float(row['wall_time']))
+                for i, row in enumerate(csv.DictReader(fh))]
+
+
+def max_cores_policy(max_cores):
+    def select(ready, running, now):
+        cores_left = max_cores - sum(t.core_req for t in running)
+        selected = []
+        for task in sorted(ready, key=lambda t: (t.core_req, t.id)):
+            if task.core_req > cores_left:
+                break
+            cores_left -= task.core_req
+            selected.append(task)
+        return selected
+    return select
+
+
+def simulate(tasks, arrivals, select, cores, mem):
+    """
+    :param arrivals: when each Task becomes ready, in the same order as `tasks`
+    :returns: a dict of statistics
+    """
+    pending = sorted(zip(arrivals, [t.id for t in tasks], tasks), reverse=True)
+    arrived = {}
+    ready = []
+    running = []
+    finish_heap = []
+    now = 0.
+    core_seconds = mem_seconds = overcommitted_seconds = 0.
+    peak_mem = 0
+    waits = []
+    while pending or ready or running:
+        while pending and pending[-1][0] <= now:
+            _, _, task = pending.pop()
+            arrived[task] = now
+            ready.append(task)
+
+        selected = select(ready, running, now)
+        if selected:
+            selected_set = set(selected)
+            ready = [t for t in ready if t not in selected_set]
+        for task in selected:
+            running.append(task)
+            waits.append((now - arrived[task], task))
+            heapq.heappush(finish_heap, (now + task.wall_time, task.id, task))
+        if not running and not pending:
+            raise ValueError('%d Tasks can never run' % len(ready))
+
+        end = min(finish_heap[0][0] if finish_heap else float('inf'), pending[-1][0] if pending else float('inf'))
+        used_cores = sum(t.core_req for t in running)
+        used_mem = sum(t.mem_req or 0 for t in running)
+        core_seconds += used_cores * (end - now)
+        mem_seconds += used_mem * (end - now)
+        peak_mem = max(peak_mem, used_mem)
+        if used_mem > mem:
+            overcommitted_seconds += end - now
+        now = end
+        while finish_heap and finish_heap[0][0] <= now:
+            running.remove(heapq.heappop(finish_heap)[2])
+
+    big = [w for w, t in waits if t.mem_req and t.mem_req >= mem / 8.]
+    small = [w for w, t in waits if not (t.mem_req and t.mem_req >= mem / 8.)]
+    return dict(makespan=now,
+                core_util=core_seconds / (cores * now),
+                mem_util=mem_seconds / (mem * now),
+                peak_mem=float(peak_mem) / mem,
+                overcommitted=overcommitted_seconds / now,
+                big_wait=sum(big) / len(big) if big else 0,
+                max_big_wait=max(big) if big else 0,
+                small_wait=sum(small) / len(small) if small else 0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--db', help='a Cosmos database url to take the task mix from')
+    parser.add_argument('--csv', help='a csv with core_req, mem_req (MB) and wall_time (seconds) columns')
+    parser.add_argument('--cores', type=int, default=32)
+    parser.add_argument('--mem', type=int, default=256 * 1024, help='MB')
+    parser.add_argument('--load', type=float, default=0.9, help='the offered load, as a fraction of the cores')
+    args = parser.parse_args()
+
+    if args.db:
+        tasks = recorded_mix(args.db)
+    elif args.csv:
+        tasks = csv_mix(args.csv)
+    else:
+        tasks = synthetic_mix()
+    rnd = random.Random(0)
+    duration = sum(t.core_req * t.wall_time for t in tasks) / float(args.cores) / args.load if args.load else 0
+    arrivals = [rnd.uniform(0, duration) for _ in tasks]
+    print('%d Tasks on %d cores and %dGB of memory, load %s' % (len(tasks), args.cores, args.mem / 1024, args.load))
+
+    print('%-16s %10s %10s %10s %9s %14s %11s %15s %12s' % (
+        'policy', 'makespan', 'core util', 'mem util', 'peak mem', 'overcommitted', 'big wait', 'max big wait',
+        'small wait'))
+    capacity = dict(cores=args.cores, mem=args.mem)
+    for name, select in [('max_cores', max_cores_policy(args.cores)),
+                         ('no reservation', ResourceLimits(capacity, starvation_time=float('inf')).select),
+                         ('resource_limits', ResourceLimits(capacity).select)]:
+        s = simulate(tasks, arrivals, select, args.cores, args.mem)
+        print('%-16s %9.0fs %9.1f%% %9.1f%% %8.0f%% %13.1f%% %10.0fs %14.0fs %11.0fs' % (
+            name, s['makespan'], s['core_util'] * 100, s['mem_util'] * 100, s['peak_mem'] * 100,
+            s['overcommitted'] * 100, s['big_wait'], s['max_big_wait'], s['small_wait']))
+
+
+if __name__ == '__main__':
+    main()
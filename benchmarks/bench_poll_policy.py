@@ -0,0 +1,86 @@
+"""
+Simulates polling a DRM with each :mod:`cosmos.job.poll_policy` policy, and reports how many polls (ie squeue calls)
+each one makes and how long finished Tasks wait to be noticed.
+
+A Workflow of Stages that run one after another is simulated with a fake clock.  Every Task of a Stage is submitted
+as soon as the previous Stage is noticed to have finished, and runs for a lognormally distributed time around its
+Stage's mean, which is what the adaptive policy is given as its estimate.
+
+fixed
+    PollPolicy, every DRM.poll_interval seconds
+backoff
+    AdaptivePollPolicy without estimates, which only backs off while nothing finishes
+adaptive
+    AdaptivePollPolicy with the Stage means as estimates
+
+usage: python bench_poll_policy.py [--stages 20] [--width 100] [--poll-interval 5]
+"""
+from __future__ import print_function
+
+import argparse
+import datetime
+import random
+
+from cosmos.job.poll_policy import PollPolicy, AdaptivePollPolicy
+
+EPOCH = datetime.datetime(2000, 1, 1)
+
+
+class FakeDRM(object):
+    name = 'sim'
+
+    def __init__(self, poll_interval):
+        self.poll_interval = poll_interval
+
+
+class FakeTask(object):
+    def __init__(self, stage, submitted_at, runtime):
+        self.stage = stage
+        self.submitted_on = EPOCH + datetime.timedelta(seconds=submitted_at)
+        self.finishes_at = submitted_at + runtime
+
+
+def simulate(policy, drm, stage_means, width, sigma, seed):
+    """:returns: (number of polls, mean seconds between a Task finishing and its poll, total seconds)"""
+    rand = random.Random(seed)
+    now = 0
+    polls = 0
+    latencies = []
+    for stage, mean in enumerate(stage_means):
+        running = [FakeTask(stage, now, mean * rand.lognormvariate(0, sigma)) for _ in range(width)]
+        while running:
+            polls += 1
+            finished = [t for t in running if t.finishes_at <= now]
+            latencies.extend(now - t.finishes_at for t in finished)
+            running = [t for t in running if t.finishes_at > now]
+            if running:
+                now += policy.next_interval(drm, running, len(finished), EPOCH + datetime.timedelta(seconds=now))
+    return polls, sum(latencies) / len(latencies), now
+
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument('--stages', type=int, default=20)
+    p.add_argument('--width', type=int, default=100, help='the number of Tasks per Stage')
+    p.add_argument('--poll-interval', type=float, default=5)
+    p.add_argument('--max-interval', type=float, default=60)
+    p.add_argument('--sigma', type=float, default=0.3, help='of the lognormal runtimes')
+    p.add_argument('--seed', type=int, default=0)
+    args = p.parse_args()
+
+    rand = random.Random(args.seed)
+    stage_means = [rand.choice([30, 300, 1800, 3600]) for _ in range(args.stages)]
+    estimate = lambda task: stage_means[task.stage]
+    policies = [('fixed', lambda: PollPolicy()),
+                ('backoff', lambda: AdaptivePollPolicy(args.max_interval)),
+                ('adaptive', lambda: AdaptivePollPolicy(args.max_interval, estimate=estimate))]
+
+    print('%-10s %8s %16s %12s' % ('policy', 'polls', 'mean_latency', 'makespan'))
+    for name, policy in policies:
+        polls, latency, makespan = simulate(policy(), FakeDRM(args.poll_interval), stage_means, args.width,
+                                            args.sigma, args.seed)
+        print('%-10s %8d %15.1fs %11.0fs' % (name, polls, latency, makespan))
+
+
+if __name__ == '__main__':
+    main()
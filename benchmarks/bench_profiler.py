@@ -0,0 +1,66 @@
+"""
+Measures the cost of profiling local Tasks with cosmos/job/drm/profiler.py: the cpu time of each /proc sample, the
+resulting overhead at several sampling intervals, and the wall time added to a cpu bound command.
+
+usage: python bench_profiler.py [--seconds 5] [--intervals 0.1,0.5,1]
+"""
+from __future__ import print_function
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from cosmos.job.drm import profiler
+
+PROFILER = profiler.__file__.replace('.pyc', '.py')
+
+
+def busy_cmd(seconds):
+    return [sys.executable, '-c', 'import time\nt = time.time()\nwhile time.time() - t < %s: pass' % seconds]
+
+
+def timed_call(cmd):
+    start = time.time()
+    subprocess.check_call(cmd, preexec_fn=os.setsid)
+    return time.time() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--seconds', type=float, default=5, help='how long the profiled command runs')
+    parser.add_argument('--intervals', default='0.1,0.5,1', help='sampling intervals to measure')
+    args = parser.parse_args()
+
+    num_procs = sum(1 for pid in os.listdir('/proc') if pid.isdigit())
+    p = profiler.Profile(os.getpgrp(), os.getpid())
+    n = 200
+    start = profiler.self_cpu_time()
+    for _ in range(n):
+        p.sample()
+    print('%d processes on this host, %.2fms of cpu per sample' % (num_procs,
+                                                                   (profiler.self_cpu_time() - start) / n * 1000))
+
+    cmd = busy_cmd(args.seconds)
+    baseline = timed_call(cmd)
+    print('%-10s %8s %8s %12s %14s' % ('interval', 'samples', 'final', 'overhead', 'wall added'))
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        for interval in map(float, args.intervals.split(',')):
+            output = os.path.join(tmp_dir, 'profile.json')
+            wall = timed_call([sys.executable, PROFILER, '--interval', str(interval), '--output', output, '--'] + cmd)
+            with open(output) as fh:
+                d = json.load(fh)
+            print('%-10s %8d %8s %11.3f%% %12.1fms' % (interval, d['num_polls'], d['profile_interval'],
+                                                       d['profiler_cpu_time'] / d['wall_time'] * 100,
+                                                       (wall - baseline) * 1000))
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""
+Measures the controller's scheduling overhead (finding ready Tasks and releasing their children) on synthetic DAGs,
+comparing :class:`cosmos.core.scheduler.TaskQueue` against the in-degree scan over a networkx graph it replaced.
+
+Only time spent in the scheduler is counted; job submission and polling are simulated.
+
+usage: python bench_scheduler.py [--sizes 10k,100k,1M]
+"""
+from __future__ import print_function
+
+import argparse
+import time
+
+import networkx as nx
+
+from cosmos import TaskStatus
+from cosmos.core.scheduler import TaskQueue
+from dags import layered_dag, fake_tasks, parse_sizes
+
+
+def simulate(scheduler, tasks, max_cores, completions_per_poll):
+    """
+    :returns: (number of polls, seconds spent scheduling)
+    """
+    running = []
+    polls = 0
+    sched_time = 0.0
+    remaining = len(tasks)
+    while remaining:
+        polls += 1
+        start = time.time()
+        submitted = scheduler.pop_ready(max_cores - len(running))
+        sched_time += time.time() - start
+
+        for t in submitted:
+            t.status = TaskStatus.submitted
+        running.extend(submitted)
+
+        finished, running = running[:completions_per_poll], running[completions_per_poll:]
+        start = time.time()
+        for t in finished:
+            t.status = TaskStatus.successful
+            scheduler.complete(t)
+        sched_time += time.time() - start
+        remaining -= len(finished)
+    return polls, sched_time
+
+
+class TaskQueueScheduler(object):
+    def __init__(self, tasks, edges):
+        self.q = TaskQueue(tasks, edges, key=lambda t: (t.core_req, t.id))
+
+    def pop_ready(self, cores_left):
+        cores_left = [cores_left]
+
+        def fits(t):
+            if t.core_req <= cores_left[0]:
+                cores_left[0] -= t.core_req
+                return True
+            return False
+
+        return self.q.pop_ready(fits)
+
+    def complete(self, task):
+        self.q.complete(task)
+
+
+class InDegreeScheduler(object):
+    """The pre-TaskQueue algorithm"""
+
+    def __init__(self, tasks, edges):
+        self.g = nx.DiGraph()
+        self.g.add_nodes_from(tasks)
+        self.g.add_edges_from(edges)
+
+    def pop_ready(self, cores_left):
+        ready_tasks = [task for task, degree in list(self.g.in_degree()) if
+                       degree == 0 and task.status == TaskStatus.no_attempt]
+        submittable_tasks = []
+        ready_tasks = sorted(ready_tasks, key=lambda t: (t.core_req, t.id))
+        while len(ready_tasks) > 0 and ready_tasks[0].core_req <= cores_left:
+            cores_left -= ready_tasks[0].core_req
+            submittable_tasks.append(ready_tasks.pop(0))
+        return submittable_tasks
+
+    def complete(self, task):
+        self.g.remove_node(task)
+
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument('--sizes', type=parse_sizes, default='10k,100k,1M')
+    p.add_argument('--width', type=int, default=1000, help='number of Tasks in each layer of the DAG')
+    p.add_argument('--max-cores', type=int, default=2000)
+    p.add_argument('--completions-per-poll', type=int, default=500)
+    p.add_argument('--baseline-max', type=parse_sizes, default='100k',
+                   help='skip the (quadratic) in-degree scan for DAGs larger than this')
+    args = p.parse_args()
+
+    print('%-10s %-10s %-14s %8s %12s %14s' % ('tasks', 'edges', 'scheduler', 'polls', 'total (s)', 'per poll (ms)'))
+    for n in args.sizes:
+        n, edges = layered_dag(n, width=args.width)
+        for name, cls in [('TaskQueue', TaskQueueScheduler), ('in-degree', InDegreeScheduler)]:
+            if cls is InDegreeScheduler and n > args.baseline_max[0]:
+                continue
+            tasks, task_edges = fake_tasks(n, edges)
+            scheduler = cls(tasks, task_edges)
+            polls, secs = simulate(scheduler, tasks, args.max_cores, args.completions_per_poll)
+            print('%-10s %-10s %-14s %8d %12.2f %14.3f' % (n, len(edges), name, polls, secs, secs / polls * 1000))
+
+
+if __name__ == '__main__':
+    main()
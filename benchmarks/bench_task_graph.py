@@ -0,0 +1,131 @@
+"""
+Compares the memory and speed of :class:`cosmos.graph.dag.DAG`, a compact DAG of Task ids, with a networkx DiGraph
+whose nodes are Tasks, which is what Workflow.task_graph returns and what the scheduler used to work on.
+
+For each graph this measures the resident memory it adds and the time to build it, get the in-degree of every
+Task, compute a topological order, find the descendants of 100 random Tasks, and remove 100 random Tasks along with
+their descendants, the way a failed Task is pruned.  Every measurement runs in a forked process, so memory is not
+shared between them.
+
+usage: python bench_task_graph.py [--sizes 100k,1M]
+"""
+from __future__ import print_function
+
+import argparse
+import cPickle as pickle
+import os
+import random
+import resource
+import time
+
+import networkx as nx
+
+from cosmos.graph.dag import DAG
+from dags import layered_dag, fake_tasks, parse_sizes
+
+
+def rss_mb():
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * resource.getpagesize() / 1024. ** 2
+
+
+class Networkx(object):
+    name = 'networkx'
+
+    def __init__(self, tasks, edges):
+        self.g = nx.DiGraph()
+        self.g.add_nodes_from(tasks)
+        self.g.add_edges_from(edges)
+        self.node = {t.id: t for t in tasks}
+
+    def in_degrees(self):
+        return [d for _, d in self.g.in_degree()]
+
+    def topological_order(self):
+        return list(nx.topological_sort(self.g))
+
+    def descendants(self, task_id):
+        return nx.descendants(self.g, self.node[task_id])
+
+    def remove_with_descendants(self, task_id):
+        task = self.node[task_id]
+        if task in self.g:
+            removed = nx.descendants(self.g, task) | {task}
+            self.g.remove_nodes_from(removed)
+
+
+class Compact(object):
+    name = 'DAG'
+
+    def __init__(self, tasks, edges):
+        self.g = DAG((t.id for t in tasks), ((p.id, c.id) for p, c in edges))
+
+    def in_degrees(self):
+        return [self.g.in_degree(n) for n in self.g]
+
+    def topological_order(self):
+        return self.g.topological_order()
+
+    def descendants(self, task_id):
+        return self.g.descendants(task_id)
+
+    def remove_with_descendants(self, task_id):
+        if task_id in self.g:
+            self.g.remove_with_descendants(task_id)
+
+
+def measure(cls, tasks, edges, sample):
+    """:returns: (dict) measurement -> seconds, and 'memory' -> MB"""
+    results = {}
+    before = rss_mb()
+    start = time.time()
+    graph = cls(tasks, edges)
+    results['build'] = time.time() - start
+    results['memory'] = rss_mb() - before
+
+    for name, f in [('in-degree', lambda: graph.in_degrees()),
+                    ('topological', lambda: graph.topological_order()),
+                    ('descendants', lambda: [graph.descendants(i) for i in sample]),
+                    ('remove', lambda: [graph.remove_with_descendants(i) for i in sample])]:
+        start = time.time()
+        f()
+        results[name] = time.time() - start
+    return results
+
+
+def in_child(f, *args):
+    """:returns: f(*args), called in a forked process"""
+    r, w = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(r)
+        with os.fdopen(w, 'wb') as out:
+            pickle.dump(f(*args), out, -1)
+        os._exit(0)
+    os.close(w)
+    with os.fdopen(r, 'rb') as inp:
+        result = pickle.load(inp)
+    os.waitpid(pid, 0)
+    return result
+
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument('--sizes', type=parse_sizes, default='100k,1M')
+    p.add_argument('--seed', type=int, default=0)
+    args = p.parse_args()
+
+    columns = ['memory', 'build', 'in-degree', 'topological', 'descendants', 'remove']
+    print('%-8s %-9s %-9s %10s' % ('tasks', 'edges', 'graph', 'MB') + ''.join('%13s' % c for c in columns[1:]))
+    for n in args.sizes:
+        num_tasks, index_edges = layered_dag(n, width=max(1, n // 100), max_parents=3, seed=args.seed)
+        tasks, edges = fake_tasks(num_tasks, index_edges)
+        sample = random.Random(args.seed).sample(range(1, num_tasks + 1), 100)
+        for cls in [Networkx, Compact]:
+            results = in_child(measure, cls, tasks, edges, sample)
+            print('%-8s %-9s %-9s %10.1f' % (n, len(edges), cls.name, results['memory']) +
+                  ''.join('%12.2fs' % results[c] for c in columns[1:]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""
+Measures the overhead of :class:`cosmos.util.timing.PhaseTimings` on a Workflow run: the cost of one timed phase with
+timing disabled (NullTimings, the default) and enabled, and the time of a local run of no-op Tasks with and without
+``timings=True``.
+
+usage: python bench_timing.py [--tasks 200] [--calls 1000000]
+"""
+from __future__ import print_function
+
+import argparse
+import atexit
+import os
+import shutil
+import tempfile
+import timeit
+
+from cosmos.api import Cosmos
+from cosmos.util.timing import PhaseTimings, NullTimings
+
+
+def true():
+    return 'true'
+
+
+def phase_cost(timings, calls):
+    """:returns: (float) seconds per timed phase, less the cost of the loop"""
+    def timed():
+        for _ in xrange(calls):
+            with timings.phase('commit'):
+                pass
+
+    def untimed():
+        for _ in xrange(calls):
+            pass
+
+    return (min(timeit.repeat(timed, number=1, repeat=3)) - min(timeit.repeat(untimed, number=1, repeat=3))) / calls
+
+
+def run(num_tasks, timings):
+    tmp_dir = tempfile.mkdtemp()
+    # removed after the Workflow's own atexit check, which reads its status from the database
+    atexit.register(shutil.rmtree, tmp_dir)
+    cosmos = Cosmos('sqlite:///%s' % os.path.join(tmp_dir, 'db.sqlite'), default_drm='local')
+    cosmos.initdb()
+    wf = cosmos.start('bench', skip_confirm=True, primary_log_path=None)
+    for i in range(num_tasks):
+        wf.add_task(true, uid=str(i))
+    wf.log.setLevel('WARNING')
+    start = timeit.default_timer()
+    wf.run(max_cores=50, timings=timings, log_out_dir_func=lambda task: os.path.join(tmp_dir, task.uid))
+    return timeit.default_timer() - start, wf.timings
+
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument('--tasks', type=int, default=200)
+    p.add_argument('--calls', type=int, default=1000000)
+    args = p.parse_args()
+
+    for name, timings in [('disabled', NullTimings()), ('enabled', PhaseTimings())]:
+        print('%-8s %8.3f us per phase' % (name, phase_cost(timings, args.calls) * 1e6))
+
+    for timings in [False, True]:
+        seconds, wf_timings = run(args.tasks, timings)
+        phases = sum(h.count for h in wf_timings.histograms.values())
+        print('timings=%-5s %d tasks in %.2fs%s' % (timings, args.tasks, seconds,
+                                                    ', %d phases timed' % phases if timings else ''))
+    print(wf_timings.report())
+
+
+if __name__ == '__main__':
+    main()
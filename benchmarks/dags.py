@@ -0,0 +1,47 @@
+"""
+Synthetic DAGs shared by the benchmarks in this directory.
+"""
+import random
+
+
+class FakeTask(object):
+    """Just enough of a Task for the scheduler: no database required."""
+
+    def __init__(self, id, stage_name='stage', core_req=1, mem_req=None, wall_time=1, resource_req=None):
+        from cosmos import TaskStatus
+
+        self.id = id
+        self.stage_name = stage_name
+        self.core_req = core_req
+        self.mem_req = mem_req
+        self.wall_time = wall_time
+        self.resource_req = resource_req or {}
+        self.status = TaskStatus.no_attempt
+
+    def __repr__(self):
+        return '<FakeTask %s>' % self.id
+
+
+def layered_dag(num_tasks, width=1000, max_parents=2, seed=0):
+    """
+    :returns: (num_tasks, edges) where edges is a list of (parent_index, child_index).  Tasks are arranged in
+        layers of `width`; every Task outside the first layer has 1 to `max_parents` parents in the layer above it.
+    """
+    rnd = random.Random(seed)
+    edges = []
+    for i in range(width, num_tasks):
+        layer_start = (i // width - 1) * width
+        for p in set(rnd.randint(layer_start, layer_start + width - 1) for _ in range(rnd.randint(1, max_parents))):
+            edges.append((p, i))
+    return num_tasks, edges
+
+
+def fake_tasks(num_tasks, edges):
+    tasks = [FakeTask(i + 1) for i in range(num_tasks)]
+    return tasks, [(tasks[p], tasks[c]) for p, c in edges]
+
+
+def parse_sizes(s):
+    """'10k,1M' -> [10000, 1000000]"""
+    mult = dict(k=10 ** 3, K=10 ** 3, m=10 ** 6, M=10 ** 6)
+    return [int(float(x[:-1]) * mult[x[-1]]) if x[-1] in mult else int(x) for x in s.split(',')]
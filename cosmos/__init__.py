@@ -89,6 +89,11 @@ import blinker
 signal_task_status_change = blinker.Signal()
 signal_stage_status_change = blinker.Signal()
 signal_workflow_status_change = blinker.Signal()
+# Sent by a JobManager after each poll of a DRM, with the keyword arguments drm (its name), seconds (how long the poll
+# took), finished and running (the number of Tasks)
+signal_drm_polled = blinker.Signal()
+# Sent by Workflow.run on each pass of its run loop, with the keyword arguments queued and running (the number of Tasks)
+signal_run_loop = blinker.Signal()
 
 ########################################################################################################################
 # Enums
@@ -4,13 +4,16 @@ from cosmos.models.Cosmos import Cosmos, default_get_submit_args
 from cosmos.models.Task import Task
 from cosmos.models.Stage import Stage
 from cosmos.models.Workflow import Workflow, default_task_log_output_dir
+from cosmos.core.history import ResourcePredictor
+from cosmos.job.poll_policy import PollPolicy, AdaptivePollPolicy
 from cosmos import WorkflowStatus, StageStatus, TaskStatus, NOOP, signal_workflow_status_change, signal_stage_status_change, signal_task_status_change, \
-    Dependency
+    signal_drm_polled, signal_run_loop, Dependency
 
 from cosmos.util.args import add_workflow_args
 from cosmos.util.helpers import make_dict
 from cosmos.util.iterstuff import only_one
 from cosmos.util.signal_handlers import SGESignalHandler, handle_sge_signals
+from cosmos.util.event_log import EventLog, read_events, replay_event_log
 
 from cosmos.graph.draw import draw_task_graph, draw_stage_graph, pygraphviz_available
 import funcsigs
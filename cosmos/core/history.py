@@ -0,0 +1,191 @@
+"""
+Estimates based on earlier runs of Stages with the same name, in any Workflow in the database.
+"""
+import math
+import os
+
+from sqlalchemy import func
+
+from cosmos.models.Task import Task
+from cosmos.models.Stage import Stage
+
+
+def stage_wall_times(session, stage_names):
+    """
+    :returns: (dict) stage name -> the mean wall_time (in seconds) of the successful Tasks of every Stage with
+        that name.  Stages which have never succeeded are left out.
+    """
+    stage_names = list(set(stage_names))
+    if not stage_names:
+        return {}
+    q = session.query(Stage.name, func.avg(Task.wall_time)) \
+        .join(Task, Task.stage_id == Stage.id) \
+        .filter(Task.successful == True, Task.wall_time != None, Stage.name.in_(stage_names)) \
+        .group_by(Stage.name)
+    return {name: float(wall_time) for name, wall_time in q}
+
+
+def runtime_estimator(session, tasks, estimates=None):
+    """
+    :param tasks: the Tasks that will be estimated
+    :param estimates: user supplied estimates, which take precedence over history.  Either a dict of stage name ->
+        seconds, or a callable(task) -> seconds or None.
+    :returns: a callable(task) -> the estimated wall time of `task` in seconds.  In order of preference, this is the
+        user's estimate, the mean wall time of the Task's Stage in previous runs, or the mean over every Stage
+        with history.  If there is no history at all every Task is estimated to take 1 second, so paths are
+        measured in Tasks.
+    """
+    if isinstance(estimates, dict):
+        get_user_estimate = lambda task: estimates.get(task.stage.name)
+    elif estimates is not None:
+        get_user_estimate = estimates
+    else:
+        get_user_estimate = lambda task: None
+
+    history = stage_wall_times(session, (t.stage.name for t in tasks))
+    default = sum(history.values()) / len(history) if history else 1
+
+    def estimate(task):
+        e = get_user_estimate(task)
+        if e is None:
+            e = history.get(task.stage.name, default)
+        return e
+
+    return estimate
+
+
+def quantile(values, q):
+    """
+    :param values: a non-empty list of numbers
+    :returns: the `q` quantile of `values`, interpolating between the closest ranks
+    """
+    values = sorted(values)
+    i = (len(values) - 1) * q
+    lo = int(math.floor(i))
+    hi = min(lo + 1, len(values) - 1)
+    return values[lo] + (values[hi] - values[lo]) * (i - lo)
+
+
+def linear_fit(xs, ys):
+    """
+    Least squares fit of y = intercept + slope * x.
+
+    :returns: (intercept, slope, r_squared), or None if `xs` are all the same
+    """
+    n = float(len(xs))
+    mean_x, mean_y = sum(xs) / n, sum(ys) / n
+    sxx = sum((x - mean_x) ** 2 for x in xs)
+    if sxx == 0:
+        return None
+    sxy = sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys))
+    syy = sum((y - mean_y) ** 2 for y in ys)
+    slope = sxy / sxx
+    r_squared = sxy ** 2 / (sxx * syy) if syy else 1.
+    return mean_y - slope * mean_x, slope, r_squared
+
+
+def input_size_kb(input_map):
+    """
+    :returns: the total size of the files in a Task's input_map, or None if any of them do not exist (yet)
+    """
+    paths = []
+    for v in input_map.values():
+        paths.extend(v if isinstance(v, (list, tuple)) else [v])
+    size = 0
+    for path in paths:
+        if not isinstance(path, basestring):
+            continue
+        try:
+            size += os.path.getsize(path)
+        except OSError:
+            return None
+    return size / 1024.
+
+
+class ResourcePredictor(object):
+    """
+    Predicts the resource requirements of new Tasks from the successful Tasks of Stages with the same name, in any
+    Workflow in the database.
+
+    Each requirement is the `quantile` of what past Tasks used, times `margin`.  If enough past Tasks recorded the
+    size of their input files and their usage is well explained by it, a linear fit on input size is used
+    instead, plus the `quantile` of its residuals.  Input sizes are recorded (in Task.extra) for Tasks whose input
+    files exist when they are added to a Workflow with a predictor, which is usually true for the first Stages of a
+    Workflow and when resuming.
+
+    Set :attr:`Workflow.resource_predictor` to have :meth:`Workflow.add_task` use the predictions for the
+    requirements that are not specified when the Task is added, or call :meth:`predict` to see its suggestions.
+
+    :param session: a sqlalchemy session
+    :param float quantile: which quantile of past usage to request.  Higher values mean fewer Tasks run out of
+        memory or time, at the cost of looser requests.
+    :param float margin: predictions are multiplied by this
+    :param int min_samples: Stages with fewer successful Tasks are not predicted
+    :param int max_samples: only the most recent successful Tasks of each Stage are used
+    :param float min_r_squared: the fit on input size must explain at least this much of the variance to be used
+    :param int time_unit: the number of seconds in a unit of time_req.  Cosmos' local DRM uses seconds, while
+        :func:`default_get_submit_args` passes time_req to LSF, which expects minutes.
+    """
+
+    def __init__(self, session, quantile=0.95, margin=1.2, min_samples=5, max_samples=1000, min_r_squared=0.5,
+                 time_unit=1):
+        self.session = session
+        self.quantile = quantile
+        self.margin = margin
+        self.min_samples = min_samples
+        self.max_samples = max_samples
+        self.min_r_squared = min_r_squared
+        self.time_unit = time_unit
+        # stage name -> list of (wall_time, cpu_time, max_rss_mem_kb, input_size_kb) of past Tasks
+        self._history = {}
+
+    def history(self, stage_name):
+        if stage_name not in self._history:
+            q = self.session.query(Task.wall_time, Task.cpu_time, Task.max_rss_mem_kb, Task.extra) \
+                .join(Task.stage) \
+                .filter(Stage.name == stage_name, Task.successful == True) \
+                .order_by(Task.id.desc()) \
+                .limit(self.max_samples)
+            self._history[stage_name] = [(w, c, m, (extra or {}).get('input_size_kb')) for w, c, m, extra in q]
+        return self._history[stage_name]
+
+    def _predict_usage(self, samples, size):
+        """
+        :param samples: (input_size_kb, usage) tuples
+        :returns: the predicted usage for a Task with input size `size`, or None
+        """
+        samples = [(x, y) for x, y in samples if y is not None]
+        if len(samples) < self.min_samples:
+            return None
+
+        sized = [(x, y) for x, y in samples if x is not None]
+        if size is not None and len(sized) >= self.min_samples:
+            fit = linear_fit(*zip(*sized))
+            if fit is not None and fit[2] >= self.min_r_squared and fit[1] > 0:
+                intercept, slope, _ = fit
+                residuals = [y - (intercept + slope * x) for x, y in sized]
+                return (intercept + slope * size + quantile(residuals, self.quantile)) * self.margin
+
+        return quantile([y for _, y in samples], self.quantile) * self.margin
+
+    def predict(self, stage_name, size_kb=None):
+        """
+        :param str stage_name: the name of the Stage the Task belongs to
+        :param float size_kb: the total size of the Task's input files, ie :func:`input_size_kb`
+        :returns: (dict) the predicted mem_req (in MB), time_req (in `time_unit`) and core_req of a Task.
+            Requirements that cannot be predicted are left out.
+        """
+        history = self.history(stage_name)
+        predicted = {}
+        mem_kb = self._predict_usage([(s, m) for _, _, m, s in history], size_kb)
+        if mem_kb is not None:
+            predicted['mem_req'] = int(math.ceil(max(mem_kb, 1024) / 1024.))
+        wall_time = self._predict_usage([(s, w) for w, _, _, s in history], size_kb)
+        if wall_time is not None:
+            predicted['time_req'] = int(math.ceil(max(wall_time, 1) / float(self.time_unit)))
+
+        # the number of cores a Task keeps busy on average
+        cores = [float(c) / w for w, c, _, _ in history if c is not None and w]
+        if len(cores) >= self.min_samples:
+            predicted['core_req'] = max(1, int(round(quantile(cores, self.quantile))))
+        return predicted
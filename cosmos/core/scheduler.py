@@ -0,0 +1,265 @@
+"""
+Incremental bookkeeping of which Tasks in a running Workflow are ready to be submitted.
+"""
+import heapq
+import itertools as it
+import time
+
+from cosmos import TaskStatus
+from cosmos.graph.dag import DAG
+
+
+class TaskQueue(object):
+    """
+    The Tasks of a Workflow that have not finished yet, and the dependencies between them.
+
+    Instead of scanning the whole DAG for Tasks without unfinished parents every time the Workflow polls, a count
+    of unfinished parents is kept for every Task (by a :class:`cosmos.graph.dag.DAG` of their ids).  When a Task
+    completes, the counts of its children are decremented and any child whose count reaches zero is pushed onto a
+    heap of ready Tasks.  Each scheduling pass therefore costs O(completed + submitted) rather than O(graph).
+
+    :param tasks: the Tasks to run.  They must have ids.
+    :param edges: (parent, child) tuples, or a DAG of Task ids.  Edges to or from a Task not in `tasks` are ignored,
+        which is how previously successful parents are skipped.
+    :param callable key: ready Tasks are popped in ascending order of key(task)
+    """
+
+    def __init__(self, tasks, edges, key=lambda t: t.id):
+        self.key = key
+        self._tasks = {t.id: t for t in tasks}
+        if isinstance(edges, DAG):
+            self._dag = edges.subgraph(self._tasks)
+        else:
+            self._dag = DAG(self._tasks, ((p.id, c.id) for p, c in edges))
+
+        self._counter = it.count()
+        self._heap = []
+        for task_id in self._dag.sources():
+            self._push(self._tasks[task_id])
+
+    @classmethod
+    def from_graph(cls, task_graph, exclude=(), **kwargs):
+        """
+        :param networkx.DiGraph task_graph: a DAG of Tasks, ie :meth:`Workflow.task_graph`
+        :param exclude: Tasks to leave out of the queue, such as ones that were already successful
+        """
+        exclude = set(exclude)
+        return cls((t for t in task_graph.nodes() if t not in exclude), task_graph.edges(), **kwargs)
+
+    def __len__(self):
+        return len(self._dag)
+
+    def __iter__(self):
+        return (self._tasks[task_id] for task_id in self._dag)
+
+    def __contains__(self, task):
+        return task.id in self._dag
+
+    def _push(self, task):
+        # the counter breaks ties so that Tasks themselves are never compared
+        heapq.heappush(self._heap, (self.key(task), next(self._counter), task))
+
+    def _prune(self):
+        """Discard heap entries for Tasks that were removed or are no longer waiting to be submitted"""
+        while self._heap:
+            task = self._heap[0][2]
+            if task.id in self._tasks and task.status == TaskStatus.no_attempt:
+                return
+            heapq.heappop(self._heap)
+
+    def has_ready(self):
+        """:returns: True if a Task is ready to be submitted"""
+        self._prune()
+        return len(self._heap) > 0
+
+    def pop_ready(self, predicate=None):
+        """
+        Pop ready Tasks in order of `key`.
+
+        :param callable predicate: If specified, stop at (and leave in the queue) the first ready Task for which
+            predicate(task) is False.
+        :returns: (list) the popped Tasks.  They stay in the queue until :meth:`complete` or :meth:`remove` is called.
+        """
+        popped = []
+        while self.has_ready():
+            task = self._heap[0][2]
+            if predicate is not None and not predicate(task):
+                break
+            heapq.heappop(self._heap)
+            popped.append(task)
+        return popped
+
+    def requeue(self, task):
+        """Make a Task that is being reattempted ready again"""
+        assert self._dag.in_degree(task.id) == 0, '%s has unfinished parents and cannot be requeued' % task
+        self._push(task)
+
+    def complete(self, task):
+        """
+        Remove a successful Task, releasing any children whose parents have now all completed.
+        """
+        for child_id in self._dag.remove(task.id):
+            self._push(self._tasks[child_id])
+        del self._tasks[task.id]
+
+    def remove(self, task):
+        """
+        Remove a Task that will not be run, for example because it failed, along with every Task that depends on it.
+
+        :returns: (set) the removed Tasks
+        """
+        return {self._tasks.pop(task_id) for task_id in self._dag.remove_with_descendants(task.id)}
+
+
+def critical_path_lengths(tasks, edges, weight):
+    """
+    The length of the longest path from each Task to the end of the DAG, which is how long the rest of the
+    Workflow would take after that Task starts if resources were unlimited.  Starting the Tasks with the longest
+    remaining path first keeps long chains of dependent Tasks from being left until the end of a run.
+
+    :param tasks: the Tasks of a DAG.  They must have ids.
+    :param edges: (parent, child) tuples, or a DAG of Task ids.  Edges to or from a Task not in `tasks` are ignored.
+    :param callable weight: weight(task) -> the (estimated) wall time of a Task
+    :returns: (dict) Task -> the sum of weight() over the heaviest path starting at that Task, including itself
+    """
+    by_id = {t.id: t for t in tasks}
+    dag = edges.subgraph(by_id) if isinstance(edges, DAG) else DAG(by_id, ((p.id, c.id) for p, c in edges))
+    # visit Tasks in reverse topological order, so children are visited before their parents
+    lengths = {}
+    for task_id in reversed(dag.topological_order()):
+        lengths[task_id] = weight(by_id[task_id]) + max([lengths[c] for c in dag.children(task_id)] or [0])
+    return {by_id[task_id]: length for task_id, length in lengths.iteritems()}
+
+
+class ResourceLimits(object):
+    """
+    Multi-resource admission control: decides which ready Tasks can run without the running Tasks using more than
+    the available cores, memory, or custom consumable resources (ie GPUs or scratch space).
+
+    Ready Tasks are packed first-fit in decreasing order of their dominant share (the largest fraction of any one
+    resource they need), so big Tasks are placed while there is room and small ones fill the gaps.  A Task that does
+    not fit is skipped rather than blocking the Tasks behind it.  To keep a stream of small Tasks from starving a
+    big one, once a Task has been passed over for `starvation_time` seconds the resources it needs are reserved for
+    it: other Tasks may only use what it leaves free until it runs.
+
+    :param dict capacity: resource name -> amount available.  'cores' and 'mem' are compared against
+        Task.core_req and Task.mem_req (in MB), any other name against Task.resource_req.  Resources with a capacity
+        of None are unlimited.
+    :param float starvation_time: how long a Task can be passed over before resources are reserved for it.  Reserving
+        leaves resources idle, so this trades throughput for fairness to big Tasks.
+    :param callable key: If specified, ready Tasks are packed in ascending order of key(task) rather than by dominant
+        share, which only breaks ties.  ex: a critical path priority.
+    """
+
+    def __init__(self, capacity, starvation_time=4 * 60 * 60, key=None):
+        self.capacity = {k: v for k, v in capacity.items() if v is not None}
+        self.starvation_time = starvation_time
+        self.key = key
+        # Task -> when it was first ready but passed over
+        self._skipped_since = {}
+        #: the ready Tasks :meth:`admit` passed over, which are still waiting to run
+        self.waiting = []
+        # the number of running Tasks after the last packing, and when a waiting Task starts starving
+        self._num_running = 0
+        self._next_starving = float('inf')
+
+    def __repr__(self):
+        return ', '.join('%s=%s' % kv for kv in sorted(self.capacity.items()))
+
+    def demand(self, task):
+        """:returns: (dict) resource name -> the amount `task` needs, for each limited resource"""
+        d = {}
+        for r in self.capacity:
+            if r == 'cores':
+                d[r] = task.core_req or 0
+            elif r == 'mem':
+                d[r] = task.mem_req or 0
+            else:
+                d[r] = (task.resource_req or {}).get(r, 0)
+        return d
+
+    def check(self, task):
+        """
+        :raises ValueError: if `task` needs more of a resource than is available, and so could never run
+        """
+        for r, amount in self.demand(task).items():
+            if amount > self.capacity[r]:
+                raise ValueError('%s requires more %s (%s) than is available (%s)' % (task, r, amount, self.capacity[r]))
+
+    def dominant_share(self, task):
+        return max([float(amount) / self.capacity[r] if self.capacity[r] else 0
+                    for r, amount in self.demand(task).items()] or [0])
+
+    def select(self, ready_tasks, running_tasks, now=None):
+        """
+        :param ready_tasks: Tasks that are ready to run
+        :param running_tasks: Tasks that are using resources
+        :param float now: the current time, defaults to time.time()
+        :returns: (list) the Tasks in `ready_tasks` to run now
+        """
+        if now is None:
+            now = time.time()
+        free = dict(self.capacity)
+        for task in running_tasks:
+            for r, amount in self.demand(task).items():
+                free[r] -= amount
+
+        def fits(demand):
+            return all(amount <= free[r] for r, amount in demand.items())
+
+        def take(demand):
+            for r, amount in demand.items():
+                free[r] -= amount
+
+        def is_starving(task):
+            return now - self._skipped_since.get(task, now) >= self.starvation_time
+
+        starving = sorted(filter(is_starving, ready_tasks), key=self._skipped_since.get)
+        others = sorted((t for t in ready_tasks if not is_starving(t)), key=self.dominant_share, reverse=True)
+        if self.key is not None:
+            # sorting is stable, so dominant share still breaks ties
+            others.sort(key=self.key)
+
+        selected = []
+        reserved = False
+        for task in starving + others:
+            demand = self.demand(task)
+            if fits(demand):
+                take(demand)
+                selected.append(task)
+            elif task in starving and not reserved:
+                # hold back what this Task needs, so that it runs as soon as enough running Tasks finish
+                take(demand)
+                reserved = True
+
+        # only Tasks that are still ready are kept, so Tasks that failed or were removed from the queue are forgotten
+        selected_set = set(selected)
+        self._skipped_since = {t: self._skipped_since.get(t, now) for t in ready_tasks if t not in selected_set}
+        return selected
+
+    def admit(self, newly_ready, running_tasks, now=None):
+        """
+        :meth:`select` for a run loop.  The Tasks that are passed over wait in :attr:`waiting` rather than being
+        requeued, so each call is only given the Tasks that became ready since the last one.  Tasks are only packed
+        again when some became ready, a running Task finished or a waiting Task starts starving, so the calls in
+        between cost O(1) rather than O(ready * log(ready)).
+
+        :param newly_ready: Tasks that became ready since the last call
+        :param running_tasks: Tasks that are using resources
+        :param float now: the current time, defaults to time.time()
+        :returns: (list) the Tasks to run now
+        """
+        if now is None:
+            now = time.time()
+        if not newly_ready and len(running_tasks) == self._num_running and now < self._next_starving:
+            return []
+
+        # Tasks that are no longer waiting to be submitted, ie they were killed, are dropped
+        ready = [t for t in self.waiting if t.status == TaskStatus.no_attempt] + list(newly_ready)
+        selected = self.select(ready, running_tasks, now)
+        selected_set = set(selected)
+        self.waiting = [t for t in ready if t not in selected_set]
+        self._num_running = len(running_tasks) + len(selected)
+        self._next_starving = min([since + self.starvation_time for since in self._skipped_since.values()
+                                   if since + self.starvation_time > now] or [float('inf')])
+        return selected
@@ -0,0 +1,175 @@
+"""
+A compact DAG of integer ids, for the graph operations Cosmos needs on Workflows with millions of Tasks.
+"""
+from array import array
+from collections import deque
+
+import networkx as nx
+
+
+def _csr(num_nodes, codes):
+    """
+    :param codes: source * num_nodes + target for each (source index, target index) pair, sorted
+    :returns: (offsets, targets) where the targets of node i are targets[offsets[i]:offsets[i + 1]]
+    """
+    offsets = array('l', [0]) * (num_nodes + 1)
+    for code in codes:
+        offsets[code // num_nodes + 1] += 1
+    for i in xrange(num_nodes):
+        offsets[i + 1] += offsets[i]
+    targets = array('l', (code % num_nodes for code in codes))
+    return offsets, targets
+
+
+class DAG(object):
+    """
+    A directed acyclic graph of integer node ids (ie Task.id), stored as compressed sparse row arrays of children and
+    parents rather than as a networkx graph of objects, which needs several dicts per node and one per edge.  Nodes
+    can be removed, which only marks them, and the number of remaining parents of every node is kept up to date.
+
+    :param nodes: the node ids
+    :param edges: (parent id, child id) tuples.  Edges to or from a node not in `nodes` are ignored.
+    """
+
+    def __init__(self, nodes, edges):
+        self.ids = array('l', sorted(set(nodes)))
+        self._index = {id_: i for i, id_ in enumerate(self.ids)}
+        index = self._index
+        n = len(self.ids)
+        # edges are encoded as single ints, which are much smaller and faster to sort than tuples
+        codes = sorted(set(index[p] * n + index[c] for p, c in edges if p in index and c in index))
+        self._child_offsets, self._children = _csr(n, codes)
+        codes = sorted((code % n) * n + code // n for code in codes)
+        self._parent_offsets, self._parents = _csr(n, codes)
+        del codes
+
+        self._in_degree = array('l', (self._parent_offsets[i + 1] - self._parent_offsets[i]
+                                      for i in xrange(len(self.ids))))
+        self._removed = bytearray(len(self.ids))
+        self._num_removed = 0
+
+    def __len__(self):
+        return len(self.ids) - self._num_removed
+
+    def __contains__(self, node):
+        i = self._index.get(node)
+        return i is not None and not self._removed[i]
+
+    def __iter__(self):
+        removed = self._removed
+        return (id_ for i, id_ in enumerate(self.ids) if not removed[i])
+
+    def _targets(self, offsets, targets, i):
+        removed = self._removed
+        return [t for t in targets[offsets[i]:offsets[i + 1]] if not removed[t]]
+
+    def children(self, node):
+        """:returns: (list) the ids of the remaining children of `node`"""
+        ids = self.ids
+        return [ids[c] for c in self._targets(self._child_offsets, self._children, self._index[node])]
+
+    def parents(self, node):
+        """:returns: (list) the ids of the remaining parents of `node`"""
+        ids = self.ids
+        return [ids[p] for p in self._targets(self._parent_offsets, self._parents, self._index[node])]
+
+    def in_degree(self, node):
+        """:returns: (int) the number of remaining parents of `node`"""
+        return self._in_degree[self._index[node]]
+
+    def sources(self):
+        """:returns: (list) the ids of the remaining nodes without remaining parents"""
+        in_degree, removed = self._in_degree, self._removed
+        return [id_ for i, id_ in enumerate(self.ids) if in_degree[i] == 0 and not removed[i]]
+
+    def edges(self):
+        """:returns: (iterator) (parent id, child id) tuples between remaining nodes"""
+        ids, offsets = self.ids, self._child_offsets
+        for i in xrange(len(ids)):
+            if not self._removed[i]:
+                for c in self._targets(offsets, self._children, i):
+                    yield ids[i], ids[c]
+
+    def _descendant_indexes(self, i):
+        removed, offsets, children = self._removed, self._child_offsets, self._children
+        seen = set()
+        stack = [i]
+        while stack:
+            j = stack.pop()
+            for c in children[offsets[j]:offsets[j + 1]]:
+                if c not in seen and not removed[c]:
+                    seen.add(c)
+                    stack.append(c)
+        return seen
+
+    def descendants(self, node):
+        """:returns: (set) the ids of the remaining nodes reachable from `node`, not including `node`"""
+        ids = self.ids
+        return set(ids[i] for i in self._descendant_indexes(self._index[node]))
+
+    def _remove(self, i):
+        self._removed[i] = 1
+        self._num_removed += 1
+        in_degree, offsets = self._in_degree, self._child_offsets
+        for c in self._children[offsets[i]:offsets[i + 1]]:
+            in_degree[c] -= 1
+
+    def remove(self, node):
+        """
+        Remove `node`.
+
+        :returns: (list) the ids of its children that no longer have any parents
+        """
+        i = self._index[node]
+        assert not self._removed[i], '%s was already removed' % node
+        self._remove(i)
+        ids, in_degree, removed = self.ids, self._in_degree, self._removed
+        return [ids[c] for c in self._targets(self._child_offsets, self._children, i) if in_degree[c] == 0]
+
+    def remove_with_descendants(self, node):
+        """
+        Remove `node` and every node reachable from it, in time proportional to the number of nodes removed and
+        their edges.
+
+        :returns: (list) the ids of the removed nodes
+        """
+        i = self._index[node]
+        assert not self._removed[i], '%s was already removed' % node
+        indexes = [i] + list(self._descendant_indexes(i))
+        for j in indexes:
+            self._remove(j)
+        ids = self.ids
+        return [ids[j] for j in indexes]
+
+    def subgraph(self, nodes):
+        """:returns: (DAG) a new DAG of the remaining `nodes` and the edges between them"""
+        nodes = [n for n in nodes if n in self]
+        return DAG(nodes, self.edges())
+
+    def topological_order(self):
+        """:returns: (list) the ids of the remaining nodes, parents before their children"""
+        in_degree = array('l', self._in_degree)
+        removed, offsets, children = self._removed, self._child_offsets, self._children
+        queue = deque(i for i in xrange(len(self.ids)) if in_degree[i] == 0 and not removed[i])
+        order = []
+        while queue:
+            i = queue.popleft()
+            order.append(self.ids[i])
+            for c in children[offsets[i]:offsets[i + 1]]:
+                if not removed[c]:
+                    in_degree[c] -= 1
+                    if in_degree[c] == 0:
+                        queue.append(c)
+        assert len(order) == len(self), 'the graph has a cycle'
+        return order
+
+    def to_networkx(self, nodes=None):
+        """
+        :param dict nodes: id -> the object to use as the node in the networkx graph, ie a Task.  Defaults to the ids.
+        :returns: (networkx.DiGraph) the remaining nodes and edges, for drawing and analysis
+        """
+        get = nodes.__getitem__ if nodes is not None else lambda id_: id_
+        g = nx.DiGraph()
+        g.add_nodes_from(get(n) for n in self)
+        g.add_edges_from((get(p), get(c)) for p, c in self.edges())
+        return g
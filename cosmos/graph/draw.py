@@ -1,5 +1,7 @@
 from ..util.helpers import groupby2
 from .. import TaskStatus
+from ..models.Stage import Stage
+from ..models.Task import Task
 
 try:
     import pygraphviz as _
@@ -15,10 +17,15 @@ def draw_task_graph(task_graph, save_to=None, format='svg', url=False):
     return a.draw(path=save_to, format=format)
 
 
-def taskgraph_to_agraph(task_graph, url=True):
-    """
-    Converts a networkx graph into a pygraphviz Agraph
-    """
+task_status2color = {TaskStatus.no_attempt: 'black',
+                     TaskStatus.waiting: 'gold1',
+                     TaskStatus.submitted: 'navy',
+                     TaskStatus.successful: 'darkgreen',
+                     TaskStatus.failed: 'darkred',
+                     TaskStatus.killed: 'darkred'}
+
+
+def _task_agraph():
     import pygraphviz as pgv
 
     agraph = pgv.AGraph(strict=False, directed=True, fontname="Courier")
@@ -27,27 +34,61 @@ def taskgraph_to_agraph(task_graph, url=True):
     agraph.node_attr['fontsize'] = 8
     agraph.graph_attr['fontsize'] = 8
     agraph.edge_attr['fontcolor'] = '#586e75'
+    return agraph
+
+
+def _add_task_node(graph, task, url):
+    def truncate_val(kv):
+        v = "{0}".format(kv[1])
+        v = v if len(v) < 10 else v[1:8] + '..'
+        return "{0}: {1}".format(kv[0], v)
+
+    label = " \\n".join(map(truncate_val, task.params.items()))
+    graph.add_node(task, label=label, URL=task.url if url else '#', target="_blank",
+                   color=task_status2color.get(task.status, 'black'))
+
 
+def taskgraph_to_agraph(task_graph, url=True):
+    """
+    Converts a networkx graph into a pygraphviz Agraph
+    """
+    agraph = _task_agraph()
     agraph.add_edges_from(task_graph.edges())
     for stage, tasks in groupby2(task_graph.nodes(), lambda x: x.stage):
         sg = agraph.add_subgraph(name="cluster_{0}".format(stage), label=str(stage), color='grey', style='dotted')
         for task in tasks:
-            def truncate_val(kv):
-                v = "{0}".format(kv[1])
-                v = v if len(v) < 10 else v[1:8] + '..'
-                return "{0}: {1}".format(kv[0], v)
-
-            label = " \\n".join(map(truncate_val, task.params.items()))
-            status2color = {TaskStatus.no_attempt: 'black',
-                            TaskStatus.waiting: 'gold1',
-                            TaskStatus.submitted: 'navy',
-                            TaskStatus.successful: 'darkgreen',
-                            TaskStatus.failed: 'darkred',
-                            TaskStatus.killed: 'darkred'}
-
-            sg.add_node(task, label=label, URL=task.url if url else '#', target="_blank",
-                        color=status2color.get(task.status, 'black'))
+            _add_task_node(sg, task, url)
+
+    return agraph
+
+
+def draw_stage_subgraph(graph, stage, save_to=None, format='svg', url=None):
+    a = stage_subgraph_to_agraph(graph, stage, url=url)
+    a.layout('dot')
+    return a.draw(path=save_to, format=format)
+
 
+def stage_subgraph_to_agraph(graph, stage, url=None):
+    """
+    Converts a networkx graph of the Tasks of one Stage, and of the other Stages their parents and children are in,
+    into a pygraphviz Agraph.  The other Stages are drawn as one node each, so only the Tasks of `stage` are laid out.
+    Any other nodes, ie a note of Tasks that were left out, are drawn as plain text.
+
+    :param stage: the Stage whose Tasks are drawn
+    :param url: a function of a Stage that returns the url its node links to, ie to its own subgraph.  Tasks link to
+        their pages if it is set.
+    """
+    agraph = _task_agraph()
+    agraph.add_edges_from(graph.edges())
+    sg = agraph.add_subgraph(name="cluster_{0}".format(stage), label=str(stage), color='grey', style='dotted')
+    for node in graph.nodes():
+        if isinstance(node, Task):
+            _add_task_node(sg, node, url is not None)
+        elif isinstance(node, Stage):
+            agraph.add_node(node, label=node.name, shape='box3d', URL=url(node) if url else '#',
+                            color=stage_status2color.get(node.status, 'black'))
+        else:
+            agraph.add_node(node, shape='plaintext')
     return agraph
 
 
@@ -63,6 +104,11 @@ def taskgraph_to_image(taskgraph, path=None, url=False):
 from .. import RelationshipType
 from ..models.Stage import StageStatus
 
+stage_status2color = {StageStatus.no_attempt: 'black',
+                      StageStatus.running: 'navy',
+                      StageStatus.successful: 'darkgreen',
+                      StageStatus.failed: 'darkred'}
+
 
 def draw_stage_graph(stage_graph, save_to=None, url=False, format='svg'):
     g = stagegraph_to_agraph(stage_graph, url=url)
@@ -82,17 +128,13 @@ def stagegraph_to_agraph(stage_graph, url=True):
     agraph.node_attr['fontsize'] = 8
     agraph.edge_attr['fontcolor'] = '#586e75'
 
-    status2color = {StageStatus.no_attempt: 'black',
-                    StageStatus.running: 'navy',
-                    StageStatus.successful: 'darkgreen',
-                    StageStatus.failed: 'darkred'}
     rel2abbrev = {RelationshipType.one2one: 'o2o',
                   RelationshipType.one2many: 'o2m',
                   RelationshipType.many2one: 'm2o',
                   RelationshipType.many2many: 'm2m'}
 
     for stage in stage_graph.nodes():
-        agraph.add_node(stage, color=status2color.get(getattr(stage, 'status', None), 'black'),
+        agraph.add_node(stage, color=stage_status2color.get(getattr(stage, 'status', None), 'black'),
                         URL=stage.url if url else '', label=stage.label)
 
     for u, v in stage_graph.edges():
@@ -105,3 +147,33 @@ def stagegraph_to_agraph(stage_graph, url=True):
             agraph.add_edge(u, v, label=rel2abbrev.get(v.relationship_type, ''), arrowhead='vee')
 
     return agraph
+
+
+def draw_stage_summary_graph(stage_graph, stage_stats, save_to=None, format='svg', url=None):
+    g = stage_summary_to_agraph(stage_graph, stage_stats, url=url)
+    g.layout(prog="dot")
+    return g.draw(path=save_to, format=format)
+
+
+def stage_summary_to_agraph(stage_graph, stage_stats, url=None):
+    """
+    Converts a graph of Stages into a pygraphviz Agraph with one node per Stage, labelled with how many of its Tasks
+    are successful, running and failed.  It takes as long to lay out however many Tasks there are.
+
+    :param stage_stats: Stage id -> :class:`cosmos.web.metrics.StageStats`
+    :param url: a function of a Stage that returns the url its node links to, ie to its Tasks' subgraph
+    """
+    import pygraphviz as pgv
+
+    agraph = pgv.AGraph(strict=False, directed=True, fontname="Courier", fontsize=11)
+    agraph.node_attr['fontname'] = "Courier"
+    agraph.node_attr['fontsize'] = 8
+
+    for stage in stage_graph.nodes():
+        stats = stage_stats[stage.id]
+        label = '%s\\n%s/%s successful\\n%s running, %s failed' % (
+            stage.name, stats.num_successful, stats.num_tasks, stats.counts[TaskStatus.submitted], stats.num_failed)
+        agraph.add_node(stage, label=label, shape='box3d', URL=url(stage) if url else '#',
+                        color=stage_status2color.get(stage.status, 'black'))
+    agraph.add_edges_from(stage_graph.edges(), arrowhead='vee')
+    return agraph
@@ -1,5 +1,9 @@
+import errno
 import os
+import select
 import stat
+import time
+from multiprocessing.pool import ThreadPool
 
 from cosmos.util.helpers import mkdir
 from cosmos.job.drm.drm_local import DRM_Local
@@ -7,14 +11,26 @@ from cosmos.job.drm.drm_lsf import DRM_LSF
 from cosmos.job.drm.drm_ge import DRM_GE
 from cosmos.job.drm.drm_drmaa import DRM_DRMAA
 from cosmos.job.drm.drm_slurm import DRM_SLURM
-from cosmos import TaskStatus, StageStatus, NOOP
+from cosmos.job.drm.DRM_Base import JobSpec
+from cosmos.job.poller import ConcurrentPoller
+from cosmos.job.poll_policy import PollPolicy, PollMetrics
+from cosmos.util.timing import NullTimings
+from cosmos import TaskStatus, StageStatus, NOOP, signal_drm_polled
 import itertools as it
-from operator import attrgetter
 from cosmos.models.Workflow import default_task_log_output_dir
 
 
 class JobManager(object):
-    def __init__(self, get_submit_args, log_out_dir_func=default_task_log_output_dir, cmd_wrapper=None):
+    def __init__(self, get_submit_args, log_out_dir_func=default_task_log_output_dir, cmd_wrapper=None,
+                 drm_options=None, concurrent_polling=False, poll_policy=None):
+        """
+        :param dict drm_options: Overrides of DRM class attributes, keyed by DRM name.
+            ex: ``{'slurm': {'submit_concurrency': 20}}``
+        :param bool concurrent_polling: If True, poll each DRM from its own thread with a
+            :class:`cosmos.job.poller.ConcurrentPoller`, rather than one after another.
+        :param poll_policy: a :class:`cosmos.job.poll_policy.PollPolicy`, which decides when each DRM is polled again.
+            Defaults to every ``DRM.poll_interval`` seconds.
+        """
         self.drms = dict()
         self.drms['local'] = DRM_Local(self)  # always support local workflow
         self.drms['lsf'] = DRM_LSF(self)
@@ -22,11 +38,25 @@ class JobManager(object):
         self.drms['drmaa'] = DRM_DRMAA(self)
         self.drms['slurm'] = DRM_SLURM(self)
 
+        for drm_name, options in (drm_options or {}).items():
+            drm = self.get_drm(drm_name)
+            for k, v in options.items():
+                if not hasattr(drm, k):
+                    raise AttributeError('%s has no option `%s`' % (drm.__class__.__name__, k))
+                setattr(drm, k, v)
+
         # self.local_drm = DRM_Local(self)
         self.running_tasks = []
         self.get_submit_args = get_submit_args
         self.cmd_wrapper = cmd_wrapper
         self.log_out_dir_func = log_out_dir_func
+        # DRM name -> when it is next due to be polled, as decided by the poll_policy
+        self._next_poll = dict()
+        self.poller = ConcurrentPoller() if concurrent_polling else None
+        self.poll_policy = poll_policy or PollPolicy()
+        self.poll_metrics = PollMetrics()
+        # the PhaseTimings of the Workflow being run, see Workflow.run(timings=True)
+        self.timings = NullTimings()
 
     def get_drm(self, drm_name):
         """This allows support for drmaa:ge type syntax"""
@@ -47,49 +77,116 @@ class JobManager(object):
         else:
             fxn = task.cmd_fxn
 
-        command = fxn(**task.params)
+        with self.timings.phase('call_cmd_fxn'):
+            command = fxn(**task.params)
 
         return command
 
-    def submit_task(self, task, command):
+    def _prepare_submission(self, task, command):
+        """
+        Set the attributes of a Task that are needed to submit it.
+
+        :returns: a JobSpec for the Task, or None if the Task is a NOOP (and thus already submitted)
+        """
         task.log_dir = self.log_out_dir_func(task)
-        for p in [task.output_stdout_path, task.output_stderr_path, task.output_command_script_path]:
-            if os.path.exists(p):
-                os.unlink(p)
 
         if command is NOOP:
             task.NOOP = True
 
         if task.NOOP:
+            _unlink_outputs(JobSpec.from_task(task))
             task.status = TaskStatus.submitted
-            return
+            return None
         else:
-            mkdir(task.log_dir)
-
-            _create_command_sh(task, command)
             task.drm_native_specification = self.get_submit_args(task)
             assert task.drm is not None, 'task has no drm set'
+            return JobSpec.from_task(task)
+
+    def submit_task(self, task, command):
+        spec = self._prepare_submission(task, command)
+        if spec is not None:
+            with self.timings.phase('create_command_sh'):
+                _create_command_sh(spec, command)
+            drm = self.get_drm(task.drm)
+            with self.timings.phase('%s.submit' % drm.name), drm.lock:
+                drm.submit_job(task)
+
+    def _submit_task_batch(self, drm, tasks, commands):
+        """
+        Write command scripts and submit jobs from a pool of `drm.submit_concurrency` threads.  Anything touching the
+        database happens in this thread, before and after the pool runs.
+
+        If `drm.array_jobs` is set, Tasks of the same Stage with the same native specification (ignoring the job
+        name) are submitted together as array jobs.
+        """
+        to_submit = []
+        for task, command in zip(tasks, commands):
+            spec = self._prepare_submission(task, command)
+            if spec is not None:
+                to_submit.append((task, spec, command))
+        if not to_submit:
+            return
+
+        if drm.array_jobs:
+            jobs = []
+            def f(task_spec_command):
+                task, spec, _ = task_spec_command
+                return task.stage.name, drm.array_native_specification(spec.native_specification)
+
+            for (stage_name, _), group in it.groupby(sorted(to_submit, key=f), f):
+                group = list(group)
+                for i in range(0, len(group), drm.max_array_size):
+                    jobs.append((stage_name, group[i:i + drm.max_array_size]))
+        else:
+            jobs = [(None, [task_spec_command]) for task_spec_command in to_submit]
+
+        def render_and_submit(job):
+            name, job_tasks = job
+            for _, spec, command in job_tasks:
+                with self.timings.phase('create_command_sh'):
+                    _create_command_sh(spec, command)
+            specs = [spec for _, spec, _ in job_tasks]
+            with self.timings.phase('%s.submit' % drm.name):
+                if len(specs) == 1:
+                    return [drm.try_submit_spec(specs[0])]
+                else:
+                    return drm.try_submit_array_spec(specs, name)
 
-            self.get_drm(task.drm).submit_job(task)
+        pool = ThreadPool(min(drm.submit_concurrency, len(jobs)))
+        try:
+            results = pool.map(render_and_submit, jobs)
+        finally:
+            pool.close()
+            pool.join()
+
+        with drm.lock:
+            for (_, job_tasks), job_results in zip(jobs, results):
+                for (task, _, _), (drm_jobID, error) in zip(job_tasks, job_results):
+                    drm.set_submission_result(task, drm_jobID, error)
 
     def run_tasks(self, tasks):
         self.running_tasks += tasks
 
-        # Run the cmd_fxns in parallel, but do not submit any jobs they return
-        # Note we use the cosmos_app thread_pool here so we don't have to setup/teardown threads (or their sqlalchemy sessions)
-        # commands = self.cosmos_app.thread_pool.map(self.call_cmd_fxn, tasks)
+        # Call the cmd_fxns in this thread, since they (and get_submit_args) may use the database
         commands = map(self.call_cmd_fxn, tasks)
-        # commands = self.cosmos_app.futures_executor.map(self.call_cmd_fxn, tasks)
 
-        # Submit the jobs in serial
-        # TODO parallelize this for speed.  Means having all ORM stuff outside Job Submission.
-        map(self.submit_task, tasks, commands)
+        f = lambda task_and_command: task_and_command[0].drm
+        for drm_name, group in it.groupby(sorted(zip(tasks, commands), key=f), f):
+            group_tasks, group_commands = zip(*group)
+            drm = self.get_drm(drm_name)
+            if drm.submit_concurrency > 1 or drm.array_jobs:
+                self._submit_task_batch(drm, group_tasks, group_commands)
+            else:
+                map(self.submit_task, group_tasks, group_commands)
 
     def terminate(self):
+        if self.poller is not None:
+            self.poller.stop()
         get_drm = lambda t: t.drm
         for drm, tasks in it.groupby(sorted(self.running_tasks, key=get_drm), get_drm):
             target_tasks = list([t for t in tasks if t.drm_jobID is not None])
-            self.get_drm(drm).kill_tasks(target_tasks)
+            with self.timings.phase('%s.kill' % drm), self.get_drm(drm).lock:
+                self.get_drm(drm).kill_tasks(target_tasks)
             for task in target_tasks:
                 task.status = TaskStatus.killed
                 task.stage.status = StageStatus.killed
@@ -104,27 +201,109 @@ class JobManager(object):
                 self.running_tasks.remove(task)
                 yield task
 
-        # For the rest, ask its DRM if it is done
-        f = attrgetter('drm')
-        for drm, tasks in it.groupby(sorted(self.running_tasks, key=f), f):
-            for task, job_info_dict in self.get_drm(drm).filter_is_done(list(tasks)):
-                self.running_tasks.remove(task)
-                for k, v in job_info_dict.items():
-                    setattr(task, k, v)
-                yield task
+        if self.poller is not None:
+            for drm, done, seconds in self.poller.finished_polls():
+                # Tasks may have been killed while the poll was running
+                done = [(task, job_info_dict) for task, job_info_dict in done if task in self.running_tasks]
+                self._schedule_next_poll(drm, done, seconds)
+                for task, job_info_dict in done:
+                    yield self._finish(task, job_info_dict)
+
+        # For the rest, ask the DRMs that are due to be polled which are done
+        now = time.time()
+        for drm, tasks in self._running_tasks_by_drm():
+            if now < self._next_poll.get(drm.name, 0) or self.poller is not None and self.poller.is_polling(drm):
+                continue
+            if self.poller is not None:
+                self.poller.poll(drm, tasks)
+            else:
+                start = time.time()
+                done = list(drm.filter_is_done(tasks))
+                self._schedule_next_poll(drm, done, time.time() - start)
+                for task, job_info_dict in done:
+                    yield self._finish(task, job_info_dict)
+
+    def _schedule_next_poll(self, drm, done, seconds):
+        """Record a poll of `drm`, which took `seconds` and found the Tasks in `done` finished"""
+        self.poll_metrics.record(drm.name, len(done), seconds)
+        self.timings.record('%s.poll' % drm.name, seconds)
+        finished = set(task for task, _ in done)
+        running = [task for task in self.running_tasks if task not in finished and self.get_drm(task.drm) is drm]
+        self._next_poll[drm.name] = time.time() + self.poll_policy.next_interval(drm, running, len(done))
+        signal_drm_polled.send(self, drm=drm.name, seconds=seconds, finished=len(done), running=len(running))
+
+    def _finish(self, task, job_info_dict):
+        self.running_tasks.remove(task)
+        for k, v in job_info_dict.items():
+            setattr(task, k, v)
+        return task
+
+    def _running_tasks_by_drm(self):
+        """:returns: (list) (DRM, [Task, ...]) for every DRM with running Tasks"""
+        f = lambda task: self.get_drm(task.drm).name
+        return [(self.get_drm(drm_name), list(tasks))
+                for drm_name, tasks in it.groupby(sorted(self.running_tasks, key=f), f)]
+
+    def wait(self, timeout):
+        """
+        Sleep for `timeout` seconds, or until a DRM signals that one of its jobs may have finished, or a signal is
+        caught.
+        """
+        drms = {drm.wakeup_fd: drm for drm in set(self.get_drm(t.drm) for t in self.running_tasks)
+                if drm.wakeup_fd is not None}
+        fds = list(drms)
+        if self.poller is not None:
+            fds.append(self.poller.wakeup_fd)
+        if not fds:
+            time.sleep(timeout)
+            return
+
+        try:
+            readable, _, _ = select.select(fds, [], [], timeout)
+        except select.error as e:
+            if e.args[0] != errno.EINTR:
+                raise
+            return
+
+        for fd in readable:
+            if fd in drms:
+                # the DRM is polled right away, rather than when its poll_interval is up
+                self._next_poll[drms[fd].name] = 0
+            # drain the pipe, there may have been several wakeups
+            try:
+                while os.read(fd, 4096):
+                    pass
+            except OSError as e:
+                if e.errno != errno.EAGAIN:
+                    raise
 
     @property
     def poll_interval(self):
-        if not self.running_tasks:
-            return 0
-        return max(self.get_drm(d).poll_interval for d in
-                   set(t.drm for t in self.running_tasks))
+        """
+        :returns: (float) the seconds until the next DRM with running Tasks is due to be polled.  DRMs that are being
+            polled by the ConcurrentPoller wake the JobManager up when they finish.
+        """
+        drms = [drm for drm, _ in self._running_tasks_by_drm()
+                if self.poller is None or not self.poller.is_polling(drm)]
+        if not drms:
+            return max([drm.poll_interval for drm, _ in self._running_tasks_by_drm()] or [0])
+        return max(0, min(self._next_poll.get(drm.name, 0) for drm in drms) - time.time())
+
 
+def _unlink_outputs(spec):
+    """Remove the output of a previous attempt"""
+    for p in [spec.stdout_path, spec.stderr_path, spec.command_script_path]:
+        if os.path.exists(p):
+            os.unlink(p)
 
-def _create_command_sh(task, command):
+
+def _create_command_sh(spec, command):
     """Create a sh script that will execute a command"""
-    with open(task.output_command_script_path, 'w') as f:
+    _unlink_outputs(spec)
+    mkdir(os.path.dirname(spec.command_script_path))
+
+    with open(spec.command_script_path, 'w') as f:
         f.write(command)
 
-    st = os.stat(task.output_command_script_path)
-    os.chmod(task.output_command_script_path, st.st_mode | stat.S_IEXEC)
\ No newline at end of file
+    st = os.stat(spec.command_script_path)
+    os.chmod(spec.command_script_path, st.st_mode | stat.S_IEXEC)
@@ -1,18 +1,186 @@
+import re
+import threading
+from collections import namedtuple
+
+from cosmos import TaskStatus
+from cosmos.job.drm.queue_cache import QueueCache, epoch_seconds
+from cosmos.util.timing import NullTimings
+
+_no_timings = NullTimings()
+
+
+class SubmissionError(Exception):
+    """Raised by :meth:`DRM.submit_spec` when a DRM fails to accept a job"""
+    pass
+
+
+class JobSpec(namedtuple('JobSpec', 'command_script_path stdout_path stderr_path native_specification')):
+    """
+    Everything a DRM needs to submit a Task, detached from the database so that it can be used from another thread.
+    """
+
+    @classmethod
+    def from_task(cls, task):
+        return cls(task.output_command_script_path, task.output_stdout_path, task.output_stderr_path,
+                   task.drm_native_specification)
+
+
+class TaskSnapshot(object):
+    """
+    The attributes of a submitted Task that DRMs read when polling it, copied so that :meth:`DRM.filter_is_done` can
+    be called from another thread (see :class:`cosmos.job.poller.ConcurrentPoller`) without touching the database.
+    """
+
+    def __init__(self, task):
+        self.id = task.id
+        self.uid = task.uid
+        self.drm = task.drm
+        self.drm_jobID = task.drm_jobID
+        self.status = task.status
+        self.time_req = task.time_req
+        self.submitted_on = task.submitted_on
+        self.profile_fields = task.profile_fields
+        self.output_command_script_path = task.output_command_script_path
+        self.output_stdout_path = task.output_stdout_path
+        self.output_stderr_path = task.output_stderr_path
+        self.output_profile_path = task.output_profile_path
+        self.log = task.log
+        self._repr = repr(task)
+
+    @property
+    def workflow(self):
+        # DRMs only use task.workflow for its log
+        return self
+
+    def __repr__(self):
+        return self._repr
+
+
 class DRM(object):
     "DRM base class"
     name = None
     poll_interval = 1
+    # The maximum number of jobs JobManager.run_tasks submits to this DRM at once.  DRMs which set this above 1
+    # must implement submit_spec().
+    submit_concurrency = 1
+    # If True, JobManager.run_tasks submits Tasks of the same Stage which share a native specification as a single
+    # array job of at most max_array_size elements.  DRMs which support this must implement submit_array_spec().
+    array_jobs = False
+    max_array_size = 1000
+    # Matches the option of a native specification which names a job.  It is removed when grouping Tasks into
+    # array jobs, since the default get_submit_args() gives every Task a different job name.
+    job_name_re = None
+    # If not None, a file descriptor which becomes readable when a job may have finished.  JobManager.wait() returns
+    # as soon as it does, rather than sleeping for the whole poll_interval.
+    wakeup_fd = None
+    # If above 0, the DRM's queue listing (ie squeue) is shared by every Cosmos process and web dashboard of the user
+    # on this host, through a file in queue_cache_dir, and fetched at most once every queue_cache_ttl seconds.  See
+    # cosmos.job.drm.queue_cache.QueueCache.
+    queue_cache_ttl = 0
+    queue_cache_dir = None
 
     def __init__(self, jobmanager):
         self.jobmanager = jobmanager
+        self._queue_cache = None
+        # Held while the DRM is polled, submitted to or killing jobs.  A ConcurrentPoller polls from another thread,
+        # and DRMs keep state about their jobs (ie DRM_Local.procs) without locking it themselves.
+        self.lock = threading.RLock()
+
+    def queue_jobs(self, fetch, tasks):
+        """
+        :param fetch: a callable() -> the DRM's queue listing, a dict of job id -> the job's fields
+        :param tasks: the Tasks whose jobs are needed
+        :returns: (dict) fetch(), or the jobs of `tasks` in a listing from the host-wide cache if queue_cache_ttl is
+            set
+        """
+        def timed_fetch():
+            with self.timed('queue'):
+                return fetch()
+
+        if not self.queue_cache_ttl:
+            return timed_fetch()
+        if self._queue_cache is None:
+            self._queue_cache = QueueCache(self.name, self.queue_cache_ttl, self.queue_cache_dir)
+        submitted = [t.submitted_on for t in tasks if t.submitted_on is not None]
+        newer_than = epoch_seconds(max(submitted)) if submitted else None
+        return self._queue_cache.get(timed_fetch, [t.drm_jobID for t in tasks], newer_than)
+
+    def timed(self, phase):
+        """
+        :returns: a context manager which records the time spent in it as `phase` of this DRM in the
+            JobManager's timings, ie ``slurm.queue``
+        """
+        timings = self.jobmanager.timings if self.jobmanager is not None else _no_timings
+        return timings.phase('%s.%s' % (self.name, phase))
 
     def submit_job(self, task):
+        self.set_submission_result(task, *self.try_submit_spec(JobSpec.from_task(task)))
+
+    def submit_spec(self, spec):
+        """
+        Submit a job described by a :class:`JobSpec`.  Must be thread safe, so it cannot touch the database.
+
+        :returns: (str) the drm_jobID of the submitted job
+        :raises SubmissionError: if the DRM did not accept the job
+        """
         raise NotImplementedError
 
+    def try_submit_spec(self, spec):
+        """
+        :returns: (drm_jobID, None) if the job was submitted, else (None, the SubmissionError)
+        """
+        try:
+            return self.submit_spec(spec), None
+        except SubmissionError as e:
+            return None, e
+
+    def submit_array_spec(self, specs, name):
+        """
+        Submit JobSpecs which share a native specification as a single array job.  Must be thread safe.
+
+        :param list specs: the JobSpecs to submit
+        :param str name: a name for the array job
+        :returns: (list) the drm_jobIDs of each element of the array job, in the same order as `specs`
+        :raises SubmissionError: if the DRM did not accept the job
+        """
+        raise NotImplementedError
+
+    def array_native_specification(self, native_specification):
+        """
+        :returns: `native_specification` without a job name.  Tasks whose native specifications are equal after
+            this are submitted in the same array job.
+        """
+        if not native_specification or self.job_name_re is None:
+            return native_specification or ''
+        return ' '.join(re.sub(self.job_name_re, '', native_specification).split())
+
+    def try_submit_array_spec(self, specs, name):
+        """
+        :returns: a list of (drm_jobID, error) tuples, in the same order as `specs`, like :meth:`try_submit_spec`
+        """
+        try:
+            return [(drm_jobID, None) for drm_jobID in self.submit_array_spec(specs, name)]
+        except SubmissionError as e:
+            return [(None, e)] * len(specs)
+
+    def set_submission_result(self, task, drm_jobID, error):
+        """Record the outcome of :meth:`try_submit_spec` on a Task"""
+        if error is not None:
+            task.log.error('%s submission to %s %s' % (task, task.drm, error))
+            task.status = TaskStatus.failed
+        else:
+            task.drm_jobID = drm_jobID
+            task.status = TaskStatus.submitted
+
     def filter_is_done(self, tasks):
         raise NotImplementedError
 
-    def drm_statuses(self, tasks):
+    def drm_statuses(self, tasks, log_errors=True):
+        """
+        :param tasks: tasks that have been submitted to the job manager
+        :param log_errors: log failures to query the DRM to the Workflow's log
+        :returns: (dict) task.drm_jobID -> drm_status
+        """
         raise NotImplementedError
 
     def kill(self, task):
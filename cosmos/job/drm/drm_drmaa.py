@@ -33,7 +33,8 @@ class DRM_DRMAA(DRM):
             jt.nativeSpecification = task.drm_native_specification or ''
 
             try:
-                task.drm_jobID = get_drmaa_session().runJob(jt)
+                with self.timed('run_job'):
+                    task.drm_jobID = get_drmaa_session().runJob(jt)
             except:     #pylint: disable=W0702
                 # python-drmaa can throw almost any exception! catch everything
                 task.log.error('%s failed submission to %s with nativeSpecification=`%s`' %
@@ -51,7 +52,9 @@ class DRM_DRMAA(DRM):
 
             try:
                 # disable_stderr() #python drmaa prints whacky messages sometimes.  if the script just quits without printing anything, something really bad happend while stderr is disabled
-                drmaa_jobinfo = get_drmaa_session().wait(jobId=drmaa.Session.JOB_IDS_SESSION_ANY, timeout=1)._asdict()
+                with self.timed('wait'):
+                    drmaa_jobinfo = get_drmaa_session().wait(jobId=drmaa.Session.JOB_IDS_SESSION_ANY,
+                                                             timeout=1)._asdict()
                 # enable_stderr()
 
                 yield jobid_to_task.pop(unicode(drmaa_jobinfo['jobId'])), \
@@ -111,7 +114,7 @@ class DRM_DRMAA(DRM):
                         yield jobid_to_task.pop(jobid), \
                               create_empty_drmaa_jobinfo(os.EX_TEMPFAIL)
 
-    def drm_statuses(self, tasks):
+    def drm_statuses(self, tasks, log_errors=True):
         import drmaa
 
         def get_status(task):
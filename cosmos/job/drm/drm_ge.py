@@ -2,102 +2,182 @@ import json
 import os
 import re
 import subprocess
+import threading
 import time
+import xml.etree.ElementTree as ET
 
 from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
 
 from more_itertools import grouper
 
-from cosmos import TaskStatus
-from cosmos.job.drm.DRM_Base import DRM
-from cosmos.job.drm.util import (check_output_and_stderr, convert_size_to_kb, div,
-                                 exit_process_group, CosmosCalledProcessError)
-from cosmos.util.signal_handlers import sleep_through_signals
+from cosmos.job.drm.DRM_Base import DRM, SubmissionError
+from cosmos.job.drm.util import (check_output_and_stderr, convert_size_to_kb, div, create_array_script,
+                                 exit_process_group, expand_index_ranges, quote, CosmosCalledProcessError)
 
 
 class DRM_GE(DRM):
     name = 'ge'
     poll_interval = 5
-
-    def submit_job(self, task):
-        for p in [task.output_stdout_path, task.output_stderr_path]:
+    submit_concurrency = 8
+    job_name_re = r'-N\s+("[^"]*"|\'[^\']*\'|\S+)'
+    # The accounting file finished jobs are read from.  If None, $SGE_ROOT/$SGE_CELL/common/accounting is used if it
+    # is readable, otherwise qacct is run for each finished job.
+    accounting_file = None
+    # How long to keep checking a finished job whose accounting record is missing or corrupt before giving up
+    accounting_timeout = 600
+
+    def __init__(self, jobmanager):
+        super(DRM_GE, self).__init__(jobmanager)
+        self._accounting = None
+        self._accounting_lock = threading.Lock()
+        # drm_jobID -> when the job was first seen to have finished, for jobs without valid accounting data yet
+        self._awaiting_accounting = {}
+
+    def _start_accounting(self):
+        """
+        Start following the accounting file, if there is one.  This happens before the first job is submitted, so
+        that records written from then on are the only ones ever read.
+        """
+        with self._accounting_lock:
+            if self._accounting is None:
+                path = self.accounting_file or _default_accounting_file()
+                self._accounting = AccountingFile(path) if path and os.access(path, os.R_OK) else False
+
+    def submit_spec(self, spec):
+        self._start_accounting()
+        for p in [spec.stdout_path, spec.stderr_path]:
             if os.path.exists(p):
                 os.unlink(p)
 
-        ns = ' ' + task.drm_native_specification if task.drm_native_specification else ''
+        ns = ' ' + spec.native_specification if spec.native_specification else ''
         qsub = 'qsub -terse -o {stdout} -e {stderr} -b y -w e -cwd -S /bin/bash -V{ns} '.format(
-            stdout=task.output_stdout_path, stderr=task.output_stderr_path, ns=ns)
+            stdout=spec.stdout_path, stderr=spec.stderr_path, ns=ns)
 
         try:
             out = subprocess.check_output(
-                '{qsub} "{cmd_str}"'.format(cmd_str=task.output_command_script_path, qsub=qsub),
+                '{qsub} "{cmd_str}"'.format(cmd_str=spec.command_script_path, qsub=qsub),
                 env=os.environ, preexec_fn=exit_process_group, shell=True, stderr=subprocess.STDOUT).decode()
-
-            task.drm_jobID = unicode(int(out))
         except subprocess.CalledProcessError as cpe:
-            task.log.error('%s submission to %s failed with error %s: %s' %
-                           (task, task.drm, cpe.returncode, cpe.output.decode().strip()))
-            task.status = TaskStatus.failed
+            raise SubmissionError('failed with error %s: %s' % (cpe.returncode, cpe.output.decode().strip()))
+
+        try:
+            return unicode(int(out))
         except ValueError:
-            task.log.error('%s submission to %s returned unexpected text: %s' % (task, task.drm, out))
-            task.status = TaskStatus.failed
-        else:
-            task.status = TaskStatus.submitted
+            raise SubmissionError('returned unexpected text: %s' % out)
+
+    def submit_array_spec(self, specs, name):
+        self._start_accounting()
+        for spec in specs:
+            for p in [spec.stdout_path, spec.stderr_path]:
+                if os.path.exists(p):
+                    os.unlink(p)
+
+        script = create_array_script(specs, 'SGE_TASK_ID')
+        ns = self.array_native_specification(specs[0].native_specification)
+        qsub = 'qsub -terse -t 1-{n} -N {name} -o /dev/null -e /dev/null -b y -w e -cwd -S /bin/bash -V {ns}'.format(
+            n=len(specs), name=quote(name), ns=ns)
+
+        try:
+            out = subprocess.check_output(
+                '{qsub} "{cmd_str}"'.format(cmd_str=script, qsub=qsub),
+                env=os.environ, preexec_fn=exit_process_group, shell=True, stderr=subprocess.STDOUT).decode()
+        except subprocess.CalledProcessError as cpe:
+            raise SubmissionError('failed with error %s: %s' % (cpe.returncode, cpe.output.decode().strip()))
+
+        # qsub -terse prints the array job's ID and index range, ie 12345.1-10:1
+        m = re.match(r'^(\d+)\.', out.strip())
+        if m is None:
+            raise SubmissionError('returned unexpected text: %s' % out)
+        return ['%s.%d' % (m.group(1), i) for i in range(1, len(specs) + 1)]
 
     def filter_is_done(self, tasks):
         """
         Yield a dictionary of SGE job metadata for each task that has completed.
 
         This method tries to be defensive against corrupt qstat and qacct output.
-        If qstat reports that a job has finished, but qacct output looks
-        suspicious, we try to give the job, and/or SGE, time to complete and/or
-        recover.
-
-        This method will only yield corrupt qacct data if every outstanding task
-        has been affected by this SGE bug.
+        If qstat reports that a job has finished, but its accounting record is
+        missing or looks suspicious, the job is checked again on later polls
+        (rather than blocking while other jobs finish) to give the job, and/or
+        SGE, time to complete and/or recover.  After `accounting_timeout`
+        seconds the most recent data, corrupt or not, is yielded.
+
+        Accounting records for every finished job are read in one pass over the
+        new lines of the accounting file, or if that is not available, by
+        running qacct for each job from a pool of threads.
         """
-        if tasks:
-            qjobs = _qstat_all()
-            corrupt_data = {}
-
+        if not tasks:
+            return
+
+        qjobs = self.queue_jobs(_qstat_all, tasks)
+        finished_tasks = [task for task in tasks
+                          if unicode(task.drm_jobID) not in qjobs or
+                          any(finished_state in qjobs[unicode(task.drm_jobID)]['state']
+                              for finished_state in ['e', 'E'])]
+        # a job that is back in qstat (ie after a qmaster blip) hasn't finished, so its wait for accounting data
+        # starts over when it next disappears
         for task in tasks:
+            if task not in finished_tasks:
+                self._awaiting_accounting.pop(unicode(task.drm_jobID), None)
+        #
+        # If the job doesn't appear in qstat (or is tagged with 'e' or 'E'),
+        # it *probably* has completed. However, SGE's qmaster may have
+        # simply lost track of it for a little while, in which case its
+        # accounting data will be missing or corrupt.
+        #
+        with self.timed('accounting'):
+            if self._accounting:
+                self._accounting.read(set(unicode(t.drm_jobID) for t in tasks))
+                records = {task: self._accounting.records.get(unicode(task.drm_jobID)) for task in finished_tasks}
+            elif finished_tasks:
+                pool = ThreadPool(min(self.submit_concurrency, len(finished_tasks)))
+                try:
+                    records = dict(zip(finished_tasks,
+                                       pool.map(_qacct, [unicode(task.drm_jobID) for task in finished_tasks])))
+                finally:
+                    pool.close()
+            else:
+                records = {}
+
+        now = time.time()
+        for task in finished_tasks:
             jid = unicode(task.drm_jobID)
-            if jid not in qjobs or \
-               any(finished_state in qjobs[jid]['state'] for finished_state in ['e', 'E']):
-                #
-                # If the job doesn't appear in qstat (or is tagged with 'e' or 'E'),
-                # it *probably* has completed. However, SGE's qmaster may have
-                # simply lost track of it for a little while, in which case qacct
-                # will output corrupt data when it is interrogated.
-                #
-                data, data_are_corrupt = self._get_task_return_data(task)
-                if data_are_corrupt:
+            first_seen = self._awaiting_accounting.setdefault(jid, now)
+            timed_out = now - first_seen >= self.accounting_timeout
+            d = records[task]
+
+            if d is None:
+                if not timed_out:
+                    if first_seen == now:
+                        task.workflow.log.info('%s SGE has no accounting record for job %s yet; this may mean '
+                                               'it is merely slow, or the job died in the \'qw\' state', task, jid)
+                    continue
+                task.workflow.log.error('%s SGE has no accounting record for job %s after %d sec, giving up',
+                                        task, jid, now - first_seen)
+                data = dict(exit_status=None)
+            else:
+                data, data_are_corrupt = self._get_task_return_data(task, d)
+                if data_are_corrupt and not timed_out:
                     task.workflow.log.warn(
                         '%s Corrupt SGE qstat/qacct output means it may still be running', task)
-                    corrupt_data[task] = data
-                else:
-                    yield task, data
-
-        num_cleanly_running_jobs = len(tasks) - len(corrupt_data)
-
-        if num_cleanly_running_jobs > 0:
-            for task in corrupt_data.keys():
-                task.workflow.log.info(
-                    '%s Temporarily masking corrupt SGE output since %d other jobs are running cleanly' %
-                    (task, num_cleanly_running_jobs))
-        else:
-            for task, data in corrupt_data.items():
-                task.workflow.log.error(
-                    '%s All outstanding drm_ge tasks have corrupt SGE output: giving up on this one' % task)
-                yield task, data
-
-    def drm_statuses(self, tasks):
+                    continue
+                elif data_are_corrupt:
+                    task.workflow.log.error(
+                        '%s SGE accounting data have been corrupt for %d sec: giving up on this one',
+                        task, now - first_seen)
+
+            del self._awaiting_accounting[jid]
+            if self._accounting:
+                self._accounting.records.pop(jid, None)
+            yield task, data
+
+    def drm_statuses(self, tasks, log_errors=True):
         """
         :param tasks: tasks that have been submitted to the job manager
         :returns: (dict) task.drm_jobID -> drm_status
         """
         if tasks:
-            qjobs = _qstat_all()
+            qjobs = self.queue_jobs(_qstat_all, tasks)
 
             def f(task):
                 return qjobs.get(unicode(task.drm_jobID), dict()).get('state', 'UNK_JOB_STATE')
@@ -106,7 +186,7 @@ class DRM_GE(DRM):
         else:
             return {}
 
-    def _get_task_return_data(self, task):
+    def _get_task_return_data(self, task, d):
         """
         Convert raw qacct job data into Cosmos's more portable format.
 
@@ -115,8 +195,6 @@ class DRM_GE(DRM):
         [1] a boolean indicating whether the metadata in [0] are affected by an
             SGE bug that causes qacct to occasionally return corrupt results.
         """
-        d = _qacct_raw(task)
-
         job_failed = d['failed'][0] != '0'
         data_are_corrupt = _is_corrupt(d)
 
@@ -195,59 +273,26 @@ def _is_corrupt(qacct_dict):
            ("before writing exit_status" not in qacct_dict.get('failed', ''))
 
 
-def _qacct_raw(task, timeout=600, quantum=15):
+def _qacct(drm_jobID):
     """
-    Parse qacct output into key/value pairs.
+    Run qacct for a job.  Thread safe.
 
     If qacct reports results in multiple blocks (separated by a row of ===='s),
     the most recently-generated block with valid data is returned. If no such
     block exists, then return the most recently-generated block of corrupt data.
+
+    :returns: (dict) qacct's key/value pairs, or None if qacct did not find the job
     """
-    start = time.time()
+    try:
+        qacct_stdout_str, _ = check_output_and_stderr(['qacct'] + _qacct_job_args(drm_jobID),
+                                                      preexec_fn=exit_process_group)
+    except (CosmosCalledProcessError, OSError):
+        return None
+    if not qacct_stdout_str.strip():
+        return None
+
     curr_qacct_dict = None
     good_qacct_dict = None
-    num_retries = int(timeout / quantum)
-
-    for i in xrange(num_retries):
-        qacct_returncode = 0
-        try:
-            qacct_stdout_str, qacct_stderr_str = check_output_and_stderr(
-                ['qacct', '-j', unicode(task.drm_jobID)],
-                preexec_fn=exit_process_group)
-            if qacct_stdout_str.strip():
-                break
-        except CosmosCalledProcessError as err:
-            qacct_stdout_str = err.output.strip()
-            qacct_stderr_str = err.stderr.strip()
-            qacct_returncode = err.returncode
-
-        if qacct_stderr_str and re.match(r'error: job id \d+ not found', qacct_stderr_str):
-            if i > 0:
-                task.workflow.log.info('%s SGE (qacct -j %s) reports "not found"; this may mean '
-                                       'qacct is merely slow, or %s died in the \'qw\' state',
-                                       task, task.drm_jobID, task.drm_jobID)
-        else:
-            task.workflow.log.error('%s SGE (qacct -j %s) returned error code %d',
-                                    task, task.drm_jobID, qacct_returncode)
-            if qacct_stdout_str or qacct_stderr_str:
-                task.workflow.log.error('%s SGE (qacct -j %s) printed the following', task, task.drm_jobID)
-                if qacct_stdout_str:
-                    task.workflow.log.error('stdout: "%s"', qacct_stdout_str)
-                if qacct_stderr_str:
-                    task.workflow.log.error('stderr: "%s"', qacct_stderr_str)
-
-        if i > 0:
-            task.workflow.log.info(
-                '%s SGE (qacct -j %s) attempt %d failed %d sec after first attempt%s',
-                task, task.drm_jobID, i + 1, time.time() - start,
-                '. Will recheck job status after %d sec' % quantum if i + 1 < num_retries else '')
-        if i + 1 < num_retries:
-            sleep_through_signals(timeout=quantum)
-    else:
-        # fallthrough: all retries failed
-        raise ValueError('No valid `qacct -j %s` output after %d tries and %d sec' %
-                         (task.drm_jobID, i, time.time() - start))
-
     for line in qacct_stdout_str.strip().split('\n'):
         if line.startswith('='):
             if curr_qacct_dict and not _is_corrupt(curr_qacct_dict):
@@ -263,8 +308,8 @@ def _qacct_raw(task, timeout=600, quantum=15):
         try:
             k, v = re.split(r'\s+', line, maxsplit=1)
         except ValueError:
-            raise EnvironmentError('%s with drm_jobID=%s has unparseable qacct output:\n%s' %
-                                   (task, task.drm_jobID, qacct_stdout_str))
+            raise EnvironmentError('drm_jobID=%s has unparseable qacct output:\n%s' %
+                                   (drm_jobID, qacct_stdout_str))
 
         curr_qacct_dict[k] = v.strip()
 
@@ -275,18 +320,125 @@ def _qacct_raw(task, timeout=600, quantum=15):
     return good_qacct_dict if good_qacct_dict else curr_qacct_dict
 
 
+def _qacct_job_args(drm_jobID):
+    """
+    :returns: the qacct arguments which select a job, or one element (ie 12345.3) of an array job
+    """
+    job_id, _, array_index = unicode(drm_jobID).partition('.')
+    return ['-j', job_id] + (['-t', array_index] if array_index else [])
+
+
+# The fields of a record in the accounting file, see accounting(5)
+ACCOUNTING_FIELDS = ['qname', 'hostname', 'group', 'owner', 'jobname', 'jobnumber', 'account', 'priority',
+                     'qsub_time', 'start_time', 'end_time', 'failed', 'exit_status', 'ru_wallclock', 'ru_utime',
+                     'ru_stime', 'ru_maxrss', 'ru_ixrss', 'ru_ismrss', 'ru_idrss', 'ru_isrss', 'ru_minflt',
+                     'ru_majflt', 'ru_nswap', 'ru_inblock', 'ru_oublock', 'ru_msgsnd', 'ru_msgrcv', 'ru_nsignals',
+                     'ru_nvcsw', 'ru_nivcsw', 'project', 'department', 'granted_pe', 'slots', 'taskid', 'cpu',
+                     'mem', 'io', 'category', 'iow', 'pe_taskid', 'maxvmem']
+
+
+def _default_accounting_file():
+    if 'SGE_ROOT' not in os.environ:
+        return None
+    return os.path.join(os.environ['SGE_ROOT'], os.environ.get('SGE_CELL', 'default'), 'common', 'accounting')
+
+
+class AccountingFile(object):
+    """
+    Follows an SGE accounting file, parsing the records of jobs we are waiting on into the same format as qacct.
+
+    Only the lines appended since the previous read are parsed, so finding the accounting data of any number
+    of finished jobs costs a single read of (usually) a few kilobytes.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.offset = os.path.getsize(path)
+        self.inode = os.stat(path).st_ino
+        #: drm_jobID -> the most recent valid record of the job (or the most recent corrupt one, if none are valid)
+        self.records = {}
+
+    def read(self, drm_jobIDs):
+        """
+        Parse new records of the jobs in `drm_jobIDs` into :attr:`records`.
+        """
+        st = os.stat(self.path)
+        if st.st_ino != self.inode or st.st_size < self.offset:
+            # the accounting file was rotated
+            self.inode, self.offset = st.st_ino, 0
+
+        with open(self.path) as fh:
+            fh.seek(self.offset)
+            data = fh.read()
+        # leave a partially written record for next time
+        data = data[:data.rfind('\n') + 1]
+        self.offset += len(data)
+
+        for line in data.splitlines():
+            if line.startswith('#'):
+                continue
+            d = parse_accounting_record(line)
+            if d is None:
+                continue
+            jid = d['jobnumber'] if d['taskid'] in ('0', 'undefined') else '%s.%s' % (d['jobnumber'], d['taskid'])
+            if jid in drm_jobIDs and (jid not in self.records or _is_corrupt(self.records[jid]) or
+                                      not _is_corrupt(d)):
+                self.records[jid] = d
+
+
+def parse_accounting_record(line):
+    """
+    Parse a line of an SGE accounting file into the same keys and formats that qacct prints.
+
+    :returns: an OrderedDict, or None if the line is not a valid record
+    """
+    items = line.rstrip('\n').split(':')
+    if len(items) < len(ACCOUNTING_FIELDS):
+        return None
+    d = OrderedDict(zip(ACCOUNTING_FIELDS, items))
+
+    for k in ['qsub_time', 'start_time', 'end_time']:
+        t = float(d[k])
+        if t > 1e11:
+            # some versions record milliseconds
+            t /= 1000
+        if t == 0 and k != 'qsub_time':
+            d[k] = '-/-'
+        else:
+            d[k] = time.strftime('%m/%d/%Y %H:%M:%S', time.localtime(t))
+    # the accounting file records ru_maxrss in kilobytes and maxvmem in bytes
+    d['ru_maxrss'] = '%sK' % d['ru_maxrss']
+    return d
+
+
 def _qstat_all():
     """
-    returns a dict keyed by lsf job ids, who's values are a dict of bjob
-    information about the job
+    returns a dict keyed by job ids, who's values are a dict of qstat -xml
+    information about the job.  Elements of array jobs are keyed by job_id.array_index, ie 12345.3
     """
     try:
-        lines = subprocess.check_output(['qstat'], preexec_fn=exit_process_group).decode().strip().split('\n')
+        out = subprocess.check_output(['qstat', '-xml'], preexec_fn=exit_process_group)
     except (subprocess.CalledProcessError, OSError):
         return {}
-    keys = re.split(r"\s+", lines[0])
-    bjobs = {}
-    for l in lines[2:]:
-        items = re.split(r"\s+", l.strip())
-        bjobs[items[0]] = dict(zip(keys, items))
-    return bjobs
+    return parse_qstat_xml(out)
+
+
+def parse_qstat_xml(xml):
+    """
+    :returns: a dict keyed by job ids, who's values are a dict of the job's fields, ie JB_job_number, state, tasks
+    """
+    try:
+        root = ET.fromstring(xml)
+    except ET.ParseError:
+        return {}
+
+    qjobs = {}
+    for job_list in root.iter('job_list'):
+        job = {child.tag: (child.text or '').strip() for child in job_list}
+        job.setdefault('state', job_list.get('state', ''))
+        jid = job.get('JB_job_number')
+        qjobs[jid] = job
+        if job.get('tasks'):
+            for array_index in expand_index_ranges(job['tasks']):
+                qjobs['%s.%s' % (jid, array_index)] = job
+    return qjobs
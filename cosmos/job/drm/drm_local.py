@@ -1,3 +1,6 @@
+import errno
+import fcntl
+import json
 import os
 import signal
 import sys
@@ -7,6 +10,7 @@ else:
     import subprocess as sp
 import time
 
+from cosmos.job.drm import profiler
 from cosmos.job.drm.DRM_Base import DRM
 from cosmos.job.drm.util import exit_process_group
 from cosmos.api import TaskStatus
@@ -15,23 +19,49 @@ from cosmos.api import TaskStatus
 class DRM_Local(DRM):
     name = 'local'
     poll_interval = 0.3
+    # If True, a SIGCHLD handler wakes the JobManager as soon as a Task's process exits, and poll_interval becomes
+    # event_poll_interval, which is only a safety net.
+    event_driven = True
+    event_poll_interval = 5
+    # If True, Tasks are run by cosmos/job/drm/profiler.py, which samples the resource usage of the Task's processes
+    # every profile_interval seconds and writes it to the Task's profile.json and profile columns.
+    profile = False
+    profile_interval = 1
 
     def __init__(self, jobmanager):
         self.procs = dict()
         super(DRM_Local, self).__init__(jobmanager)
 
+    def _handle_sigchld(self):
+        try:
+            self.wakeup_fd = sigchld_wakeup_fd()
+        except ValueError:
+            # signal handlers can only be installed from the main thread; elsewhere Tasks are just polled
+            self.event_driven = False
+        else:
+            self.poll_interval = self.event_poll_interval
+
     def submit_job(self, task):
+        if self.event_driven and self.wakeup_fd is None:
+            self._handle_sigchld()
 
         if task.time_req is not None:
             cmd = ['/usr/bin/timeout', '-k', '10', str(task.time_req), task.output_command_script_path]
         else:
-            cmd = task.output_command_script_path
-
-        p = sp.Popen(cmd,
-                     stdout=open(task.output_stdout_path, 'w'),
-                     stderr=open(task.output_stderr_path, 'w'),
-                     shell=False, env=os.environ,
-                     preexec_fn=exit_process_group)
+            cmd = [task.output_command_script_path]
+
+        if self.profile:
+            cmd = [sys.executable, profiler.__file__.replace('.pyc', '.py'), '--interval', str(self.profile_interval),
+                   '--output', task.output_profile_path, '--'] + cmd
+            if os.path.exists(task.output_profile_path):
+                os.unlink(task.output_profile_path)
+
+        with self.timed('popen'):
+            p = sp.Popen(cmd,
+                         stdout=open(task.output_stdout_path, 'w'),
+                         stderr=open(task.output_stderr_path, 'w'),
+                         shell=False, env=os.environ,
+                         preexec_fn=exit_process_group)
         p.start_time = time.time()
         drm_jobID = unicode(p.pid)
         self.procs[drm_jobID] = p
@@ -53,7 +83,7 @@ class DRM_Local(DRM):
             if self._is_done(t):
                 yield t, self._get_task_return_data(t)
 
-    def drm_statuses(self, tasks):
+    def drm_statuses(self, tasks, log_errors=True):
         """
         :returns: (dict) task.drm_jobID -> drm_status
         """
@@ -68,8 +98,17 @@ class DRM_Local(DRM):
         return {task.drm_jobID: f(task) for task in tasks}
 
     def _get_task_return_data(self, task):
-        return dict(exit_status=self.procs[task.drm_jobID].wait(timeout=0),
-                    wall_time=round(int(time.time() - self.procs[task.drm_jobID].start_time)))
+        d = dict(exit_status=self.procs[task.drm_jobID].wait(timeout=0),
+                 wall_time=round(int(time.time() - self.procs[task.drm_jobID].start_time)))
+        if self.profile:
+            try:
+                with open(task.output_profile_path) as fh:
+                    profile = json.load(fh)
+            except (IOError, ValueError):
+                task.log.warning('%s could not read its profile, %s', task, task.output_profile_path)
+            else:
+                d.update((k, v) for k, v in profile.items() if k in task.profile_fields)
+        return d
 
     @staticmethod
     def _signal(task, sig):
@@ -114,3 +153,46 @@ class DRM_Local(DRM):
 
 class JobStatusError(Exception):
     pass
+
+
+_sigchld_read_fd = None
+
+
+def sigchld_wakeup_fd():
+    """
+    Install a SIGCHLD handler which writes to a pipe, so that a child process exiting can be select()ed on.  The
+    handler is only installed once per process, and calls any handler that was installed before it.
+
+    :returns: the read end of the pipe, which is non-blocking
+    :raises ValueError: if not called from the main thread
+    """
+    global _sigchld_read_fd
+    if _sigchld_read_fd is not None:
+        return _sigchld_read_fd
+
+    read_fd, write_fd = os.pipe()
+    for fd in [read_fd, write_fd]:
+        fcntl.fcntl(fd, fcntl.F_SETFL, fcntl.fcntl(fd, fcntl.F_GETFL) | os.O_NONBLOCK)
+        fcntl.fcntl(fd, fcntl.F_SETFD, fcntl.fcntl(fd, fcntl.F_GETFD) | fcntl.FD_CLOEXEC)
+
+    def on_sigchld(signum, frame):
+        try:
+            os.write(write_fd, b'\0')
+        except OSError as e:
+            # the pipe is full, so a wakeup is already pending
+            if e.errno != errno.EAGAIN:
+                raise
+        if callable(previous_handler):
+            previous_handler(signum, frame)
+
+    try:
+        previous_handler = signal.signal(signal.SIGCHLD, on_sigchld)
+    except ValueError:
+        os.close(read_fd)
+        os.close(write_fd)
+        raise
+    # restart system calls interrupted by SIGCHLD rather than failing them with EINTR
+    signal.siginterrupt(signal.SIGCHLD, False)
+
+    _sigchld_read_fd = read_fd
+    return read_fd
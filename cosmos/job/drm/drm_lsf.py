@@ -2,9 +2,8 @@ import subprocess as sp
 import re
 import os
 
-from cosmos.job.drm.DRM_Base import DRM
-from cosmos.job.drm.util import exit_process_group
-from cosmos import TaskStatus
+from cosmos.job.drm.DRM_Base import DRM, SubmissionError
+from cosmos.job.drm.util import create_array_script, exit_process_group, quote
 
 decode_lsf_state = dict([
     ('UNKWN', 'process status cannot be determined'),
@@ -21,29 +20,50 @@ decode_lsf_state = dict([
 class DRM_LSF(DRM):
     name = 'lsf'
     poll_interval = 5
+    submit_concurrency = 8
+    job_name_re = r'-J\s+("[^"]*"|\'[^\']*\'|\S+)'
 
-    def submit_job(self, task):
-        ns = ' ' + task.drm_native_specification if task.drm_native_specification else ''
-        bsub = 'bsub -o {stdout} -e {stderr}{ns} '.format(stdout=task.output_stdout_path,
-                                                          stderr=task.output_stderr_path,
+    def submit_spec(self, spec):
+        ns = ' ' + spec.native_specification if spec.native_specification else ''
+        bsub = 'bsub -o {stdout} -e {stderr}{ns} '.format(stdout=spec.stdout_path,
+                                                          stderr=spec.stderr_path,
                                                           ns=ns)
         try:
-            out = sp.check_output('{bsub} "{cmd_str}"'.format(cmd_str=self.jobmanager.get_command_str(task),
-                                                              bsub=bsub).decode(),
+            out = sp.check_output('{bsub} "{cmd_str}"'.format(cmd_str=spec.command_script_path, bsub=bsub),
                                   env=os.environ,
                                   preexec_fn=exit_process_group,
-                                  shell=True).decode()
+                                  shell=True,
+                                  stderr=sp.STDOUT).decode()
+        except sp.CalledProcessError as cpe:
+            raise SubmissionError('failed with error %s: %s' % (cpe.returncode, cpe.output.decode().strip()))
+
+        m = re.search(r'Job <(\d+)>', out)
+        if m is None:
+            raise SubmissionError('returned unexpected text: %s' % out)
+        return unicode(int(m.group(1)))
+
+    def submit_array_spec(self, specs, name):
+        script = create_array_script(specs, 'LSB_JOBINDEX')
+        ns = self.array_native_specification(specs[0].native_specification)
+        bsub = 'bsub -o /dev/null -e /dev/null -J {name} {ns} '.format(name=quote('%s[1-%d]' % (name, len(specs))),
+                                                                       ns=ns)
+        try:
+            out = sp.check_output('{bsub} "{cmd_str}"'.format(cmd_str=script, bsub=bsub),
+                                  env=os.environ,
+                                  preexec_fn=exit_process_group,
+                                  shell=True,
+                                  stderr=sp.STDOUT).decode()
+        except sp.CalledProcessError as cpe:
+            raise SubmissionError('failed with error %s: %s' % (cpe.returncode, cpe.output.decode().strip()))
 
-            task.drm_jobID = unicode(int(re.search(r'Job <(\d+)>', out).group(1)))
-        except (sp.CalledProcessError, ValueError):
-            task.log.error('%s failed submission to %s: %s' % (task, task.drm, out))
-            task.status = TaskStatus.failed
-        else:
-            task.status = TaskStatus.submitted
+        m = re.search(r'Job <(\d+)>', out)
+        if m is None:
+            raise SubmissionError('returned unexpected text: %s' % out)
+        return ['%s[%d]' % (m.group(1), i) for i in range(1, len(specs) + 1)]
 
     def filter_is_done(self, tasks):
         if len(tasks):
-            bjobs = bjobs_all()
+            bjobs = self.queue_jobs(bjobs_all, tasks)
 
             def is_done(task):
                 jid = str(task.drm_jobID)
@@ -58,13 +78,13 @@ class DRM_LSF(DRM):
         else:
             return []
 
-    def drm_statuses(self, tasks):
+    def drm_statuses(self, tasks, log_errors=True):
         """
         :param tasks: tasks that have been submitted to the job manager
         :returns: (dict) task.drm_jobID -> drm_status
         """
         if len(tasks):
-            bjobs = bjobs_all()
+            bjobs = self.queue_jobs(bjobs_all, tasks)
 
             def f(task):
                 return bjobs.get(str(task.drm_jobID), dict()).get('STAT', 'UNK_JOB_STATE')
@@ -80,21 +100,23 @@ class DRM_LSF(DRM):
 
     def kill_tasks(self, tasks):
         for t in tasks:
-            sp.check_call(['bkill', str(t.drm_jobID)], preexec_function=exit_process_group)
+            sp.check_call(['bkill', str(t.drm_jobID)], preexec_fn=exit_process_group)
 
 
 def bjobs_all():
     """
     returns a dict keyed by lsf job ids, who's values are a dict of bjob
-    information about the job
+    information about the job.  Elements of array jobs are keyed by job_id[array_index], ie 12345[3]
     """
     try:
-        lines = sp.check_output(['bjobs', '-a'], preexec_function=exit_process_group).decode().split('\n')
+        lines = sp.check_output(['bjobs', '-a'], preexec_fn=exit_process_group).decode().split('\n')
     except (sp.CalledProcessError, OSError):
         return {}
     bjobs = {}
     header = re.split("\s\s+", lines[0])
     for l in lines[1:]:
         items = re.split("\s\s+", l)
-        bjobs[items[0]] = dict(zip(header, items))
+        job = dict(zip(header, items))
+        m = re.search(r'\[(\d+)\]$', job.get('JOB_NAME', ''))
+        bjobs[items[0] + m.group(0) if m else items[0]] = job
     return bjobs
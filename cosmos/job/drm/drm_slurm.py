@@ -7,12 +7,17 @@ import time
 
 from more_itertools import grouper
 
-from cosmos import TaskStatus
-from cosmos.job.drm.DRM_Base import DRM
-from cosmos.job.drm.util import exit_process_group, CosmosCalledProcessError, check_output_and_stderr
+from cosmos.job.drm.DRM_Base import DRM, SubmissionError
+from cosmos.job.drm.util import (check_output_and_stderr, convert_size_to_kb, create_array_script, div,
+                                 exit_process_group, expand_index_ranges, quote, CosmosCalledProcessError)
 from cosmos.util.signal_handlers import sleep_through_signals
 
 FAILED_STATES = ['BOOT_FAIL', 'CANCELLED', 'FAILED', 'NODE_FAIL', 'PREEMPTED', 'REVOKED', 'TIMEOUT']
+FINISHED_STATES = ['COMPLETED', 'DEADLINE', 'OUT_OF_MEMORY'] + FAILED_STATES
+
+SACCT_FIELDS = ['JobID', 'State', 'ExitCode', 'DerivedExitCode', 'ElapsedRaw', 'TotalCPU', 'UserCPU', 'SystemCPU',
+                'MaxRSS', 'AveRSS', 'MaxVMSize', 'AveVMSize', 'MaxDiskRead', 'MaxDiskWrite', 'Start', 'End']
+SACCT_USAGE_FIELDS = ['MaxRSS', 'AveRSS', 'MaxVMSize', 'AveVMSize', 'MaxDiskRead', 'MaxDiskWrite']
 
 
 def parse_slurm_time(s, default=0):
@@ -30,6 +35,19 @@ def parse_slurm_time(s, default=0):
     return int(days) * 24 * 60 * 60 + int(hours) * 60 * 60 + int(mins) * 60 + int(secs)
 
 
+def parse_sacct_time(s):
+    """
+    Parse sacct's [DD-[HH:]]MM:SS[.mmm] durations, ie TotalCPU, into seconds
+    """
+    if s.strip() == '':
+        return None
+    days, _, time = s.rpartition('-')
+    secs = 0.
+    for part in time.split(':'):
+        secs = secs * 60 + float(part)
+    return int(days or 0) * 24 * 60 * 60 + secs
+
+
 def parse_slurm_time2(s):
     return datetime.datetime.strptime(s, "%Y-%m-%dT%H:%M:%S")
 
@@ -37,53 +55,88 @@ def parse_slurm_time2(s):
 class DRM_SLURM(DRM):
     name = 'slurm'
     poll_interval = 5
+    submit_concurrency = 8
+    job_name_re = r'(-J|--job-name)(\s+|=)("[^"]*"|\'[^\']*\'|\S+)'
 
-    def submit_job(self, task):
-        for p in [task.output_stdout_path, task.output_stderr_path]:
+    def submit_spec(self, spec):
+        for p in [spec.stdout_path, spec.stderr_path]:
             if os.path.exists(p):
                 os.unlink(p)
 
-        ns = ' ' + task.drm_native_specification if task.drm_native_specification else ''
+        ns = ' ' + spec.native_specification if spec.native_specification else ''
         sub = "sbatch -o {stdout} -e {stderr} {ns} {cmd_str}".format(
-            stdout=task.output_stdout_path,
-            stderr=task.output_stderr_path,
+            stdout=spec.stdout_path,
+            stderr=spec.stderr_path,
             ns=ns,
-            cmd_str=task.output_command_script_path)
+            cmd_str=spec.command_script_path)
 
         try:
-            out = sp.check_output(sub, env=os.environ, preexec_fn=exit_process_group, shell=True).decode()
-            task.drm_jobID = unicode(re.search(r'job (\d+)', out).group(1))
+            out = sp.check_output(sub, env=os.environ, preexec_fn=exit_process_group, shell=True,
+                                  stderr=sp.STDOUT).decode()
         except sp.CalledProcessError as cpe:
-            task.log.error('%s submission to %s failed with error %s: %s' %
-                           (task, task.drm, cpe.returncode, cpe.output.decode().strip()))
-            task.status = TaskStatus.failed
-        except ValueError:
-            task.log.error('%s submission to %s returned unexpected text: %s' % (task, task.drm, out))
-            task.status = TaskStatus.failed
-        else:
-            task.status = TaskStatus.submitted
+            raise SubmissionError('failed with error %s: %s' % (cpe.returncode, cpe.output.decode().strip()))
+
+        m = re.search(r'job (\d+)', out)
+        if m is None:
+            raise SubmissionError('returned unexpected text: %s' % out)
+        return unicode(m.group(1))
+
+    def submit_array_spec(self, specs, name):
+        for spec in specs:
+            for p in [spec.stdout_path, spec.stderr_path]:
+                if os.path.exists(p):
+                    os.unlink(p)
+
+        script = create_array_script(specs, 'SLURM_ARRAY_TASK_ID')
+        ns = self.array_native_specification(specs[0].native_specification)
+        sub = "sbatch --array=1-{n} -J {name} -o /dev/null -e /dev/null {ns} {cmd_str}".format(
+            n=len(specs), name=quote(name), ns=ns, cmd_str=script)
+
+        try:
+            out = sp.check_output(sub, env=os.environ, preexec_fn=exit_process_group, shell=True,
+                                  stderr=sp.STDOUT).decode()
+        except sp.CalledProcessError as cpe:
+            raise SubmissionError('failed with error %s: %s' % (cpe.returncode, cpe.output.decode().strip()))
+
+        m = re.search(r'job (\d+)', out)
+        if m is None:
+            raise SubmissionError('returned unexpected text: %s' % out)
+        return ['%s_%d' % (m.group(1), i) for i in range(1, len(specs) + 1)]
 
     def filter_is_done(self, tasks):
         """
         Yield a dictionary of Slurm job metadata for each task that has completed.
+
+        Accounting data for all the finished jobs is fetched with a single sacct call.  Jobs that sacct does not
+        know about yet (or if accounting is disabled) fall back to scontrol, one job at a time.
         """
         if tasks:
-            qjobs = _qstat_all(tasks[0].workflow.log)
+            qjobs = self.queue_jobs(lambda: _qstat_all(tasks[0].workflow.log), tasks)
 
+        done_tasks = []
         for task in tasks:
             jid = unicode(task.drm_jobID)
-
             if jid not in qjobs or qjobs[jid]['STATE'] == 'COMPLETED' or qjobs[jid]['STATE'] in FAILED_STATES:
-                # job is done
+                done_tasks.append(task)
+
+        if done_tasks:
+            with self.timed('accounting'):
+                sacct_records = _sacct_all([task.drm_jobID for task in done_tasks], log=tasks[0].workflow.log)
+
+        for task in done_tasks:
+            record = sacct_records.get(unicode(task.drm_jobID))
+            if record is not None and record['State'] in FINISHED_STATES:
+                data = self._get_task_return_data_from_sacct(task, record)
+            else:
                 data = self._get_task_return_data(task)
 
-                if data['JobState'] in FAILED_STATES:
-                    data['exit_status'] = (1 if (data['exit_status'] is None or data['exit_status'] == 0)
-                                           else data['exit_status'])
-                else:
-                    data['exit_status'] = (0 if data['exit_status'] is None else data['exit_status'])
+            if data['JobState'] in FAILED_STATES:
+                data['exit_status'] = (1 if (data['exit_status'] is None or data['exit_status'] == 0)
+                                       else data['exit_status'])
+            else:
+                data['exit_status'] = (0 if data['exit_status'] is None else data['exit_status'])
 
-                yield task, data
+            yield task, data
 
     def drm_statuses(self, tasks, log_errors=True):
         """
@@ -91,7 +144,7 @@ class DRM_SLURM(DRM):
         :returns: (dict) task.drm_jobID -> drm_status
         """
         if tasks:
-            qjobs = _qstat_all(log=tasks[0].workflow.log if log_errors else None)
+            qjobs = self.queue_jobs(lambda: _qstat_all(log=tasks[0].workflow.log if log_errors else None), tasks)
 
             def f(task):
                 return qjobs.get(unicode(task.drm_jobID), dict()).get('STATE', 'UNK_JOB_STATE')
@@ -112,9 +165,7 @@ class DRM_SLURM(DRM):
                                    (task, task.drm_jobID, job_state,
                                     json.dumps(d, indent=4, sort_keys=True)))
         if 'DerivedExitCode' in d and 'ExitCode' in d:
-            exit_code = (0 if d['DerivedExitCode'] == '0:0' and d['ExitCode'] == '0:0'
-                         else max(max(int(c) for c in d['DerivedExitCode'].split(":")),
-                                  max(int(c) for c in d['ExitCode'].split(":"))))
+            exit_code = _exit_code(d['ExitCode'], d['DerivedExitCode'])
         else:
             # scontrol show jobid -d -o did not find the job id (probably called too late) so we don't have exit code
             exit_code = None
@@ -132,6 +183,39 @@ class DRM_SLURM(DRM):
         # task.workflow.log.info("%s returned with exit code: '%s'" % (task, str(exit_code)))
         return d
 
+    def _get_task_return_data_from_sacct(self, task, d):
+        """
+        Convert a record from :func:`_sacct_all` into Cosmos's more portable format.
+        """
+        if d['State'] != 'COMPLETED':
+            task.workflow.log.warn('%s Slurm (sacct -j %s) reports State %s:\n%s' %
+                                   (task, task.drm_jobID, d['State'], json.dumps(d, indent=4, sort_keys=True)))
+
+        cpu_time = parse_sacct_time(d['TotalCPU'])
+        wall_time = float(d['ElapsedRaw']) if d['ElapsedRaw'] else None
+
+        def kb(field):
+            return convert_size_to_kb(d[field]) if d[field] else None
+
+        return dict(
+            JobState=d['State'],
+            exit_status=_exit_code(d['ExitCode'], d['DerivedExitCode']),
+
+            wall_time=wall_time,
+            cpu_time=cpu_time,
+            percent_cpu=div(cpu_time, wall_time) if cpu_time is not None and wall_time is not None else None,
+            user_time=parse_sacct_time(d['UserCPU']),
+            system_time=parse_sacct_time(d['SystemCPU']),
+
+            avg_rss_mem_kb=kb('AveRSS'),
+            max_rss_mem_kb=kb('MaxRSS'),
+            avg_vms_mem_kb=kb('AveVMSize'),
+            max_vms_mem_kb=kb('MaxVMSize'),
+
+            io_read_kb=kb('MaxDiskRead'),
+            io_write_kb=kb('MaxDiskWrite'),
+        )
+
     def kill(self, task):
         """Terminate a task."""
         raise NotImplementedError
@@ -211,7 +295,7 @@ def _scontrol_raw(task, timeout=600, quantum=15):
 def _qstat_all(log=None, timeout=60 * 10):
     """
     returns a dict keyed by lsf job ids, who's values are a dict of bjob
-    information about the job
+    information about the job.  Elements of array jobs are keyed by job_id_array_index, ie 12345_3
     """
     start = time.time()
     while time.time() - start < timeout:
@@ -230,10 +314,71 @@ def _qstat_all(log=None, timeout=60 * 10):
     bjobs = {}
     for l in lines[2:]:
         items = re.split(r"\s+", l.strip())
-        bjobs[items[0]] = dict(zip(keys, items))
+        job = dict(zip(keys, items))
+        bjobs[items[0]] = job
+        # pending elements of an array job are listed together, ie 12345_[4-10%2]
+        m = re.match(r'^(\d+)_\[(.+)\]$', items[0])
+        if m:
+            for array_index in expand_index_ranges(m.group(2)):
+                bjobs['%s_%s' % (m.group(1), array_index)] = job
     return bjobs
 
 
+def _exit_code(exit_code, derived_exit_code):
+    """
+    :param exit_code: sacct's ExitCode, ie 1:0 (exit status:signal)
+    :param derived_exit_code: sacct's DerivedExitCode, the highest exit code of the job's steps.  Only used when there
+        is no ExitCode.
+    :returns: the exit status of the job's batch script, or 128 + the signal that killed it, like a shell reports
+    """
+    code = exit_code or derived_exit_code
+    if not code:
+        return None
+    status, _, signal = code.partition(':')
+    return 128 + int(signal) if signal and int(signal) else int(status)
+
+
+def _sacct_all(job_ids, log=None, chunk_size=500):
+    """
+    Fetch accounting data for many jobs with as few sacct calls as possible.
+
+    sacct reports a line for each job and a line for each of its steps (ie 12345.batch).  Resource usage is
+    only reported for steps, so a job's record takes the maximum of each usage field over its steps.
+
+    :returns: a dict keyed by job id (or array element id, ie 12345_3) whose values are a dict keyed by SACCT_FIELDS.
+        Jobs unknown to sacct are left out, as are the jobs of a chunk sacct failed on, so that the caller falls
+        back to scontrol for them.
+    """
+    records = {}
+    for group in grouper(chunk_size, job_ids):
+        group = [unicode(jid) for jid in group if jid is not None]
+        try:
+            out = sp.check_output(['sacct', '-j', ','.join(group), '--parsable2', '--noheader',
+                                   '--format=%s' % ','.join(SACCT_FIELDS)],
+                                  preexec_fn=exit_process_group).decode()
+        except (sp.CalledProcessError, OSError) as e:
+            if log:
+                log.info('Error running sacct for %d jobs: %s' % (len(group), e))
+            continue
+
+        for line in out.strip().split('\n'):
+            items = line.split('|')
+            if len(items) != len(SACCT_FIELDS):
+                continue
+            d = dict(zip(SACCT_FIELDS, items))
+            jid, _, step = d['JobID'].partition('.')
+            record = records.setdefault(jid, dict.fromkeys(SACCT_FIELDS, ''))
+            if not step:
+                record.update((k, v) for k, v in d.items() if k not in SACCT_USAGE_FIELDS)
+                # ie "CANCELLED by 1234"
+                record['State'] = record['State'].split(' ')[0]
+                record['JobID'] = jid
+            for k in SACCT_USAGE_FIELDS:
+                if d[k] and (not record[k] or convert_size_to_kb(d[k]) > convert_size_to_kb(record[k])):
+                    record[k] = d[k]
+    return records
+
+
 def get_resource_usage(job_id):
     # there's a lag between when a job finishes and when sacct is available :(Z
     parts = sp.check_output('sacct --format="CPUTime,MaxRSS,AveRSS,AveCPU,CPUTimeRAW,Elapsed" -j %s' % job_id,
@@ -0,0 +1,223 @@
+"""
+Runs a command and samples the resource usage of its process group from /proc, writing a summary to a json file.
+
+DRM_Local runs Tasks through this script when its `profile` option is set.  It is executed as a script rather than
+imported (and only uses the standard library) so that it does not pay for importing cosmos in every Task.
+
+usage: python profiler.py --output profile.json [--interval 1] -- command [args...]
+
+Memory, thread and file descriptor counts are summed over every process in the process group at each sample, then
+averaged over the samples and maxed.  CPU time and context switches come from the rusage of the command once it
+exits, so they are exact.  The cpu time spent sampling is recorded as `profiler_cpu_time`; whenever a sample costs
+more than `--max-overhead` of the interval, the interval is doubled.
+"""
+import argparse
+import errno
+import json
+import os
+import resource
+import select
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+PAGE_SIZE_KB = resource.getpagesize() / 1024.
+MAX_INTERVAL = 60
+
+
+def read_stat(pid):
+    """
+    :returns: the fields of /proc/<pid>/stat after the command name, which may contain spaces, or None if the
+        process has exited
+    """
+    try:
+        with open('/proc/%s/stat' % pid) as fh:
+            stat = fh.read()
+    except (IOError, OSError):
+        return None
+    return stat[stat.rfind(')') + 2:].split()
+
+
+def read_io(pid):
+    """:returns: a dict of /proc/<pid>/io, which is empty if it cannot be read"""
+    try:
+        with open('/proc/%s/io' % pid) as fh:
+            return dict((k, int(v)) for k, v in (line.split(':') for line in fh if ':' in line))
+    except (IOError, OSError, ValueError):
+        return {}
+
+
+def count_fds(pid):
+    try:
+        return len(os.listdir('/proc/%s/fd' % pid))
+    except OSError:
+        return 0
+
+
+def read_name(pid):
+    try:
+        with open('/proc/%s/comm' % pid) as fh:
+            return fh.read().strip()
+    except (IOError, OSError):
+        return None
+
+
+class Profile(object):
+    def __init__(self, pgid, exclude_pid):
+        self.pgid = pgid
+        self.exclude_pid = exclude_pid
+        self.num_polls = 0
+        self.sums = dict(rss_mem_kb=0, vms_mem_kb=0, num_threads=0, num_fds=0)
+        self.maxes = dict(rss_mem_kb=0, vms_mem_kb=0, num_threads=0, num_fds=0)
+        self.names = {}
+        # pid -> the last /proc/<pid>/io seen, since io counters are cumulative per process
+        self.io = {}
+
+    def sample(self):
+        totals = dict(rss_mem_kb=0, vms_mem_kb=0, num_threads=0, num_fds=0)
+        found = False
+        for pid in os.listdir('/proc'):
+            if not pid.isdigit() or int(pid) == self.exclude_pid:
+                continue
+            stat = read_stat(pid)
+            # stat[2] is the process group, stat[17] num_threads, stat[20] vsize in bytes and stat[21] rss in pages
+            if stat is None or int(stat[2]) != self.pgid:
+                continue
+            found = True
+            totals['num_threads'] += int(stat[17])
+            totals['vms_mem_kb'] += int(stat[20]) / 1024.
+            totals['rss_mem_kb'] += int(stat[21]) * PAGE_SIZE_KB
+            totals['num_fds'] += count_fds(pid)
+            self.io[pid] = read_io(pid) or self.io.get(pid, {})
+            if pid not in self.names:
+                self.names[pid] = read_name(pid)
+
+        if found:
+            self.num_polls += 1
+            for k, v in totals.items():
+                self.sums[k] += v
+                self.maxes[k] = max(self.maxes[k], v)
+
+    def summary(self, wall_time, exit_status, rusage):
+        cpu_time = rusage.ru_utime + rusage.ru_stime
+        d = dict(
+            exit_status=exit_status,
+            wall_time=wall_time,
+            cpu_time=cpu_time,
+            percent_cpu=cpu_time / wall_time if wall_time else 1,
+            user_time=rusage.ru_utime,
+            system_time=rusage.ru_stime,
+
+            io_read_count=sum(io.get('syscr', 0) for io in self.io.values()),
+            io_write_count=sum(io.get('syscw', 0) for io in self.io.values()),
+            io_read_kb=sum(io.get('read_bytes', 0) for io in self.io.values()) / 1024.,
+            io_write_kb=sum(io.get('write_bytes', 0) for io in self.io.values()) / 1024.,
+
+            ctx_switch_voluntary=rusage.ru_nvcsw,
+            ctx_switch_involuntary=rusage.ru_nivcsw,
+
+            num_polls=self.num_polls,
+            num_processes=len(self.names),
+            names=sorted(set(n for n in self.names.values() if n)),
+            pids=sorted(int(pid) for pid in self.names),
+        )
+        for k in self.sums:
+            d['avg_' + k] = self.sums[k] / float(self.num_polls) if self.num_polls else None
+            d['max_' + k] = self.maxes[k] if self.num_polls else None
+        # ru_maxrss is the peak of the largest single process, which sampling may have missed
+        d['max_rss_mem_kb'] = max(d['max_rss_mem_kb'] or 0, rusage.ru_maxrss)
+        return d
+
+
+def self_cpu_time():
+    # unlike os.times(), getrusage() is precise to the microsecond
+    r = resource.getrusage(resource.RUSAGE_SELF)
+    return r.ru_utime + r.ru_stime
+
+
+def run(cmd, output, interval, max_overhead):
+    """
+    :returns: the exit code for this script, which is the command's, or 128 + the number of the signal that
+        killed it, like a shell
+    """
+    start = time.time()
+    proc = subprocess.Popen(cmd)
+
+    # forward termination signals, although they usually reach the command by being sent to the process group
+    def forward(signum, frame):
+        try:
+            os.kill(proc.pid, signum)
+        except OSError:
+            pass
+    for sig in [signal.SIGINT, signal.SIGTERM, signal.SIGUSR1, signal.SIGUSR2]:
+        signal.signal(sig, forward)
+
+    # a thread waits for the command, so sampling can stop as soon as it exits
+    read_fd, write_fd = os.pipe()
+    result = []
+
+    def wait():
+        while True:
+            try:
+                result.append(os.wait4(proc.pid, 0))
+                break
+            except OSError as e:
+                if e.errno != errno.EINTR:
+                    raise
+        os.write(write_fd, b'\0')
+    waiter = threading.Thread(target=wait)
+    waiter.daemon = True
+    waiter.start()
+
+    profile = Profile(os.getpgrp(), os.getpid())
+    profiler_cpu_time = 0.
+    timeout = min(interval, 0.1)
+    while not result:
+        try:
+            readable, _, _ = select.select([read_fd], [], [], timeout)
+        except select.error as e:
+            # a forwarded signal interrupted the wait
+            if e.args[0] != errno.EINTR:
+                raise
+            readable = []
+        if readable or result:
+            break
+        before = self_cpu_time()
+        profile.sample()
+        sample_cpu_time = self_cpu_time() - before
+        profiler_cpu_time += sample_cpu_time
+        while sample_cpu_time > max_overhead * interval and interval < MAX_INTERVAL:
+            interval = min(interval * 2, MAX_INTERVAL)
+        timeout = interval
+    waiter.join()
+
+    _, status, rusage = result[0]
+    exit_status = os.WEXITSTATUS(status) if os.WIFEXITED(status) else -os.WTERMSIG(status)
+
+    d = profile.summary(time.time() - start, exit_status, rusage)
+    d.update(profile_interval=interval, profiler_cpu_time=profiler_cpu_time)
+    tmp = output + '.tmp'
+    with open(tmp, 'w') as fh:
+        json.dump(d, fh, indent=4, sort_keys=True)
+    os.rename(tmp, output)
+
+    return exit_status if exit_status >= 0 else 128 - exit_status
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--output', required=True, help='path of the json file to write')
+    parser.add_argument('--interval', type=float, default=1, help='seconds between samples')
+    parser.add_argument('--max-overhead', type=float, default=0.01,
+                        help='the fraction of the interval a sample may take before the interval is increased')
+    parser.add_argument('cmd', nargs=argparse.REMAINDER)
+    args = parser.parse_args()
+    cmd = args.cmd[1:] if args.cmd[:1] == ['--'] else args.cmd
+
+    sys.exit(run(cmd, args.output, args.interval, args.max_overhead))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""
+A host-wide cache of DRM queue listings (squeue, qstat or bjobs), shared through files by every Cosmos process and
+web dashboard of a user on the host, so that polling many Workflows at once doesn't overload the scheduler.
+"""
+import errno
+import fcntl
+import getpass
+import json
+import os
+import tempfile
+import time
+
+
+def default_cache_dir():
+    return os.path.join(tempfile.gettempdir(), 'cosmos-%s' % getpass.getuser())
+
+
+def epoch_seconds(dt):
+    """:returns: (float) the time.time() of a naive local datetime, ie Task.submitted_on"""
+    return time.mktime(dt.timetuple()) + dt.microsecond / 1e6
+
+
+class QueueCache(object):
+    """
+    Caches the result of a function that lists a DRM's queue, as a dict of job id -> dict of the job's fields, in a
+    json file.  The listing is fetched again once it is older than `ttl` seconds.  An exclusive flock on a lock file
+    next to it makes sure only one process on the host fetches it at a time; the others wait for it, then read its
+    result.  The file is replaced atomically, so reading it needs no lock.
+
+    An empty listing is not cached, since that is also what the listing functions return when their command fails.
+
+    :param str name: the name of the cache file, ie the DRM's name
+    :param float ttl: the most seconds a listing is used for
+    :param str cache_dir: where to keep the files.  Defaults to a directory for the user in the system's temp
+        directory.
+    """
+
+    def __init__(self, name, ttl, cache_dir=None):
+        self.ttl = ttl
+        self.cache_dir = cache_dir or default_cache_dir()
+        self.path = os.path.join(self.cache_dir, '%s_queue.json' % name)
+        self.num_fetches = 0
+        # (st_ino, st_mtime, st_size) of the file last read, and what it held
+        self._loaded_key = None
+        self._loaded = None
+
+    def get(self, fetch, job_ids=None, newer_than=None):
+        """
+        :param fetch: a callable() -> the queue listing, which is called if the cached listing is too old
+        :param job_ids: only return these jobs.  Defaults to every job in the queue.
+        :param float newer_than: a time.time().  A listing fetched before it is not used; pass the time the newest of
+            `job_ids` was submitted, so that a listing from before then isn't taken to mean the job has finished.
+        :returns: (dict) job id -> the job's fields, for the jobs in the queue
+        """
+        snapshot = self._read()
+        if not self._is_fresh(snapshot, newer_than):
+            snapshot = self._refresh(fetch, newer_than)
+
+        jobs = snapshot['jobs']
+        if job_ids is None:
+            return dict(jobs)
+        return {jid: jobs[jid] for jid in (unicode(jid) for jid in job_ids) if jid in jobs}
+
+    def _is_fresh(self, snapshot, newer_than):
+        if snapshot is None:
+            return False
+        fetched_at = snapshot['fetched_at']
+        return time.time() - fetched_at < self.ttl and (newer_than is None or fetched_at >= newer_than)
+
+    def _read(self):
+        try:
+            st = os.stat(self.path)
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
+            return None
+        key = st.st_ino, st.st_mtime, st.st_size
+        if key != self._loaded_key:
+            try:
+                with open(self.path) as fh:
+                    self._loaded = json.load(fh)
+            except (IOError, ValueError):
+                return None
+            self._loaded_key = key
+        return self._loaded
+
+    def _refresh(self, fetch, newer_than):
+        if not os.path.exists(self.cache_dir):
+            try:
+                os.makedirs(self.cache_dir, 0o700)
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+
+        with open(self.path + '.lock', 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                # another process may have fetched it while this one waited for the lock
+                snapshot = self._read()
+                if self._is_fresh(snapshot, newer_than):
+                    return snapshot
+
+                snapshot = dict(fetched_at=time.time())
+                snapshot['jobs'] = fetch()
+                self.num_fetches += 1
+                if snapshot['jobs']:
+                    fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, prefix='.queue')
+                    with os.fdopen(fd, 'w') as fh:
+                        json.dump(snapshot, fh)
+                    os.rename(tmp_path, self.path)
+                return snapshot
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
@@ -1,6 +1,13 @@
 import os
+import re
+import stat
 import subprocess
 
+try:
+    from shlex import quote
+except ImportError:
+    from pipes import quote
+
 
 class CosmosCalledProcessError(subprocess.CalledProcessError):
     """
@@ -38,7 +45,9 @@ def check_output_and_stderr(*popenargs, **kwargs):
 
 
 def convert_size_to_kb(size_str):
-    if size_str.endswith('G'):
+    if size_str.endswith('T'):
+        return float(size_str[:-1]) * 1024 * 1024 * 1024
+    elif size_str.endswith('G'):
         return float(size_str[:-1]) * 1024 * 1024
     elif size_str.endswith('M'):
         return float(size_str[:-1]) * 1024
@@ -90,3 +99,45 @@ def exit_process_group():
      usually it exists, but performs the operation of setsid()."
     """
     return os.setsid()
+
+
+def expand_index_ranges(s):
+    """
+    Expand a DRM's notation for a set of array job indices.
+
+    >>> expand_index_ranges('1-3,7,9-13:2')
+    ['1', '2', '3', '7', '9', '11', '13']
+    >>> expand_index_ranges('4-6%2')  # slurm's throttle suffix is ignored
+    ['4', '5', '6']
+    """
+    indices = []
+    for part in re.sub(r'%\d+$', '', s).split(','):
+        m = re.match(r'^(\d+)(?:-(\d+)(?::(\d+))?)?$', part.strip())
+        if m is None:
+            continue
+        first, last, step = m.groups()
+        last = last or first
+        indices.extend(str(i) for i in range(int(first), int(last) + 1, int(step or 1)))
+    return indices
+
+
+def create_array_script(specs, index_var):
+    """
+    Write a script which runs the command script of the JobSpec at index $`index_var` (starting at 1), redirecting
+    its output the same way a single job's output would be.
+
+    :returns: the path of the script, which is kept next to the first JobSpec's command script
+    """
+    path = os.path.join(os.path.dirname(specs[0].command_script_path),
+                        'array_' + os.path.basename(specs[0].command_script_path))
+    with open(path, 'w') as fh:
+        fh.write('#!/bin/bash\n'
+                 'case "${%s}" in\n' % index_var)
+        for i, spec in enumerate(specs, 1):
+            fh.write('%d) exec %s > %s 2> %s ;;\n' % (i, quote(spec.command_script_path),
+                                                      quote(spec.stdout_path), quote(spec.stderr_path)))
+        fh.write('*) echo "unknown array index ${%s}" >&2; exit 1 ;;\n'
+                 'esac\n' % index_var)
+
+    os.chmod(path, os.stat(path).st_mode | stat.S_IEXEC)
+    return path
@@ -0,0 +1,109 @@
+"""
+How often JobManager polls each DRM for finished Tasks, and a record of the polls it made.
+"""
+import datetime
+from collections import Counter, defaultdict
+
+
+class PollPolicy(object):
+    """
+    Decides how long JobManager waits before polling a DRM again.  This one polls every ``DRM.poll_interval``
+    seconds; subclass it and override :meth:`next_interval` to poll differently.
+    """
+
+    def next_interval(self, drm, running_tasks, num_finished, now=None):
+        """
+        Called after every poll of `drm`.
+
+        :param drm: the DRM that was polled
+        :param list running_tasks: the Tasks still running on `drm`
+        :param int num_finished: the number of Tasks the poll found finished
+        :param datetime.datetime now: the current time
+        :returns: (float) seconds to wait before polling `drm` again
+        """
+        return drm.poll_interval
+
+
+class AdaptivePollPolicy(PollPolicy):
+    """
+    Polls a DRM often while its Tasks are expected to finish, and backs off while they aren't.
+
+    A Task is expected to finish within `tolerance` of its estimated wall time after ``Task.submitted_on``.  While
+    any Task is in that window the DRM is polled every ``DRM.poll_interval`` seconds.  Otherwise the interval doubles
+    (by `backoff`) after each poll that found nothing finished, up to `max_interval`, but never past the time the next
+    Task's window opens.  Without estimates, or once every Task has overrun its window, this is plain exponential
+    backoff, which starts again from ``DRM.poll_interval`` whenever a poll finds finished Tasks.
+
+    :param float max_interval: the most seconds to wait between polls
+    :param float backoff: the interval is multiplied by this after each poll that found no finished Tasks
+    :param float tolerance: Tasks are expected to finish between (1 - tolerance) and (1 + tolerance) times their
+        estimated wall time
+    :param estimate: a callable(task) -> its expected wall time in seconds, or None.  If None, Workflow.run uses the
+        mean wall time of Stages with the same name in the database, or its `runtime_estimates`.
+    """
+
+    def __init__(self, max_interval=60, backoff=2, tolerance=0.5, estimate=None):
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.tolerance = tolerance
+        self.estimate = estimate
+        # DRM name -> its current backoff interval
+        self._intervals = dict()
+
+    def next_interval(self, drm, running_tasks, num_finished, now=None):
+        if num_finished:
+            interval = drm.poll_interval
+        else:
+            interval = min(self._intervals.get(drm.name, drm.poll_interval) * self.backoff, self.max_interval)
+        self._intervals[drm.name] = interval
+
+        until_window = self.seconds_until_expected(running_tasks, now)
+        if until_window is not None:
+            interval = min(interval, until_window)
+        return max(drm.poll_interval, interval)
+
+    def seconds_until_expected(self, tasks, now=None):
+        """
+        :returns: (float) 0 if any of `tasks` is expected to be finishing now, else the seconds until the next one
+            is, or None if none of them are
+        """
+        if self.estimate is None:
+            return None
+        now = now or datetime.datetime.now()
+        waits = []
+        for task in tasks:
+            estimate = self.estimate(task)
+            if estimate is not None and task.submitted_on is not None:
+                elapsed = (now - task.submitted_on).total_seconds()
+                if elapsed <= estimate * (1 + self.tolerance):
+                    waits.append(max(0, estimate * (1 - self.tolerance) - elapsed))
+        return min(waits) if waits else None
+
+
+class PollMetrics(object):
+    """Counts the polls of each DRM, the finished Tasks they found, and how long they took"""
+
+    def __init__(self):
+        self.polls = Counter()
+        self.empty_polls = Counter()
+        self.finished = Counter()
+        self.seconds = defaultdict(float)
+        self.max_seconds = defaultdict(float)
+
+    def record(self, drm_name, num_finished, seconds):
+        self.polls[drm_name] += 1
+        if not num_finished:
+            self.empty_polls[drm_name] += 1
+        self.finished[drm_name] += num_finished
+        self.seconds[drm_name] += seconds
+        self.max_seconds[drm_name] = max(self.max_seconds[drm_name], seconds)
+
+    def report(self):
+        """:returns: (str) a table of the polls of each DRM"""
+        lines = ['%-8s %8s %8s %10s %12s %12s' % ('drm', 'polls', 'empty', 'finished', 'mean_secs', 'max_secs')]
+        for drm_name in sorted(self.polls):
+            polls = self.polls[drm_name]
+            lines.append('%-8s %8d %8d %10d %12.3f %12.3f' % (drm_name, polls, self.empty_polls[drm_name],
+                                                              self.finished[drm_name], self.seconds[drm_name] / polls,
+                                                              self.max_seconds[drm_name]))
+        return '\n'.join(lines)
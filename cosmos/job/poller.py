@@ -0,0 +1,111 @@
+"""
+Polls DRMs from background threads, so that a DRM whose status commands are slow (ie squeue on a busy cluster) does
+not hold up noticing that Tasks on other DRMs have finished.
+"""
+import errno
+import fcntl
+import os
+import Queue
+import sys
+import threading
+import time
+
+import six
+
+from cosmos.job.drm.DRM_Base import TaskSnapshot
+
+
+def _nonblocking_pipe():
+    r, w = os.pipe()
+    for fd in (r, w):
+        fcntl.fcntl(fd, fcntl.F_SETFL, fcntl.fcntl(fd, fcntl.F_GETFL) | os.O_NONBLOCK)
+    return r, w
+
+
+class _PollThread(threading.Thread):
+    """Calls DRM.filter_is_done with the TaskSnapshots it is sent, and puts the results on a queue"""
+
+    def __init__(self, drm, results, wakeup_w):
+        super(_PollThread, self).__init__(name='cosmos_poll_%s' % drm.name)
+        self.daemon = True
+        self.drm = drm
+        self.requests = Queue.Queue()
+        self.results = results
+        self.wakeup_w = wakeup_w
+
+    def run(self):
+        while True:
+            snapshots = self.requests.get()
+            if snapshots is None:
+                return
+            with self.drm.lock:
+                start = time.time()
+                try:
+                    done, exc_info = list(self.drm.filter_is_done(snapshots)), None
+                except Exception:
+                    done, exc_info = [], sys.exc_info()
+            self.results.put((self.drm, snapshots, done, time.time() - start, exc_info))
+            try:
+                os.write(self.wakeup_w, b'\0')
+            except OSError as e:
+                # the pipe is full, so the JobManager is already due to wake up
+                if e.errno != errno.EAGAIN:
+                    raise
+
+
+class ConcurrentPoller(object):
+    """
+    Polls each DRM from its own thread.  A DRM has at most one poll in progress, and is sent detached
+    :class:`cosmos.job.drm.DRM_Base.TaskSnapshot` s of its running Tasks, so nothing but the thread that runs the
+    Workflow touches the database.  A poll holds ``DRM.lock``, which JobManager also holds while submitting to or
+    killing the jobs of the DRM, since those change the state the DRM keeps about its jobs.  Finished polls are put on a queue and make :attr:`wakeup_fd` readable, which
+    JobManager.wait() selects on along with the DRMs' own wakeup_fds.
+    """
+
+    def __init__(self):
+        self.results = Queue.Queue()
+        self.wakeup_fd, self._wakeup_w = _nonblocking_pipe()
+        self._threads = dict()
+        # DRM name -> (the TaskSnapshots, {TaskSnapshot: Task}) of the poll in progress
+        self._polling = dict()
+
+    def is_polling(self, drm):
+        return drm.name in self._polling
+
+    def poll(self, drm, tasks):
+        """Start polling `tasks` on `drm` in the background"""
+        assert not self.is_polling(drm), '%s is already being polled' % drm.name
+        if drm.name not in self._threads:
+            self._threads[drm.name] = _PollThread(drm, self.results, self._wakeup_w)
+            self._threads[drm.name].start()
+        tasks_by_snapshot = {TaskSnapshot(task): task for task in tasks}
+        snapshots = list(tasks_by_snapshot)
+        self._polling[drm.name] = snapshots, tasks_by_snapshot
+        self._threads[drm.name].requests.put(snapshots)
+
+    def finished_polls(self):
+        """
+        Yield the polls that have finished since the last call.  Exceptions raised by a DRM while polling are raised
+        here.
+
+        :returns: (generator) (drm, [(task, job_info_dict), ...], seconds the poll took) tuples
+        """
+        while True:
+            try:
+                drm, snapshots, done, seconds, exc_info = self.results.get_nowait()
+            except Queue.Empty:
+                return
+            if drm.name not in self._polling or self._polling[drm.name][0] is not snapshots:
+                # a poll from before stop() was called
+                continue
+            _, tasks_by_snapshot = self._polling.pop(drm.name)
+            if exc_info is not None:
+                six.reraise(*exc_info)
+            yield drm, [(tasks_by_snapshot[snapshot], job_info_dict) for snapshot, job_info_dict in done], seconds
+
+    def stop(self):
+        """Stop the threads once they finish their current poll, whose results are discarded"""
+        for thread in self._threads.values():
+            thread.requests.put(None)
+        self._threads.clear()
+        self._polling.clear()
@@ -7,9 +7,9 @@ from sqlalchemy.ext.declarative import declared_attr
 from flask import url_for
 
 from cosmos.db import Base
-from cosmos.util.sqla import Enum_ColumnType
+from cosmos.util.sqla import Enum_ColumnType, CollectionIndex, delete_ids
+from cosmos.models.Task import Task
 from cosmos import StageStatus, signal_stage_status_change, TaskStatus
-import networkx as nx
 import datetime
 
 
@@ -30,7 +30,7 @@ def stage_status_changed(stage):
 class StageEdge(Base):
     __tablename__ = 'stage_edge'
     parent_id = Column(Integer, ForeignKey('stage.id', ondelete="CASCADE"), primary_key=True)
-    child_id = Column(Integer, ForeignKey('stage.id', ondelete="CASCADE"), primary_key=True)
+    child_id = Column(Integer, ForeignKey('stage.id', ondelete="CASCADE"), primary_key=True, index=True)
 
     def __init__(self, parent=None, child=None):
         self.parent = parent
@@ -125,25 +125,27 @@ class Stage(Base):
         :return: None
         """
 
+        session, workflow = self.session, self.workflow
         if descendants:
             stages_to_delete = self.descendants(include_self=False)
             self.log.info('Deleting %s and all of its descendants: %s' % (self, stages_to_delete))
-            for stage in stages_to_delete:
-                self.session.delete(stage)
-            self.session.delete(self)
+            stage_ids = [self.id] + [s.id for s in stages_to_delete]
         else:
             self.log.info('Deleting %s' % self)
-            self.session.delete(self)
+            stage_ids = [self.id]
 
-        self.session.commit()
+        # their Tasks and edges are deleted by ON DELETE CASCADE
+        delete_ids(session, Stage, stage_ids)
+        workflow._task_dag = None
+        session.commit()
 
     def filter_tasks(self, **filter_by):
         return (t for t in self.tasks if all(t.params.get(k, None) == v for k, v in filter_by.items()))
 
     def get_task(self, uid, default='ERROR@#$'):
-        for task in self.tasks:
-            if task.uid == uid:
-                return task
+        task = tasks_by_uid.get(self).get(uid)
+        if task is not None:
+            return task
 
         if default == 'ERROR@#$':
             raise KeyError('Task with uid %s does not exist' % uid)
@@ -164,7 +166,8 @@ class Stage(Base):
         """
         :return: (list) all stages that descend from this stage in the stage_graph
         """
-        x = nx.descendants(self.workflow.stage_graph(), self)
+        descendant_ids = self.workflow.stage_dag().descendants(self.id)
+        x = {s for s in self.workflow.stages if s.id in descendant_ids}
         if include_self:
             return sorted({self}.union(x), key=lambda stage: stage.number)
         else:
@@ -176,3 +179,6 @@ class Stage(Base):
 
     def __repr__(self):
         return '<Stage[%s] %s>' % (self.id or '', self.name)
+
+
+tasks_by_uid = CollectionIndex(Stage.tasks, Task.uid, 'stage')
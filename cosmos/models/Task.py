@@ -1,15 +1,14 @@
 import os
 import codecs
-import networkx as nx
 import subprocess as sp
 from sqlalchemy.orm import relationship, synonym, backref
 from sqlalchemy.ext.declarative import declared_attr
-from sqlalchemy.schema import Column, ForeignKey, UniqueConstraint
+from sqlalchemy.schema import Column, ForeignKey, UniqueConstraint, Index
 from sqlalchemy.types import Boolean, Integer, String, DateTime, BigInteger
 from flask import url_for
 
 from cosmos.db import Base
-from cosmos.util.sqla import Enum_ColumnType, MutableDict, JSONEncodedDict, ListOfStrings, MutableList
+from cosmos.util.sqla import Enum_ColumnType, MutableDict, JSONEncodedDict, ListOfStrings, MutableList, delete_ids
 from cosmos import TaskStatus, StageStatus, signal_task_status_change
 from cosmos.util.helpers import wait_for_file
 
@@ -131,7 +130,7 @@ class TaskEdge(Base):
     __tablename__ = 'task_edge'
     # id = Column(Integer, primary_key=True)
     parent_id = Column(Integer, ForeignKey('task.id', ondelete="CASCADE"), primary_key=True)
-    child_id = Column(Integer, ForeignKey('task.id', ondelete="CASCADE"), primary_key=True)
+    child_id = Column(Integer, ForeignKey('task.id', ondelete="CASCADE"), primary_key=True, index=True)
 
     def __init__(self, parent=None, child=None):
         self.parent = parent
@@ -150,7 +149,9 @@ class Task(Base):
     A job that gets executed.  Has a unique set of params within its Stage.
     """
     # FIXME causes a problem with mysql?
-    __table_args__ = (UniqueConstraint('stage_id', 'uid', name='_uc1'),)
+    __table_args__ = (UniqueConstraint('stage_id', 'uid', name='_uc1'),
+                      # the web dashboard lists and counts the Tasks of a Stage by status
+                      Index('ix_task_stage_id_status', 'stage_id', '_status'))
 
     id = Column(Integer, primary_key=True)
     uid = Column(String(255), index=True)
@@ -186,6 +187,11 @@ class Task(Base):
     input_map = Column(MutableDict.as_mutable(JSONEncodedDict), nullable=False, server_default='{}')
     output_map = Column(MutableDict.as_mutable(JSONEncodedDict), nullable=False, server_default='{}')
 
+    @property
+    def resource_req(self):
+        """the custom consumable resources this Task uses, stored in Task.extra, ex ``{'gpu': 1}``"""
+        return (self.extra or {}).get('resource_req', {})
+
     @property
     def input_files(self):
         return self.input_map.values()
@@ -294,7 +300,8 @@ class Task(Base):
         """
         :return: (list) all stages that descend from this stage in the stage_graph
         """
-        x = nx.descendants(self.workflow.task_graph(), self)
+        descendant_ids = self.workflow.task_dag().descendants(self.id)
+        x = {t for t in self.workflow.tasks if t.id in descendant_ids}
         if include_self:
             return sorted({self}.union(x), key=lambda task: task.stage.number)
         else:
@@ -314,16 +321,23 @@ class Task(Base):
         return urllib.urlencode(self.params)
 
     def delete(self, descendants=False):
+        """
+        Deletes this Task, and its edges.  The rows are deleted by id, without loading the Tasks.
+
+        :param descendants: Also delete every Task that depends on this one
+        """
+        session = self.session
+        task_dag = self.workflow.task_dag()
         if descendants:
-            tasks_to_delete = self.descendants(include_self=True)
-            self.log.debug('Deleting %s and %s of its descendants' % (self, len(tasks_to_delete) - 1))
-            for t in tasks_to_delete:
-                self.session.delete(t)
+            task_ids = task_dag.remove_with_descendants(self.id)
+            self.log.debug('Deleting %s and %s of its descendants' % (self, len(task_ids) - 1))
         else:
+            task_dag.remove(self.id)
+            task_ids = [self.id]
             self.log.debug('Deleting %s' % self)
-            self.session.delete(self)
 
-        self.session.commit()
+        delete_ids(session, Task, task_ids)
+        session.commit()
 
     @property
     def url(self):
@@ -3,13 +3,16 @@ Tools for defining, running and terminating Cosmos workflows.
 """
 
 import atexit
+import contextlib
 import datetime
 import getpass
 import os
 import re
+import signal
 import sys
-import time
+import threading
 import types
+from collections import defaultdict
 
 import funcsigs
 
@@ -21,16 +24,24 @@ from sqlalchemy.types import Boolean, Integer, String, DateTime, VARCHAR
 from sqlalchemy.orm import validates, synonym, relationship
 from flask import url_for
 import networkx as nx
-from networkx.algorithms.dag import descendants, topological_sort
+from networkx.algorithms.dag import topological_sort
 
 from cosmos.util.iterstuff import only_one
 from cosmos.util.helpers import duplicates, get_logger, mkdir
-from cosmos.util.sqla import Enum_ColumnType, MutableDict, JSONEncodedDict
+from cosmos.util.sqla import Enum_ColumnType, MutableDict, JSONEncodedDict, CollectionIndex, bulk_insert_pending, \
+    WriteBehind
+from cosmos.util.event_log import EventLog
+from cosmos.util.timing import PhaseTimings, NullTimings
 from cosmos.db import Base
 from cosmos.core.cmd_fxn import signature
+from cosmos.core.scheduler import TaskQueue, ResourceLimits, critical_path_lengths
+from cosmos.core.history import runtime_estimator, input_size_kb
+from cosmos.graph.dag import DAG
+from cosmos.job.poll_policy import AdaptivePollPolicy
 
-from cosmos import TaskStatus, StageStatus, WorkflowStatus, signal_workflow_status_change
-from cosmos.models.Task import Task
+from cosmos import TaskStatus, StageStatus, WorkflowStatus, signal_workflow_status_change, signal_run_loop
+from cosmos.models.Task import Task, TaskEdge
+from cosmos.models.Stage import Stage, StageEdge
 
 opj = os.path.join
 
@@ -76,6 +87,13 @@ class Workflow(Base):
     exclude_from_dict = ['info']
     dont_garbage_collect = None
     termination_signal = None
+    resource_limits = None
+    #: The :class:`cosmos.util.event_log.EventLog` of the running Workflow, if Workflow.run was given an `event_log`
+    event_log = None
+    #: The :class:`cosmos.util.timing.PhaseTimings` of the running Workflow, if Workflow.run was given `timings`
+    timings = NullTimings()
+    #: If set to a :class:`cosmos.api.ResourcePredictor`, add_task predicts the requirements of new Tasks
+    resource_predictor = None
 
     @declared_attr
     def status(cls):
@@ -113,6 +131,8 @@ class Workflow(Base):
         if not self.created_on:
             self.created_on = datetime.datetime.now()
         self.dont_garbage_collect = []
+        self._task_parent_ids = None
+        self._task_dag = None
 
     @property
     def log(self):
@@ -143,10 +163,13 @@ class Workflow(Base):
 
     def add_task(self, func, params=None, parents=None, stage_name=None, uid=None, drm=None,
                  queue=None, must_succeed=True, time_req=None, core_req=None, mem_req=None,
-                 max_attempts=None, noop=False):
+                 max_attempts=None, noop=False, resource_req=None):
         """
         Adds a new Task to the Workflow.  If the Task already exists (and was successful), return the successful Task stored in the database
 
+        If :attr:`resource_predictor` is set, time_req, core_req and mem_req are predicted from previous runs of Stages
+        with the same name, unless they are given here, in `params` or as a default in the signature of `func`.
+
         :param callable func: A function which returns a string which will get converted to a shell script to be executed.  `func` will not get called until
           all of its dependencies have completed.
         :param dict params: Parameters to `func`.  Must be jsonable so that it can be stored in the database.  Any Dependency objects will get resolved into
@@ -165,9 +188,10 @@ class Workflow(Base):
         :param int mem_req: Number of MB of RAM required for this Task.   Can also be set in the `params` dict or the default value of the Task function signature, but this value takes predence.
             Warning!  In future versions, this will be the only way to set it.
         :param int max_attempts: The maximum number of times to retry a failed job.  Defaults to the `default_max_attempts` parameter of :meth:`Cosmos.start`
+        :param dict resource_req: The amount of custom consumable resources this Task uses, ex ``{'gpu': 1}``.  They
+            are limited by the `resources` parameter of :meth:`Workflow.run`.
         :rtype: cosmos.api.Task
         """
-        from cosmos.models.Stage import Stage
         from cosmos import recursive_resolve_dependency
 
         # parents
@@ -200,7 +224,7 @@ class Workflow(Base):
             stage_name = str(func.__name__)
 
         # Get the right Stage
-        stage = only_one((s for s in self.stages if s.name == stage_name), None)
+        stage = stages_by_name.get(self).get(stage_name)
         if stage is None:
             stage = Stage(workflow=self, name=stage_name, status=StageStatus.no_attempt)
             self.session.add(stage)
@@ -212,8 +236,14 @@ class Workflow(Base):
             # if task is already in stage, but unsuccessful, raise an error (duplicate params) since unsuccessful tasks
             # were already removed on workflow load
             if task.successful:
-                # If the user manually edited the dag and this a resume, parents might need to be-readded
-                task.parents.extend(set(parents).difference(set(task.parents)))
+                # If the user manually edited the dag and this a resume, parents might need to be-readded.  Check
+                # the ids of its parents in the database first, so that task.parents is only loaded if it changed.
+                parent_ids = self.task_parent_ids()[task.id] if parents else set()
+                new_parents = [p for p in parents if p.id is None or p.id not in parent_ids]
+                if new_parents:
+                    task.parents.extend(set(new_parents).difference(set(task.parents)))
+                    self._task_dag = None
+                    parent_ids.update(p.id for p in new_parents if p.id is not None)
 
                 for p in parents:
                     if p.stage not in stage.parents:
@@ -231,12 +261,11 @@ class Workflow(Base):
             def params_or_signature_default_or(name, default):
                 if name in params:
                     return params[name]
-                if name in sig.parameters:
-                    param_default = sig.parameters[name].default
-                    if param_default is funcsigs._empty:
-                        return default
-                    else:
-                        return param_default
+                # a default the author of `func` chose explicitly takes precedence over a prediction
+                if name in sig.parameters and sig.parameters[name].default is not funcsigs._empty:
+                    return sig.parameters[name].default
+                if name in predicted:
+                    return predicted[name]
                 return default
 
             input_map = dict()
@@ -252,6 +281,17 @@ class Workflow(Base):
                     assert v != funcsigs._empty, 'parameter %s for %s is required' % (param, func)
                     output_map[keyword] = v
 
+            extra = dict()
+            if resource_req:
+                extra['resource_req'] = resource_req
+            if self.resource_predictor is not None:
+                size_kb = input_size_kb(input_map)
+                if size_kb is not None:
+                    extra['input_size_kb'] = size_kb
+                predicted = self.resource_predictor.predict(stage_name, size_kb)
+            else:
+                predicted = dict()
+
             task = Task(stage=stage,
                         params=params,
                         parents=parents,
@@ -263,7 +303,8 @@ class Workflow(Base):
                         must_succeed=must_succeed,
                         core_req=core_req if core_req is not None else params_or_signature_default_or('core_req', 1),
                         mem_req=mem_req if mem_req is not None else params_or_signature_default_or('mem_req', None),
-                        time_req=time_req,
+                        time_req=time_req if time_req is not None else predicted.get('time_req'),
+                        extra=extra,
                         successful=False,
                         max_attempts=max_attempts if max_attempts is not None else self.cosmos_app.default_max_attempts,
                         attempt=1,
@@ -271,6 +312,7 @@ class Workflow(Base):
                         )
 
             task.cmd_fxn = func
+            self._task_dag = None
 
         # Add Stage Dependencies
         for p in parents:
@@ -283,11 +325,49 @@ class Workflow(Base):
 
     def run(self, max_cores=None, dry=False, set_successful=True,
             cmd_wrapper=signature.default_cmd_fxn_wrapper,
-            log_out_dir_func=default_task_log_output_dir):
+            log_out_dir_func=default_task_log_output_dir,
+            max_mem=None, resources=None, starvation_time=4 * 60 * 60, priority='id', runtime_estimates=None, flush_interval=0, flush_size=1000,
+            concurrent_polling=False, poll_policy=None, event_log=None, timings=False, cprofile=None):
         """
         Runs this Workflow's DAG
 
         :param int max_cores: The maximum number of cores to use at once.  A value of None indicates no maximum.
+        :param int max_mem: The maximum amount of memory (the sum of Task.mem_req, in MB) to use at once.  A value of
+            None indicates no maximum.
+        :param dict resources: The amount available of custom consumable resources, which Tasks request with
+            Workflow.add_task(..., resource_req={'gpu': 1}).  ex: ``{'gpu': 4, 'scratch_gb': 500}``
+        :param float starvation_time: When resources are limited, the seconds a ready Task can be passed over for
+            smaller Tasks that fit before the resources it needs are reserved for it.  See
+            :class:`cosmos.core.scheduler.ResourceLimits`.
+        :param str priority: The order ready Tasks are submitted in when resources are limited.  'id' submits Tasks in
+            the order they were added.  'critical_path' submits the Tasks with the longest (estimated) path of
+            dependent Tasks after them first, which shortens the Workflow when long chains of Tasks compete with many
+            short independent ones.
+        :param runtime_estimates: The estimated wall time in seconds of Tasks for the 'critical_path' priority, as a
+            dict of stage name -> seconds or a callable(task) -> seconds (or None).  Stages without an estimate use
+            the mean wall time of previously successful Tasks of Stages with the same name in the database.
+        :param float flush_interval: The most seconds to hold Task and Stage status changes in memory before
+            committing them, so that they are written in fewer, larger transactions.  0 commits after every batch of
+            submitted or finished Tasks.  If the process is killed (SIGKILL) or crashes, changes from the last
+            `flush_interval` seconds are lost, and the Tasks that finished in that time are run again when the
+            Workflow is resumed.  See :class:`cosmos.util.sqla.WriteBehind`.
+        :param int flush_size: Commit sooner once this many Tasks and Stages have changed.
+        :param bool concurrent_polling: Poll each DRM from its own thread, so that Tasks on a DRM with a short
+            poll_interval are noticed as soon as they finish even while another DRM is slow to respond.  Only useful
+            when Tasks use more than one DRM.
+        :param poll_policy: A :class:`cosmos.job.poll_policy.PollPolicy`, which decides how long to wait before polling
+            each DRM again.  Defaults to every ``DRM.poll_interval`` seconds.  An
+            :class:`cosmos.job.poll_policy.AdaptivePollPolicy` without an `estimate` uses the same estimates as the
+            'critical_path' priority.
+        :param str event_log: A path to append a structured log of the run to, one json object per line, which records
+            when Tasks are submitted, finish, are retried or killed, and every poll of a DRM and change in the number of
+            queued and running Tasks.  See :class:`cosmos.util.event_log.EventLog`.
+        :param bool timings: Time each phase of the run loop itself (building the DAG, calling cmd_fxns, writing
+            command scripts, submitting, polling, signal handlers, committing, ...), and log a table of the calls,
+            total time and percentiles of each when the Workflow finishes.  See
+            :class:`cosmos.util.timing.PhaseTimings`.
+        :param str cprofile: A path to write cProfile stats of this thread's run to when the Workflow finishes or is
+            terminated, for ``python -m pstats``, snakeviz, etc.  Implies `timings`.
         :param int max_attempts: The maximum number of times to retry a failed job.
              Can be overridden with on a per-Task basis with Workflow.add_task(..., max_attempts=N, ...)
         :param callable log_out_dir_func: A function that returns a Task's logging directory (must be unique).
@@ -309,18 +389,29 @@ class Workflow(Base):
         assert self.session, 'Workflow must be part of a sqlalchemy session'
 
         session = self.session
+        self.timings = PhaseTimings(cprofile) if timings or cprofile else NullTimings()
+        self.timings.start()
         self.log.info('Preparing to run %s using DRM `%s`, cwd is `%s`' % (
             self, self.cosmos_app.default_drm, os.getcwd()))
         self.log.info('Running as %s@%s, pid %s' % (getpass.getuser(), os.uname()[1], os.getpid()))
 
+        assert priority in ('id', 'critical_path'), 'unknown priority `%s`' % priority
+
         self.max_cores = max_cores
+        capacity = dict(resources or {}, cores=max_cores, mem=max_mem)
+        self.resource_limits = ResourceLimits(capacity, starvation_time) \
+            if any(v is not None for v in capacity.values()) else None
 
         from ..job.JobManager import JobManager
 
         if self.jobmanager is None:
             self.jobmanager = JobManager(get_submit_args=self.cosmos_app.get_submit_args,
                                          cmd_wrapper=cmd_wrapper,
-                                         log_out_dir_func=log_out_dir_func)
+                                         log_out_dir_func=log_out_dir_func,
+                                         drm_options=self.cosmos_app.drm_options,
+                                         concurrent_polling=concurrent_polling,
+                                         poll_policy=poll_policy)
+        self.jobmanager.timings = self.timings
 
         self.status = WorkflowStatus.running
         self.successful = False
@@ -328,49 +419,92 @@ class Workflow(Base):
         if self.started_on is None:
             self.started_on = datetime.datetime.now()
 
-        task_graph = self.task_graph()
-        stage_graph = self.stage_graph()
+        with self.timings.phase('stage_graph'):
+            stage_graph = self.stage_graph()
 
-        assert len(set(self.stages)) == len(self.stages), 'duplicate stage name detected: %s' % (
-            next(duplicates(self.stages)))
+            assert len(set(self.stages)) == len(self.stages), 'duplicate stage name detected: %s' % (
+                next(duplicates(self.stages)))
 
-        # renumber stages
-        stage_graph_no_cycles = nx.DiGraph()
-        stage_graph_no_cycles.add_nodes_from(stage_graph.nodes())
-        stage_graph_no_cycles.add_edges_from(stage_graph.edges())
-        for cycle in nx.simple_cycles(stage_graph):
-            stage_graph_no_cycles.remove_edge(cycle[-1], cycle[0])
-        for i, s in enumerate(topological_sort(stage_graph_no_cycles)):
-            s.number = i + 1
-            if s.status != StageStatus.successful:
-                s.status = StageStatus.no_attempt
+            # renumber stages
+            stage_graph_no_cycles = nx.DiGraph()
+            stage_graph_no_cycles.add_nodes_from(stage_graph.nodes())
+            stage_graph_no_cycles.add_edges_from(stage_graph.edges())
+            for cycle in nx.simple_cycles(stage_graph):
+                stage_graph_no_cycles.remove_edge(cycle[-1], cycle[0])
+            for i, s in enumerate(topological_sort(stage_graph_no_cycles)):
+                s.number = i + 1
+                if s.status != StageStatus.successful:
+                    s.status = StageStatus.no_attempt
 
         # Make sure everything is in the sqlalchemy session
         session.add(self)
-        successful = filter(lambda t: t.successful, task_graph.nodes())
+        tasks = self.tasks
+        successful = filter(lambda t: t.successful, tasks)
 
         # print stages
         for s in sorted(self.stages, key=lambda s: s.number):
             self.log.info('%s %s' % (s, s.status))
 
-        # Create Task Queue
-        task_queue = _copy_graph(task_graph)
         self.log.info('Skipping %s successful tasks...' % len(successful))
-        task_queue.remove_nodes_from(successful)
 
         handle_exits(self)
 
-        if self.max_cores is not None:
-            self.log.info('Ensuring there are enough cores...')
-            # make sure we've got enough cores
-            for t in task_queue:
-                assert int(t.core_req) <= self.max_cores, '%s requires more cpus (%s) than `max_cores` (%s)' % (t, t.core_req, self.max_cores)
+        if self.resource_limits is not None:
+            self.log.info('Ensuring there are enough resources (%s)...' % self.resource_limits)
+            # make sure we've got enough cores, memory, etc.
+            for t in tasks:
+                if not t.successful:
+                    self.resource_limits.check(t)
 
         # Run this thing!
         self.log.info('Committing to SQL db...')
-        session.commit()
+        # new Stages, Tasks and their edges are inserted in bulk, which is much faster than a flush for large DAGs
+        with self.timings.phase('insert'):
+            # in the order the Tasks were added, as a flush would
+            num_rows = bulk_insert_pending(session, self.stages + self.dont_garbage_collect)
+            session.commit()
+        self.log.info('Inserted %s rows' % num_rows)
+
+        # Create Task Queue.  This happens after the commit, since new Tasks are ordered by their id, and the DAG is
+        # read from the database.
+        self._task_dag = None
+        with self.timings.phase('task_dag'):
+            task_dag = self.task_dag()
+        unsuccessful = [t for t in tasks if not t.successful]
+        poll_policy = self.jobmanager.poll_policy
+        if isinstance(poll_policy, AdaptivePollPolicy) and poll_policy.estimate is None:
+            poll_policy.estimate = runtime_estimator(session, unsuccessful, runtime_estimates)
+        with self.timings.phase('task_queue'):
+            if priority == 'critical_path':
+                estimate = runtime_estimator(session, unsuccessful, runtime_estimates)
+                path_lengths = critical_path_lengths(unsuccessful, task_dag, estimate)
+                self.log.info('Longest path of Tasks is estimated to take %s' %
+                              datetime.timedelta(seconds=int(max(path_lengths.values() or [0]))))
+                key = lambda t: (-path_lengths[t], t.id)
+                if self.resource_limits is not None:
+                    self.resource_limits.key = key
+                task_queue = TaskQueue(unsuccessful, task_dag, key=key)
+            else:
+                task_queue = TaskQueue(unsuccessful, task_dag)
+
         if not dry:
-            _run(self, session, task_queue)
+            self.write_behind = WriteBehind(session, flush_interval, flush_size)
+            if event_log is not None:
+                self.event_log = EventLog(event_log, self).connect()
+                self.event_log.record('workflow', id=self.id, name=self.name, status=self.status.name)
+            try:
+                with _terminate_on_sigterm(self, enabled=flush_interval > 0):
+                    _run(self, session, task_queue)
+            except:
+                if self.event_log is not None:
+                    # its signal receivers would otherwise record the events of the next run in this process too
+                    self.event_log.close()
+                    self.event_log = None
+                raise
+            if self.event_log is not None:
+                self.event_log.flush()
+            if self.jobmanager.poll_metrics.polls:
+                self.log.info('DRM polls:\n%s' % self.jobmanager.poll_metrics.report())
 
             # set status
             if self.status == WorkflowStatus.failed_but_running:
@@ -379,17 +513,22 @@ class Workflow(Base):
                 for s in self.stages:
                     if s.status == StageStatus.running_but_failed:
                         s.status = StageStatus.failed
-                session.commit()
-                return False
+                rv = False
             elif self.status == WorkflowStatus.running:
                 if set_successful:
                     self.status = WorkflowStatus.successful
-                session.commit()
-                return True
+                rv = True
             else:
                 self.log.warning('%s exited with status "%s"', self, self.status)
-                session.commit()
-                return False
+                rv = False
+            session.commit()
+            if self.event_log is not None:
+                self.event_log.close()
+                self.event_log = None
+            self.timings.stop()
+            if self.timings.enabled:
+                self.log.info('Controller timings:\n%s' % self.timings.report())
+            return rv
         else:
             self.log.info('Workflow dry run is complete')
             return None
@@ -407,12 +546,64 @@ class Workflow(Base):
             self.status = WorkflowStatus.killed
 
         self.session.commit()
+        if self.event_log is not None:
+            self.event_log.flush()
+        self.timings.stop()
 
     @property
     def tasks(self):
         return [t for s in self.stages for t in s.tasks]
         # return session.query(Task).join(Stage).filter(Stage.workflow == ex).all()
 
+    def task_parent_ids(self):
+        """
+        :returns: (dict) Task id -> set of the ids of its parents, for the Tasks in the database.  It is loaded with a
+            single query the first time it is needed, which is much cheaper than loading Task.parents for every Task.
+        """
+        if self._task_parent_ids is None:
+            q = self.session.query(TaskEdge.parent_id, TaskEdge.child_id) \
+                .join(Task, Task.id == TaskEdge.parent_id) \
+                .join(Stage, Stage.id == Task.stage_id) \
+                .filter(Stage.workflow_id == self.id)
+            self._task_parent_ids = defaultdict(set)
+            # Task.parents are stored as (parent_id=task id, child_id=parent id)
+            for task_id, parent_id in q:
+                self._task_parent_ids[task_id].add(parent_id)
+        return self._task_parent_ids
+
+    def task_dag(self):
+        """
+        :returns: (cosmos.graph.dag.DAG) a DAG of the ids of the Tasks in the database.  It is read with two queries
+            and is much smaller than :meth:`task_graph`, which loads the children of every Task.  It is kept until
+            Tasks or their parents are added, so that finding the descendants of many Tasks, ie to delete them,
+            doesn't read the DAG every time.  Tasks deleted by :meth:`Task.delete` are removed from it.
+        """
+        if self._task_dag is None:
+            task_ids = self.session.query(Task.id) \
+                .join(Stage, Stage.id == Task.stage_id) \
+                .filter(Stage.workflow_id == self.id)
+            self._task_dag = DAG((task_id for task_id, in task_ids), self._task_edges())
+        return self._task_dag
+
+    def _task_edges(self):
+        """:returns: (Query) (parent id, child id) of every edge between Tasks in the database"""
+        # Task.parents are stored as (parent_id=task id, child_id=parent id)
+        return self.session.query(TaskEdge.child_id, TaskEdge.parent_id) \
+            .join(Task, Task.id == TaskEdge.parent_id) \
+            .join(Stage, Stage.id == Task.stage_id) \
+            .filter(Stage.workflow_id == self.id)
+
+    def stage_dag(self):
+        """
+        :returns: (cosmos.graph.dag.DAG) a DAG of the ids of the Stages in the database
+        """
+        stage_ids = self.session.query(Stage.id).filter(Stage.workflow_id == self.id)
+        # Stage.parents are stored as (parent_id=stage id, child_id=parent id)
+        edges = self.session.query(StageEdge.child_id, StageEdge.parent_id) \
+            .join(Stage, Stage.id == StageEdge.parent_id) \
+            .filter(Stage.workflow_id == self.id)
+        return DAG((stage_id for stage_id, in stage_ids), edges)
+
     def stage_graph(self):
         """
         :return: (networkx.DiGraph) a DAG of the stages
@@ -426,9 +617,16 @@ class Workflow(Base):
         """
         :return: (networkx.DiGraph) a DAG of the tasks
         """
+        tasks = self.tasks
         g = nx.DiGraph()
-        g.add_nodes_from(self.tasks)
-        g.add_edges_from([(t, c) for t in self.tasks for c in t.children])
+        g.add_nodes_from(tasks)
+        if any(t.id is None for t in tasks):
+            # Tasks that haven't been inserted yet only have their edges in memory
+            g.add_edges_from((t, c) for t in tasks for c in t.children)
+        else:
+            # one query for the edges, rather than loading the children of every Task
+            by_id = {t.id: t for t in tasks}
+            g.add_edges_from((by_id[p], by_id[c]) for p, c in self._task_edges() if p in by_id and c in by_id)
         return g
 
     def get_stage(self, name_or_id):
@@ -484,6 +682,9 @@ class Workflow(Base):
         return None
 
 
+stages_by_name = CollectionIndex(Workflow.stages, Stage.name, 'workflow')
+
+
 # @event.listens_for(Workflow, 'before_delete')
 # def before_delete(mapper, connection, target):
 # print 'before_delete %s ' % target
@@ -510,27 +711,27 @@ def _run(workflow, session, task_queue):
                     return
 
                 # pop all descendents when a task fails; the rest of the graph can still execute
-                remove_nodes = descendants(task_queue, task).union({task, })
-                # graph_failed.add_edges(task_queue.subgraph(remove_nodes).edges())
-
-                task_queue.remove_nodes_from(remove_nodes)
+                task_queue.remove(task)
                 workflow.status = WorkflowStatus.failed_but_running
                 workflow.log.info('%s tasks left in the queue' % len(task_queue))
             elif task.status == TaskStatus.successful:
-                # just pop this task
-                task_queue.remove_node(task)
+                # just pop this task, which may make its children ready
+                task_queue.complete(task)
             elif task.status == TaskStatus.no_attempt:
                 # the task must have failed, and is being reattempted
-                pass
+                task_queue.requeue(task)
             else:
                 raise AssertionError('Unexpected finished task status %s for %s' % (task.status, task))
             available_cores = True
 
-        # only commit Task changes after processing a batch of finished ones
-        session.commit()
+        # only commit Task changes after processing a batch of finished ones, or less often with a flush_interval
+        with workflow.timings.phase('commit'):
+            workflow.write_behind.commit()
+        signal_run_loop.send(workflow, queued=len(task_queue), running=len(workflow.jobmanager.running_tasks))
 
-        # conveniently, this returns early if we catch a signal
-        time.sleep(workflow.jobmanager.poll_interval)
+        # conveniently, this returns early if we catch a signal, or a local Task exits
+        with workflow.timings.phase('wait'):
+            workflow.jobmanager.wait(workflow.jobmanager.poll_interval)
 
         if workflow.termination_signal:
             workflow.log.info('%s Early termination requested (%d): stopping workflow',
@@ -540,45 +741,55 @@ def _run(workflow, session, task_queue):
 
 
 def _run_queued_and_ready_tasks(task_queue, workflow):
-    max_cores = workflow.max_cores
-    ready_tasks = [task for task, degree in list(task_queue.in_degree()) if
-                   degree == 0 and task.status == TaskStatus.no_attempt]
-
-    if max_cores is None:
-        submittable_tasks = sorted(ready_tasks, key=lambda t: t.id)
-    else:
-        cores_used = sum([t.core_req for t in workflow.jobmanager.running_tasks])
-        cores_left = max_cores - cores_used
-
-        submittable_tasks = []
-        ready_tasks = sorted(ready_tasks, key=lambda t: (t.core_req, t.id))
-        while len(ready_tasks) > 0:
-            task = ready_tasks[0]
-            there_are_cores_left = task.core_req <= cores_left
-            if there_are_cores_left:
-                cores_left -= task.core_req
-                submittable_tasks.append(task)
-                ready_tasks.pop(0)
-            else:
-                break
+    resource_limits = workflow.resource_limits
+
+    with workflow.timings.phase('schedule'):
+        if resource_limits is None:
+            submittable_tasks = task_queue.pop_ready()
+        else:
+            # Tasks that don't fit wait in resource_limits, rather than being requeued on every pass
+            submittable_tasks = resource_limits.admit(task_queue.pop_ready(), workflow.jobmanager.running_tasks)
 
     # submit in a batch for speed
     workflow.jobmanager.run_tasks(submittable_tasks)
-    if len(submittable_tasks) < len(ready_tasks):
-        workflow.log.info('Reached max_cores limit of %s, waiting for a task to finish...' % max_cores)
+    if resource_limits is not None and resource_limits.waiting:
+        workflow.log.info('Reached resource limits (%s), waiting for a task to finish...' % resource_limits)
 
-    # only commit submitted Tasks after submitting a batch
-    workflow.session.commit()
+    # only commit submitted Tasks after submitting a batch, or less often with a flush_interval
+    with workflow.timings.phase('commit'):
+        workflow.write_behind.commit()
+
+
+@contextlib.contextmanager
+def _terminate_on_sigterm(workflow, enabled=True):
+    """
+    Turn SIGTERM into a graceful termination, which commits any Task changes held back by the Workflow's
+    WriteBehind, unless another handler (ie :class:`cosmos.util.signal_handlers.SGESignalHandler`) is already set.
+    """
+    if not enabled or threading.current_thread().name != 'MainThread' or \
+            signal.getsignal(signal.SIGTERM) != signal.SIG_DFL:
+        yield
+        return
+
+    def handler(signum, frame):
+        workflow.termination_signal = signum
+
+    signal.signal(signal.SIGTERM, handler)
+    try:
+        yield
+    finally:
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
 
 
 def _process_finished_tasks(jobmanager):
     for task in jobmanager.get_finished_tasks():
-        if task.NOOP or task.exit_status == 0:
-            task.status = TaskStatus.successful
-            yield task
-        else:
-            task.status = TaskStatus.failed
-            yield task
+        # the status change runs the signal handlers, ie to update the Stage or retry the Task
+        with jobmanager.timings.phase('signal_handlers'):
+            if task.NOOP or task.exit_status == 0:
+                task.status = TaskStatus.successful
+            else:
+                task.status = TaskStatus.failed
+        yield task
 
 
 def handle_exits(workflow, do_atexit=True):
@@ -596,9 +807,3 @@ def handle_exits(workflow, do_atexit=True):
             finally:
                 workflow.log.info('%s Ceased work: this is its final log message', workflow)
 
-
-def _copy_graph(graph):
-    graph2 = nx.DiGraph()
-    graph2.add_edges_from(graph.edges())
-    graph2.add_nodes_from(graph.nodes())
-    return graph2
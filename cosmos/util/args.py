@@ -10,6 +10,8 @@ def add_workflow_args(p, require_name=True):
     p.add_argument('--name', '-n', help="A name for this workflow", required=require_name)
     p.add_argument('--max_cores', '--max-cores', '-c', type=int,
                    help="Maximum number (based on the sum of Task.core_req) of cores to use at once.  0 means unlimited", default=None)
+    p.add_argument('--max_mem', '--max-mem', type=int,
+                   help="Maximum amount (based on the sum of Task.mem_req, in MB) of memory to use at once", default=None)
     p.add_argument('--restart', '-r', action='store_true',
                    help="Completely restart the workflow.  Note this will delete all record of the workflow in the database")
     p.add_argument('--skip_confirm', '--skip-confirm', '-y', action='store_true',
@@ -0,0 +1,205 @@
+"""
+A structured, append-only log of what happens while a Workflow runs, one json object per line (NDJSON), for offline
+analysis of the scheduler and for replaying statuses into the database.
+"""
+import datetime
+import json
+import time
+
+from more_itertools import grouper
+
+from cosmos import TaskStatus, StageStatus, WorkflowStatus, signal_task_status_change, signal_stage_status_change, \
+    signal_workflow_status_change, signal_drm_polled, signal_run_loop
+
+
+class EventLog(object):
+    """
+    Records the events of one Workflow from the status signals, and the polls and queue depth reported by its run
+    loop, to an NDJSON file.  Every event has ``t`` (a time.time()), ``event``, ``workflow_id`` and ``run`` (the
+    time.time() the run started, which tells runs apart since a log is appended to by every run):
+
+    task
+        A Task's status changed: ``id``, ``stage``, ``uid``, ``status`` (a TaskStatus name), ``attempt``, ``drm``,
+        ``drm_jobID``, and for finished Tasks ``exit_status`` and ``wall_time``.  Tasks are submitted (status
+        ``submitted``), finish (``successful`` or ``failed``), are retried (``no_attempt`` with the next attempt,
+        always after the ``failed`` of the previous one) or are killed (``killed``).  DRMs don't report when a job
+        starts running; it is ``wall_time`` seconds before it finished.
+    stage, workflow
+        A Stage's or the Workflow's status changed: ``id``, ``name`` and ``status``.
+    poll
+        A DRM was polled: ``drm``, ``seconds`` it took, and the number of Tasks ``finished`` and still ``running``.
+    queue
+        The number of Tasks ``queued`` and ``running`` changed.
+
+    Events are buffered in memory, and written once `buffer_size` have accumulated, `flush_interval` seconds have
+    passed since the last write, or :meth:`flush` is called.
+
+    :param str path: the file to append to
+    :param workflow: the Workflow whose events are recorded
+    """
+
+    def __init__(self, path, workflow, buffer_size=1000, flush_interval=5):
+        self.path = path
+        self.workflow = workflow
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self._buffer = []
+        self._last_flush = self.run = time.time()
+        self._file = open(path, 'a')
+        # Task id -> (status, attempt) last recorded
+        self._task_states = dict()
+        self._queue_depth = None
+
+    def connect(self):
+        signal_task_status_change.connect(self._task_status_changed, weak=False)
+        signal_stage_status_change.connect(self._stage_status_changed, weak=False)
+        signal_workflow_status_change.connect(self._workflow_status_changed, weak=False)
+        signal_drm_polled.connect(self._drm_polled, weak=False)
+        signal_run_loop.connect(self._run_loop, weak=False)
+        return self
+
+    def disconnect(self):
+        for signal, receiver in [(signal_task_status_change, self._task_status_changed),
+                                 (signal_stage_status_change, self._stage_status_changed),
+                                 (signal_workflow_status_change, self._workflow_status_changed),
+                                 (signal_drm_polled, self._drm_polled),
+                                 (signal_run_loop, self._run_loop)]:
+            signal.disconnect(receiver)
+
+    def record(self, event, **fields):
+        fields['t'] = time.time()
+        fields['event'] = event
+        fields['workflow_id'] = self.workflow.id
+        fields['run'] = self.run
+        self._buffer.append(fields)
+        if len(self._buffer) >= self.buffer_size or fields['t'] - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        """Write the buffered events"""
+        if self._buffer:
+            self._file.write(''.join(json.dumps(e) + '\n' for e in self._buffer))
+            self._file.flush()
+            self._buffer = []
+        self._last_flush = time.time()
+
+    def close(self):
+        self.disconnect()
+        self.flush()
+        self._file.close()
+
+    def _task_status_changed(self, task):
+        if task.stage.workflow is not self.workflow:
+            return
+        # Status changes made by other receivers of the same signal are sent before this receiver may be called for
+        # the change that caused them, so a Task is only recorded when its status or attempt changed, and a retry
+        # (which is sent from within the signal for the failure) is always preceded by the failure.
+        state = task.status, task.attempt
+        last = self._task_states.get(task.id)
+        if state == last:
+            return
+        if task.status == TaskStatus.no_attempt and task.attempt > 1 and last != (TaskStatus.failed, task.attempt - 1):
+            self._record_task(task, TaskStatus.failed, task.attempt - 1)
+        self._task_states[task.id] = state
+        self._record_task(task, task.status, task.attempt)
+
+    def _record_task(self, task, status, attempt):
+        fields = dict(id=task.id, stage=task.stage.name, uid=task.uid, status=status.name, attempt=attempt,
+                      drm=task.drm, drm_jobID=task.drm_jobID)
+        if status in (TaskStatus.successful, TaskStatus.failed):
+            fields.update(exit_status=task.exit_status, wall_time=task.wall_time)
+        self.record('task', **fields)
+
+    def _stage_status_changed(self, stage):
+        if stage.workflow is self.workflow:
+            self.record('stage', id=stage.id, name=stage.name, status=stage.status.name)
+
+    def _workflow_status_changed(self, workflow):
+        if workflow is self.workflow:
+            self.record('workflow', id=workflow.id, name=workflow.name, status=workflow.status.name)
+
+    def _drm_polled(self, jobmanager, drm, seconds, finished, running):
+        if jobmanager is self.workflow.jobmanager:
+            self.record('poll', drm=drm, seconds=round(seconds, 6), finished=finished, running=running)
+
+    def _run_loop(self, workflow, queued, running):
+        if workflow is self.workflow and (queued, running) != self._queue_depth:
+            self._queue_depth = queued, running
+            self.record('queue', queued=queued, running=running)
+
+
+def read_events(path):
+    """
+    :returns: (generator) the events in an event log, as dicts.  A partly written last line, ie if the process was
+        killed while writing it, is skipped.
+    """
+    with open(path) as fh:
+        for line in fh:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                if line.endswith('\n'):
+                    raise
+
+
+def replay_event_log(path, session):
+    """
+    Set the status of every Task, Stage and Workflow in an event log to the last one recorded, ie after a Workflow
+    run with a `flush_interval` was killed before committing them.  Only the events of each Workflow's most recent
+    run are replayed, since the log is appended to by every run.  Times are taken from the events.  The session is
+    committed.
+
+    :raises ValueError: if a Task in the log has a different uid in the database, ie the log is of another database
+    :returns: (int) the number of Tasks, Stages and Workflows updated
+    """
+    from cosmos.api import Task, Stage, Workflow
+
+    # workflow_id -> (run, the last events of that run).  Logs written before runs were recorded are one run.
+    runs = dict()
+    for event in read_events(path):
+        if event['event'] in ('task', 'stage', 'workflow') and event['id'] is not None:
+            run, events = runs.get(event.get('workflow_id'), (None, None))
+            if events is None or run != event.get('run'):
+                run, events = runs[event.get('workflow_id')] = event.get('run'), dict(task={}, stage={}, workflow={})
+            events[event['event']][event['id']] = event
+    last = dict(task={}, stage={}, workflow={})
+    for run, events in runs.values():
+        for kind in last:
+            last[kind].update(events[kind])
+
+    if last['task']:
+        uids = dict()
+        for ids in grouper(500, last['task']):
+            uids.update(session.query(Task.id, Task.uid).filter(Task.id.in_([i for i in ids if i is not None])))
+        mismatched = [e for e in last['task'].values() if uids.get(e['id']) != e['uid']]
+        if mismatched:
+            raise ValueError('%s Tasks in %s do not match the database, ie Task %s has uid %s in the log and %s in the '
+                             'database' % (len(mismatched), path, mismatched[0]['id'], mismatched[0]['uid'],
+                                           uids.get(mismatched[0]['id'])))
+
+    def task_mapping(e):
+        status = TaskStatus[e['status']]
+        d = dict(id=e['id'], _status=status, attempt=e['attempt'], drm_jobID=e['drm_jobID'],
+                 successful=status == TaskStatus.successful)
+        when = datetime.datetime.fromtimestamp(e['t'])
+        if status == TaskStatus.submitted:
+            d['submitted_on'] = when
+        elif status in (TaskStatus.successful, TaskStatus.failed, TaskStatus.killed):
+            d['finished_on'] = when
+        if 'exit_status' in e:
+            d.update(exit_status=e['exit_status'], wall_time=e['wall_time'])
+        return d
+
+    def status_mapping(enum, successful_status):
+        def mapping(e):
+            status = enum[e['status']]
+            return dict(id=e['id'], _status=status, successful=status == successful_status)
+        return mapping
+
+    for cls, events, to_mapping in [(Task, last['task'], task_mapping),
+                                    (Stage, last['stage'], status_mapping(StageStatus, StageStatus.successful)),
+                                    (Workflow, last['workflow'], status_mapping(WorkflowStatus,
+                                                                               WorkflowStatus.successful))]:
+        session.bulk_update_mappings(cls, [to_mapping(e) for e in events.values()])
+    session.commit()
+    return sum(len(events) for events in last.values())
@@ -1,5 +1,6 @@
 import pprint
 import logging
+import errno
 import itertools as it
 import signal
 import os
@@ -108,7 +109,12 @@ def confirm(prompt=None, default=False, timeout=0):
 
 def mkdir(path):
     if path and not os.path.exists(path):
-        os.makedirs(path)
+        try:
+            os.makedirs(path)
+        except OSError as e:
+            # another thread or process may have created it since we checked
+            if e.errno != errno.EEXIST:
+                raise
 
 
 def isgenerator(iterable):
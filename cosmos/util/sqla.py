@@ -1,5 +1,15 @@
+import time
+from collections import defaultdict, OrderedDict
+
 import six
+import sqlalchemy
 import sqlalchemy.types as types
+from sqlalchemy import event
+from sqlalchemy.orm import make_transient_to_detached
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.orm.interfaces import MANYTOONE
+
+from cosmos.util.iterstuff import only_one
 from sqlalchemy.ext.mutable import Mutable
 
 
@@ -120,3 +130,319 @@ class MutableList(Mutable, list):
     def remove(self, value):
         list.append(self, value)
         self.changed()
+
+
+class CollectionIndex(object):
+    """
+    A dict of key -> member for each instance of a one-to-many relationship, so that members can be looked up without
+    scanning the collection.  ie `CollectionIndex(Stage.tasks, Task.uid, 'stage')` indexes a Stage's Tasks by uid.
+
+    The index is built from the collection the first time it is used and then kept up to date by attribute events
+    as members are added, removed or change their key.  When the collection is reloaded from the database (ie after
+    a commit expires it, which is how deleted members disappear), the index is rebuilt.
+
+    :param collection: the relationship attribute, ie Stage.tasks
+    :param key: the attribute of the members to index by, ie Task.uid
+    :param str owner_attr: the name of the attribute of members that refers to the owner of the collection
+    """
+
+    def __init__(self, collection, key, owner_attr):
+        self.collection_attr = collection.key
+        self.key_attr = key.key
+        self.owner_attr = owner_attr
+        self.cache_attr = '_%s_by_%s' % (self.collection_attr, self.key_attr)
+        event.listen(collection, 'append', self._on_append)
+        event.listen(collection, 'remove', self._on_remove)
+        event.listen(key, 'set', self._on_set_key)
+
+    def get(self, owner):
+        """:returns: (dict) key -> member for the members of `owner`'s collection"""
+        members = getattr(owner, self.collection_attr)
+        cached = getattr(owner, self.cache_attr, None)
+        if cached is None or cached[0] is not members:
+            cached = members, {getattr(m, self.key_attr): m for m in members}
+            setattr(owner, self.cache_attr, cached)
+        return cached[1]
+
+    def _index(self, owner):
+        """:returns: the index of `owner`, if it has been built"""
+        cached = getattr(owner, self.cache_attr, None) if owner is not None else None
+        return cached[1] if cached is not None else None
+
+    def _on_append(self, owner, member, initiator):
+        index = self._index(owner)
+        key = getattr(member, self.key_attr)
+        if index is not None and key is not None:
+            index[key] = member
+
+    def _on_remove(self, owner, member, initiator):
+        index = self._index(owner)
+        key = getattr(member, self.key_attr)
+        if index is not None and index.get(key) is member:
+            del index[key]
+
+    def _on_set_key(self, member, key, old_key, initiator):
+        # don't trigger a lazy load of the owner
+        index = self._index(member.__dict__.get(self.owner_attr))
+        if index is not None:
+            if index.get(old_key) is member:
+                del index[old_key]
+            if key is not None:
+                index[key] = member
+
+
+#: the databases :func:`allocate_ids` can reserve ids with while other connections insert rows
+ID_ALLOCATING_DIALECTS = ('postgresql', 'sqlite')
+
+
+def allocate_ids(session, table, n):
+    """
+    Reserve `n` primary keys for rows of `table` in a single query.
+
+    With PostgreSQL the ids come from the primary key's sequence.  With SQLite they follow the table's current
+    maximum id, after taking the database's write lock so that no other connection can insert rows until the
+    transaction ends.  Other databases can't reserve ids without locking the whole table, so other connections
+    could insert rows with the same ids.
+
+    :raises NotImplementedError: if the database is not one of ID_ALLOCATING_DIALECTS
+    :returns: (list) the ids
+    """
+    pk = only_one(table.primary_key.columns)
+    dialect = session.bind.dialect.name
+    if dialect == 'postgresql':
+        if isinstance(pk.default, sqlalchemy.Sequence):
+            sequence = '.'.join(filter(None, [pk.default.schema, pk.default.name]))
+        else:
+            sequence = session.execute(sqlalchemy.select([sqlalchemy.func.pg_get_serial_sequence(
+                table.fullname, pk.name)])).scalar()
+        q = sqlalchemy.text('SELECT nextval(:sequence) FROM generate_series(1, :n)')
+        return [row[0] for row in session.execute(q, dict(sequence=sequence, n=n))]
+
+    if dialect == 'sqlite':
+        session.execute(table.update().where(sqlalchemy.false()).values({pk.key: pk}))
+        start = session.execute(sqlalchemy.select([sqlalchemy.func.max(pk)])).scalar() or 0
+        return range(start + 1, start + n + 1)
+
+    raise NotImplementedError('ids can not be reserved safely with %s' % dialect)
+
+
+def seconds_between(session, start, end):
+    """
+    :param start: a DateTime column or expression
+    :param end: a DateTime column or expression
+    :returns: a SQL expression of the (float) seconds from `start` to `end`, for the session's database
+    """
+    dialect = session.bind.dialect.name
+    if dialect == 'postgresql':
+        return sqlalchemy.extract('epoch', end - start)
+    if dialect == 'mysql':
+        return sqlalchemy.func.timestampdiff(sqlalchemy.text('MICROSECOND'), start, end) / 1e6
+    return (sqlalchemy.func.julianday(end) - sqlalchemy.func.julianday(start)) * 86400.0
+
+
+def bulk_insert_pending(session, objs, batch_size=10000):
+    """
+    Insert the instances of `objs` that are pending in `session` with one executemany per `batch_size` rows, rather
+    than by flushing them through the unit of work, which is very slow and memory hungry for hundreds of thousands of
+    objects.  Ids are allocated in a single query per class, in the order of `objs`, and the rows of many-to-many
+    association tables (ie TaskEdge) of the instances are inserted as well, including those to instances that were
+    already persistent.  The instances are then persistent in `session`, as if they had been loaded by a query, so
+    unlike instances inserted by a flush they are not expunged by a rollback.
+
+    With databases :func:`allocate_ids` can't reserve ids with, the instances are flushed instead, which gets their
+    ids from the database.
+
+    :param objs: instances, whose classes first appear in an order which satisfies their foreign keys (ie Stages
+        before Tasks)
+    :returns: (int) the number of rows inserted, or of instances flushed
+    """
+    if session.bind.dialect.name not in ID_ALLOCATING_DIALECTS:
+        num_instances = len(session.new)
+        session.flush()
+        return num_instances
+
+    new = session.new
+    pending = OrderedDict()
+    is_pending = set()
+    for o in objs:
+        if id(o) not in is_pending and o in new:
+            is_pending.add(id(o))
+            pending.setdefault(type(o), []).append(o)
+    num_rows = 0
+
+    def insert(table, rows):
+        # executemany requires every row to have the same columns
+        rows_by_columns = defaultdict(list)
+        for row in rows:
+            rows_by_columns[tuple(sorted(row))].append(row)
+        for group in rows_by_columns.values():
+            for i in range(0, len(group), batch_size):
+                session.execute(table.insert(), group[i:i + batch_size])
+        return len(rows)
+
+    for cls, cls_objs in pending.items():
+        mapper = sqlalchemy.inspect(cls)
+        table = mapper.local_table
+        pk_attr = mapper.get_property_by_column(only_one(table.primary_key.columns)).key
+        for o, id_ in zip(cls_objs, allocate_ids(session, table, len(cls_objs))):
+            o.__dict__[pk_attr] = id_
+
+        # (local attribute, relationship, remote column) of each foreign key
+        foreign_keys = [(mapper.get_property_by_column(local).key, prop, remote)
+                        for prop in mapper.relationships if prop.direction is MANYTOONE
+                        for local, remote in prop.local_remote_pairs]
+        columns = [(col.key, mapper.get_property_by_column(col).key, col) for col in table.columns]
+        rows = []
+        for o in cls_objs:
+            # the objects are about to be marked as persistent, so their attributes are set without any history
+            d = o.__dict__
+            # set foreign keys, as a flush would
+            for key, prop, remote in foreign_keys:
+                target = d.get(prop.key)
+                if target is not None:
+                    value = getattr(target, prop.mapper.get_property_by_column(remote).key)
+                    assert value is not None, '%s must be persisted before %s' % (target, o)
+                    d[key] = value
+
+            row = {}
+            for col_key, key, col in columns:
+                if key not in d:
+                    if col.default is not None:
+                        d[key] = col.default.arg(None) if col.default.is_callable else col.default.arg
+                    elif col.server_default is not None:
+                        # let the database fill it in; it is loaded when first accessed
+                        continue
+                    else:
+                        d[key] = None
+                row[col_key] = d[key]
+            rows.append(row)
+        num_rows += insert(table, rows)
+
+    edges = defaultdict(set)
+    # persistent instances which the pending instances refer to
+    others = dict()
+    for cls, cls_objs in pending.items():
+        mapper = sqlalchemy.inspect(cls)
+        for prop in mapper.relationships:
+            for o in cls_objs:
+                targets = o.__dict__.get(prop.key)
+                if targets is None:
+                    targets = []
+                elif not prop.uselist:
+                    targets = [targets]
+                for other in targets:
+                    if id(other) not in is_pending:
+                        others[id(other)] = other
+                    if prop.secondary is not None:
+                        edge = tuple((sc.key, getattr(o, mapper.get_property_by_column(c).key))
+                                     for c, sc in prop.synchronize_pairs)
+                        edge += tuple((sc.key, getattr(other, prop.mapper.get_property_by_column(c).key))
+                                      for c, sc in prop.secondary_synchronize_pairs)
+                        assert all(v is not None for k, v in edge), '%s must be persisted before %s' % (other, o)
+                        # a relationship and its backref describe the same rows
+                        edges[prop.secondary].add(tuple(sorted(edge)))
+    for table, table_edges in edges.items():
+        num_rows += insert(table, [dict(edge) for edge in table_edges])
+
+    # the backrefs of the persistent instances now include pending instances, whose rows were inserted above, so the
+    # next flush should not insert them again
+    for other in others.values():
+        state = sqlalchemy.inspect(other)
+        for prop in state.mapper.relationships:
+            if prop.key in other.__dict__:
+                history = state.attrs[prop.key].history
+                if not history.deleted and all(id(o) in is_pending for o in history.added):
+                    value = other.__dict__[prop.key]
+                    set_committed_value(other, prop.key, list(value) if isinstance(value, list) else value)
+
+    inserted = [o for cls_objs in pending.values() for o in cls_objs]
+    for cls, cls_objs in pending.items():
+        collections = [prop.key for prop in sqlalchemy.inspect(cls).relationships if prop.uselist]
+        for o in cls_objs:
+            # collections that were never touched are empty, don't load them from the database later
+            for key in collections:
+                if key not in o.__dict__:
+                    set_committed_value(o, key, [])
+
+    # make the instances persistent, with their current attributes as their database state
+    for o in inserted:
+        # expunge() cascades to related pending instances
+        if sqlalchemy.inspect(o).pending:
+            session.expunge(o)
+    for o in inserted:
+        make_transient_to_detached(o)
+    for o in inserted:
+        # add() cascades to related instances as well, so most of them are already in the session
+        if o not in session:
+            session.add(o)
+
+    return num_rows
+
+
+def delete_ids(session, cls, ids, batch_size=500):
+    """
+    Delete the rows of `cls` with primary keys `ids`, with one DELETE per `batch_size` ids rather than loading and
+    deleting each instance.  Rows that refer to them are deleted by the database (ON DELETE CASCADE).  Instances in
+    `session` are expunged, as if they had been deleted and committed.
+
+    :returns: (int) the number of rows deleted
+    """
+    mapper = sqlalchemy.inspect(cls)
+    pk = only_one(mapper.primary_key)
+    ids = list(ids)
+    num_rows = 0
+    for i in range(0, len(ids), batch_size):
+        num_rows += session.query(cls).filter(pk.in_(ids[i:i + batch_size])).delete(synchronize_session=False)
+    for id_ in ids:
+        instance = session.identity_map.get(mapper.identity_key_from_primary_key([id_]))
+        if instance is not None and instance in session:
+            session.expunge(instance)
+    return num_rows
+
+
+class WriteBehind(object):
+    """
+    Coalesces the changes made to a session into fewer, larger transactions.  :meth:`commit` only commits once
+    `flush_interval` seconds have passed since the last commit, or once `flush_size` instances have changed.  An
+    instance that changed several times in between is written once, with its latest state, and the unit of work sends
+    the UPDATEs of instances with the same changed columns as one executemany.  Fewer commits also means instances are
+    expired, and reloaded when next used, less often.
+
+    Changes that have not been committed yet are lost if the process dies without calling :meth:`flush`.
+
+    :param session: a sqlalchemy session
+    :param float flush_interval: the most seconds to wait between commits.  If 0, every call to :meth:`commit`
+        commits.
+    :param int flush_size: commit early once this many instances are new, changed or deleted
+    """
+
+    def __init__(self, session, flush_interval=0, flush_size=1000, clock=time.time):
+        self.session = session
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self.clock = clock
+        self.last_flush = clock()
+        self.num_flushes = 0
+
+    def num_pending(self):
+        """:returns: (int) the number of instances that have not been written"""
+        session = self.session
+        return len(session.new) + len(session.dirty) + len(session.deleted)
+
+    def commit(self):
+        """
+        Commit, if it is time to.
+
+        :returns: (bool) True if the session was committed
+        """
+        if (self.flush_interval <= 0 or self.clock() - self.last_flush >= self.flush_interval or
+                self.num_pending() >= self.flush_size):
+            self.flush()
+            return True
+        return False
+
+    def flush(self):
+        """Commit now"""
+        self.session.commit()
+        self.last_flush = self.clock()
+        self.num_flushes += 1
@@ -0,0 +1,135 @@
+"""
+Timing of the phases of the Workflow.run loop itself (building the DAG, calling cmd_fxns, submitting, polling,
+committing, ...), to find where the controller spends its time on large Workflows.
+"""
+import cProfile
+import math
+import threading
+import time
+from collections import defaultdict
+
+
+class Histogram(object):
+    """
+    Counts durations in logarithmic buckets, 10 per power of 10 from 1 microsecond, so that percentiles can be
+    estimated (to within 26%) in constant memory.
+    """
+    min_seconds = 1e-6
+    buckets_per_decade = 10
+
+    def __init__(self):
+        self.buckets = defaultdict(int)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        if seconds > self.min_seconds:
+            bucket = int(math.log10(seconds / self.min_seconds) * self.buckets_per_decade)
+        else:
+            bucket = 0
+        self.buckets[bucket] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def percentile(self, q):
+        """:returns: (float) the upper bound of the bucket holding the `q` th percentile (0-100) duration"""
+        rank = q / 100.0 * self.count
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                return min(self.max, self.min_seconds * 10 ** (float(bucket + 1) / self.buckets_per_decade))
+        return self.max
+
+
+class _Phase(object):
+    __slots__ = ('timings', 'name', 'start')
+
+    def __init__(self, timings, name):
+        self.timings = timings
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.time()
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.timings.record(self.name, time.time() - self.start)
+
+
+class _NullPhase(object):
+    __slots__ = ()
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, exc_type, exc_value, tb):
+        pass
+
+
+_null_phase = _NullPhase()
+
+
+class PhaseTimings(object):
+    """
+    A :class:`Histogram` of the time spent in each phase, ie::
+
+        with workflow.timings.phase('commit'):
+            session.commit()
+
+    Phases may be timed from any thread.  If `cprofile_path` is set, :meth:`start` and :meth:`stop` also run the
+    cProfile profiler, and write its stats to `cprofile_path` (which ``python -m pstats``, snakeviz or gprof2dot read).
+
+    :param str cprofile_path: where to write cProfile stats
+    """
+    enabled = True
+
+    def __init__(self, cprofile_path=None):
+        self.histograms = defaultdict(Histogram)
+        self.cprofile_path = cprofile_path
+        self._profiler = None
+        self._lock = threading.Lock()
+
+    def phase(self, name):
+        """:returns: a context manager which records the time spent in it as phase `name`"""
+        return _Phase(self, name)
+
+    def record(self, name, seconds):
+        with self._lock:
+            self.histograms[name].add(seconds)
+
+    def start(self):
+        if self.cprofile_path is not None and self._profiler is None:
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+
+    def stop(self):
+        """Stop the profiler and write its stats, if it is running"""
+        if self._profiler is not None:
+            self._profiler.disable()
+            self._profiler.dump_stats(self.cprofile_path)
+            self._profiler = None
+
+    def report(self):
+        """:returns: (str) a table of the time spent in each phase, the most first"""
+        lines = ['%-24s %8s %10s %10s %10s %10s %10s' % ('phase', 'calls', 'total_secs', 'p50_ms', 'p90_ms',
+                                                           'p99_ms', 'max_ms')]
+        with self._lock:
+            histograms = sorted(self.histograms.items(), key=lambda item: -item[1].total)
+            for name, h in histograms:
+                lines.append('%-24s %8d %10.3f %10.3f %10.3f %10.3f %10.3f' % (
+                    name, h.count, h.total, h.percentile(50) * 1000, h.percentile(90) * 1000,
+                    h.percentile(99) * 1000, h.max * 1000))
+        return '\n'.join(lines)
+
+
+class NullTimings(PhaseTimings):
+    """Records nothing, for when timing is disabled; its phases cost one method call"""
+    enabled = False
+
+    def phase(self, name):
+        return _null_phase
+
+    def record(self, name, seconds):
+        pass
@@ -51,6 +51,10 @@ def add_filters(bprint_or_app, type_='bprint'):
         f = getattr(func, func_name)
         session = stage.session
         a = session.query(f(getattr(Task, attribute))).join(Stage).filter(Stage.id == stage.id).scalar()
+        return format_stage_stat(a, attribute)
+
+    @add_filter
+    def format_stage_stat(a, attribute):
         if a is None:
             return ''
         a = float(a)
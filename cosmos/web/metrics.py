@@ -0,0 +1,202 @@
+"""
+Statistics of Workflows for the web dashboard: a summary of each Stage for the workflow page, and metrics of every
+Workflow in the Prometheus text exposition format for the /metrics endpoint.  Everything is computed with a few
+aggregate queries over the task table, so it is cheap no matter how many Tasks there are.
+"""
+import math
+from collections import defaultdict
+
+from sqlalchemy import func, case
+
+from cosmos import TaskStatus
+from cosmos.models.Task import Task
+from cosmos.models.Stage import Stage
+from cosmos.models.Workflow import Workflow
+from cosmos.util.sqla import seconds_between
+
+#: (name, type, help) of every metric, in the order they are written
+METRICS = [
+    ('cosmos_workflow_status', 'gauge', 'Always 1, labelled with the status of the Workflow'),
+    ('cosmos_tasks', 'gauge', 'Number of Tasks by status'),
+    ('cosmos_running_cores', 'gauge', 'Sum of core_req of the Tasks submitted to a DRM'),
+    ('cosmos_task_submissions_total', 'counter', 'Number of times Tasks were submitted, including retries'),
+    ('cosmos_task_finishes_total', 'counter', 'Number of Tasks that finished (successful, or failed every attempt)'),
+    ('cosmos_task_retries_total', 'counter', 'Number of times failed Tasks were attempted again'),
+    ('cosmos_task_queue_wait_seconds', 'gauge', 'Mean seconds finished Tasks waited for the DRM to start them, '
+                                                'ie finished_on - submitted_on - wall_time'),
+    ('cosmos_task_wall_time_seconds', 'gauge', 'Quantiles of the wall_time of successful Tasks'),
+]
+
+
+#: the Task columns averaged on the workflow and stage pages
+STAGE_STAT_COLUMNS = ['percent_cpu', 'core_req', 'avg_rss_mem_kb', 'max_rss_mem_kb', 'max_vms_mem_kb', 'mem_req',
+                      'wall_time', 'cpu_time', 'io_wait', 'io_write_kb']
+
+
+class StageStats(object):
+    """The number of Tasks of a Stage by status, and the mean of each of `STAGE_STAT_COLUMNS`"""
+
+    def __init__(self):
+        self.counts = defaultdict(int)
+        self.num_tasks = 0
+        self.num_successful = 0
+        # column -> [sum, number of Tasks where it is not NULL]
+        self._sums = {column: [0, 0] for column in STAGE_STAT_COLUMNS}
+
+    @property
+    def num_failed(self):
+        return self.counts[TaskStatus.failed]
+
+    def percent(self, n):
+        return round(float(n) / (self.num_tasks or 1) * 100, 2)
+
+    def percent_successful(self):
+        return self.percent(self.num_successful)
+
+    def percent_running(self):
+        return self.percent(self.counts[TaskStatus.submitted])
+
+    def percent_failed(self):
+        return self.percent(self.num_failed)
+
+    def avg(self, column):
+        """:returns: (float) the mean of `column` over the Tasks where it is not NULL, or None"""
+        total, n = self._sums[column]
+        return float(total) / n if n else None
+
+
+def stage_stats(session, workflow_id, stage_id=None):
+    """
+    Summarizes every Stage of a Workflow with one query, grouped by Stage and Task status.
+
+    :param stage_id: only summarize this Stage
+    :returns: (defaultdict) Stage id -> :class:`StageStats`, which is empty for Stages without Tasks
+    """
+    columns = [getattr(Task, c) for c in STAGE_STAT_COLUMNS]
+    aggregates = [f(c) for c in columns for f in (func.sum, func.count)]
+    rows = session.query(Task.stage_id, Task._status, Task.successful, func.count(Task.id), *aggregates) \
+        .join(Stage, Stage.id == Task.stage_id) \
+        .filter(Stage.workflow_id == workflow_id) \
+        .group_by(Task.stage_id, Task._status, Task.successful)
+    if stage_id is not None:
+        rows = rows.filter(Task.stage_id == stage_id)
+
+    stats = defaultdict(StageStats)
+    for row in rows:
+        stage_id, status, successful, count = row[:4]
+        s = stats[stage_id]
+        s.counts[status] += count
+        s.num_tasks += count
+        if successful:
+            s.num_successful += count
+        for i, column in enumerate(STAGE_STAT_COLUMNS):
+            total, n = row[4 + 2 * i], row[5 + 2 * i]
+            if n:
+                s._sums[column][0] += total
+                s._sums[column][1] += n
+    return stats
+
+
+def _escape(value):
+    return unicode(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def _sample(name, labels, value):
+    return '%s{%s} %s' % (name, ','.join('%s="%s"' % (k, _escape(v)) for k, v in labels), repr(float(value)))
+
+
+def _wall_time_quantiles(session, query, quantiles):
+    """:returns: (dict) (workflow name, stage name) -> list of the `quantiles` of the wall_time of successful Tasks"""
+    if session.bind.dialect.name == 'postgresql':
+        columns = [func.percentile_cont(q).within_group(Task.wall_time) for q in quantiles]
+        rows = query.with_entities(Workflow.name, Stage.name, *columns) \
+            .filter(Task.successful == True, Task.wall_time != None) \
+            .group_by(Workflow.name, Stage.name)
+        return {(wf, stage): values for wf, stage, values in ((r[0], r[1], r[2:]) for r in rows)}
+
+    # other databases have no percentile aggregate, so each quantile is interpolated between the two closest ranks,
+    # fetched with ORDER BY ... LIMIT 2 OFFSET rank.  This is a few small queries per Stage, rather than reading the
+    # wall_time of every Task ever run.
+    done = query.filter(Task.successful == True, Task.wall_time != None)
+    counts = done.with_entities(Stage.id, Workflow.name, Stage.name, func.count(Task.id)) \
+        .group_by(Stage.id, Workflow.name, Stage.name)
+    result = {}
+    for stage_id, wf, stage, n in counts:
+        ranked = done.with_entities(Task.wall_time).filter(Stage.id == stage_id).order_by(Task.wall_time)
+        values = []
+        for q in quantiles:
+            i = (n - 1) * q
+            lo = int(math.floor(i))
+            closest = [wall_time for wall_time, in ranked.offset(lo).limit(2)]
+            values.append(closest[0] + (closest[-1] - closest[0]) * (i - lo))
+        result[wf, stage] = values
+    return result
+
+
+def prometheus_metrics(session, workflow_names=None, quantiles=(0.5, 0.95)):
+    """
+    :param workflow_names: only export these Workflows.  Defaults to all of them.
+    :param quantiles: the quantiles of wall_time to export
+    :returns: (str) the metrics of each Workflow and Stage in the Prometheus text format.  Metrics are labelled with
+        ``workflow`` and ``stage`` names.  Submit and finish rates are the rate() of the ``_total`` counters; like
+        everything else they are read from the database, so they go down when Tasks are deleted (ie resumed).
+    """
+    workflows = session.query(Workflow.name, Workflow._status)
+    query = session.query(Task).join(Stage, Stage.id == Task.stage_id).join(Workflow, Workflow.id == Stage.workflow_id)
+    if workflow_names is not None:
+        workflows = workflows.filter(Workflow.name.in_(workflow_names))
+        query = query.filter(Workflow.name.in_(workflow_names))
+    samples = defaultdict(list)
+
+    for name, status in workflows.order_by(Workflow.id):
+        samples['cosmos_workflow_status'].append(([('workflow', name), ('status', status.name)], 1))
+
+    # tasks by status, and the cores of the running ones
+    counts = defaultdict(dict)
+    running_cores = defaultdict(int)
+    rows = query.with_entities(Workflow.name, Stage.name, Task._status, func.count(Task.id),
+                               func.coalesce(func.sum(Task.core_req), 0)) \
+        .group_by(Workflow.name, Stage.name, Task._status)
+    for wf, stage, status, count, cores in rows:
+        counts[wf, stage][status] = count
+        if status == TaskStatus.submitted:
+            running_cores[wf, stage] = cores
+    stages = sorted(counts)
+    for wf, stage in stages:
+        labels = [('workflow', wf), ('stage', stage)]
+        for status in TaskStatus:
+            samples['cosmos_tasks'].append((labels + [('status', status.name)], counts[wf, stage].get(status, 0)))
+        samples['cosmos_running_cores'].append((labels, running_cores[wf, stage]))
+
+    # submissions, finishes, retries and queue wait
+    submitted = Task.submitted_on != None
+    finished = Task.finished_on != None
+    rows = query.with_entities(
+        Workflow.name, Stage.name,
+        # a Task waiting to be retried was submitted one time less than its attempt number
+        func.sum(case([(submitted & (Task._status == TaskStatus.no_attempt), Task.attempt - 1),
+                       (submitted, Task.attempt)], else_=0)),
+        func.sum(case([(finished, 1)], else_=0)),
+        func.sum(Task.attempt - 1),
+        func.avg(case([(finished & submitted & (Task.wall_time != None),
+                        seconds_between(session, Task.submitted_on, Task.finished_on) - Task.wall_time)]))) \
+        .group_by(Workflow.name, Stage.name)
+    for wf, stage, submissions, finishes, retries, queue_wait in rows:
+        labels = [('workflow', wf), ('stage', stage)]
+        samples['cosmos_task_submissions_total'].append((labels, submissions or 0))
+        samples['cosmos_task_finishes_total'].append((labels, finishes or 0))
+        samples['cosmos_task_retries_total'].append((labels, retries or 0))
+        if queue_wait is not None:
+            samples['cosmos_task_queue_wait_seconds'].append((labels, max(0, queue_wait)))
+
+    for (wf, stage), values in sorted(_wall_time_quantiles(session, query, quantiles).items()):
+        for q, value in zip(quantiles, values):
+            samples['cosmos_task_wall_time_seconds'].append(
+                ([('workflow', wf), ('stage', stage), ('quantile', str(q))], value))
+
+    lines = []
+    for name, metric_type, help in METRICS:
+        lines.append('# HELP %s %s' % (name, help))
+        lines.append('# TYPE %s %s' % (name, metric_type))
+        lines.extend(_sample(name, labels, value) for labels, value in samples[name])
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,112 @@
+"""
+Pages of the Tasks of a Stage for the web dashboard, so the stage page never has to read all of them.  Pages are read
+with a filtered, sorted and limited query on the task table, and can be walked by Task id (keyset pagination), which
+stays as fast on the last page as on the first.
+"""
+import itertools as it
+from operator import attrgetter
+
+from sqlalchemy import func, or_, String
+from sqlalchemy.sql.expression import type_coerce
+
+from cosmos import TaskStatus
+from cosmos.models.Task import Task
+from cosmos.job.JobManager import JobManager
+
+#: the columns of the stage page's table of Tasks, in order
+TASK_TABLE_COLUMNS = ['id', 'task', 'successful', 'status', 'drm_status', 'drm_jobID', 'attempt', 'submitted_on',
+                      'finished_on', 'wall_time']
+
+#: what each column is sorted by.  Tasks are listed by their params, which are sorted by uid.
+SORT_COLUMNS = dict(id=Task.id, task=Task.uid, successful=Task.successful, status=Task._status,
+                    drm_jobID=Task.drm_jobID, attempt=Task.attempt, submitted_on=Task.submitted_on,
+                    finished_on=Task.finished_on, wall_time=Task.wall_time)
+
+
+def task_query(session, stage_id, search=None, status=None):
+    """
+    :param search: only Tasks with this in their uid, params or drm_jobID, or with this status name or id
+    :param TaskStatus status: only Tasks with this status
+    :returns: (Query) the Tasks of a Stage
+    """
+    q = session.query(Task).filter(Task.stage_id == stage_id)
+    if status is not None:
+        q = q.filter(Task._status == status)
+    if search:
+        like = '%%%s%%' % search.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        # params are stored as json, which should be searched as the text it is
+        conditions = [Task.uid.like(like, escape='\\'), Task.drm_jobID.like(like, escape='\\'),
+                      type_coerce(Task.params, String).like(like, escape='\\')]
+        if search in TaskStatus.__members__:
+            conditions.append(Task._status == TaskStatus[search])
+        if search.isdigit():
+            conditions.append(Task.id == int(search))
+        q = q.filter(or_(*conditions))
+    return q
+
+
+def task_page(session, stage_id, start=0, length=50, search=None, status=None, order_by='id', descending=False,
+              after=None, before=None):
+    """
+    Reads one page of the Tasks of a Stage.
+
+    :param start: the number of Tasks to skip.  Ignored if `after` or `before` is set.
+    :param length: the number of Tasks in the page
+    :param search: see :func:`task_query`
+    :param status: see :func:`task_query`
+    :param order_by: a key of `SORT_COLUMNS`.  Ties are broken by id.
+    :param descending: sort in descending order
+    :param after: only Tasks after the Task with this id, in the order of the page.  Can only be used when ordering by
+        id, but is as quick for the last page as the first, which an offset of `start` is not.
+    :param before: only Tasks before the Task with this id, ie the page before a page starting with it
+    :returns: (int, int, list) the number of Tasks of the Stage, the number of those that match `search` and `status`,
+        and the page of Tasks
+    """
+    if after is not None and before is not None:
+        raise ValueError('only one of after and before can be set')
+    q = task_query(session, stage_id, search, status)
+    total = session.query(func.count(Task.id)).filter(Task.stage_id == stage_id).scalar()
+    filtered = q.with_entities(func.count(Task.id)).scalar() if search or status is not None else total
+
+    if after is not None or before is not None:
+        if order_by != 'id':
+            raise ValueError('after and before can only be used when ordering by id')
+        # walk back from `before` in the opposite order, then put the page back in order
+        backwards = before is not None
+        pivot = before if backwards else after
+        ascending = descending == backwards
+        q = q.filter(Task.id > pivot if ascending else Task.id < pivot)
+        tasks = q.order_by(Task.id if ascending else Task.id.desc()).limit(length).all()
+        if backwards:
+            tasks.reverse()
+    else:
+        column = SORT_COLUMNS[order_by]
+        order = [column.desc(), Task.id.desc()] if descending else [column, Task.id]
+        tasks = q.order_by(*order).offset(start).limit(length).all()
+
+    return total, filtered, tasks
+
+
+def drm_statuses(tasks, drm_options=None):
+    """
+    :returns: (dict) task.drm_jobID -> drm_status, of the Tasks in `tasks` that are submitted to a DRM
+    """
+    submitted = [t for t in tasks if t.status == TaskStatus.submitted]
+    jm = JobManager(get_submit_args=None, drm_options=drm_options)
+    f = attrgetter('drm')
+    statuses = {}
+    for drm, drm_tasks in it.groupby(sorted(submitted, key=f), f):
+        statuses.update(jm.get_drm(drm).drm_statuses(list(drm_tasks), log_errors=False))
+    return statuses
+
+
+def _datetime(d):
+    return d.strftime('%Y-%m-%d %H:%M:%S') if d else None
+
+
+def task_row(task, drm_status=''):
+    """:returns: (dict) the fields of a Task that are listed on the stage page"""
+    return dict(id=task.id, url=task.url, uid=task.uid, params=task.params_pretty, successful=task.successful,
+                status=task.status.name, drm=task.drm, drm_status=drm_status, drm_jobID=task.drm_jobID,
+                attempt=task.attempt, submitted_on=_datetime(task.submitted_on),
+                finished_on=_datetime(task.finished_on), wall_time=task.wall_time if task.finished_on else None)
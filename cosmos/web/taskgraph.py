@@ -0,0 +1,130 @@
+"""
+Drawings of the task graph for the web dashboard.  Laying out a graph with graphviz takes time that grows quickly
+with its size, so drawings are cached until the Tasks they depict change, and large Workflows are drawn as a graph
+of their Stages, whose Tasks can be drawn one Stage at a time.
+"""
+import threading
+from collections import OrderedDict
+
+import networkx as nx
+from sqlalchemy import func
+from sqlalchemy.orm import aliased
+
+from cosmos.models.Task import Task, TaskEdge
+from cosmos.models.Stage import Stage, StageEdge
+
+
+def graph_key(session, workflow_id, stage_id=None):
+    """
+    :param stage_id: only consider this Stage, and the edges of its Tasks
+    :returns: (tuple) a key that changes when a Stage, Task or edge is added to or deleted from the Workflow, or
+        when a Stage or Task changes status.  It is read with a few aggregate queries, much quicker than the graph.
+    """
+    stages = session.query(Stage.id, Stage.name, Stage._status).filter(Stage.workflow_id == workflow_id)
+    tasks = session.query(Task.stage_id, Task._status, func.count(Task.id), func.sum(Task.id)) \
+        .join(Stage, Stage.id == Task.stage_id) \
+        .filter(Stage.workflow_id == workflow_id) \
+        .group_by(Task.stage_id, Task._status)
+    stage_edges = session.query(func.count(), func.sum(StageEdge.child_id)) \
+        .join(Stage, Stage.id == StageEdge.parent_id) \
+        .filter(Stage.workflow_id == workflow_id)
+    # Task.parents are stored as (parent_id=task id, child_id=parent id)
+    task_edges = session.query(func.count(), func.sum(TaskEdge.child_id)) \
+        .join(Task, Task.id == TaskEdge.parent_id) \
+        .join(Stage, Stage.id == Task.stage_id) \
+        .filter(Stage.workflow_id == workflow_id)
+    if stage_id is not None:
+        tasks = tasks.filter(Task.stage_id == stage_id)
+        child = aliased(Task)
+        task_edges = session.query(func.count(), func.sum(TaskEdge.parent_id + TaskEdge.child_id)) \
+            .join(Task, Task.id == TaskEdge.parent_id) \
+            .join(child, child.id == TaskEdge.child_id) \
+            .filter((Task.stage_id == stage_id) | (child.stage_id == stage_id))
+
+    # the sum of the ids of the Tasks with a status changes when any two of them swap statuses
+    return (sorted((id_, name, status.name) for id_, name, status in stages),
+            sorted((s, status.name, count, ids) for s, status, count, ids in tasks),
+            tuple(stage_edges.one()), tuple(task_edges.one()))
+
+
+def stage_subgraph(session, stage, max_tasks=500):
+    """
+    :param max_tasks: the most Tasks to include.  A note of how many more there are is added as a node.
+    :returns: (networkx.DiGraph) the first `max_tasks` Tasks of `stage`, and an edge from (to) the other Stages their
+        parents (children) are in, drawn with :func:`cosmos.graph.draw.draw_stage_subgraph`
+    """
+    tasks = session.query(Task).filter(Task.stage_id == stage.id).order_by(Task.id).limit(max_tasks + 1).all()
+    shown = tasks[:max_tasks]
+    g = nx.DiGraph()
+    g.add_nodes_from(shown)
+    if len(tasks) > max_tasks:
+        num_tasks = session.query(func.count(Task.id)).filter(Task.stage_id == stage.id).scalar()
+        g.add_node('+ %s more Tasks' % (num_tasks - max_tasks))
+    if not shown:
+        return g
+    by_id = {t.id: t for t in shown}
+    last_id = shown[-1].id
+
+    stages = {s.id: s for s in session.query(Stage).filter(Stage.workflow_id == stage.workflow_id)}
+    other = aliased(Task)
+    # Task.parents are stored as (parent_id=task id, child_id=parent id)
+    parent_edges = session.query(TaskEdge.parent_id, TaskEdge.child_id, other.stage_id) \
+        .join(Task, Task.id == TaskEdge.parent_id) \
+        .join(other, other.id == TaskEdge.child_id) \
+        .filter(Task.stage_id == stage.id, Task.id <= last_id)
+    for task_id, parent_id, parent_stage_id in parent_edges:
+        if parent_stage_id != stage.id:
+            g.add_edge(stages[parent_stage_id], by_id[task_id])
+        elif parent_id in by_id:
+            g.add_edge(by_id[parent_id], by_id[task_id])
+
+    child_edges = session.query(TaskEdge.child_id, other.stage_id) \
+        .join(Task, Task.id == TaskEdge.child_id) \
+        .join(other, other.id == TaskEdge.parent_id) \
+        .filter(Task.stage_id == stage.id, Task.id <= last_id, other.stage_id != stage.id)
+    for task_id, child_stage_id in child_edges:
+        g.add_edge(by_id[task_id], stages[child_stage_id])
+    return g
+
+
+class GraphCache(object):
+    """
+    Keeps the most recently drawn graphs, each with the key of what it depicts (see :func:`graph_key`), and draws a
+    graph again only when its key changed.  Drawing is done outside of the lock, so a slow drawing doesn't hold up
+    requests for other graphs.
+
+    :param int max_size: the most graphs to keep.  The least recently used are dropped first.
+    """
+
+    def __init__(self, max_size=64):
+        self.max_size = max_size
+        self._graphs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, name, key, draw):
+        """
+        :param name: which graph, ie (workflow id, view).  A graph with a new key replaces the one with the old key.
+        :param key: what the graph depicts
+        :param draw: a function that draws the graph
+        :returns: the cached drawing of `name` if it was drawn with `key`, otherwise draw()
+        """
+        with self._lock:
+            cached = self._graphs.pop(name, None)
+            if cached is not None and cached[0] == key:
+                self._graphs[name] = cached
+                return cached[1]
+        drawing = draw()
+        with self._lock:
+            self._graphs[name] = (key, drawing)
+            while len(self._graphs) > self.max_size:
+                self._graphs.popitem(last=False)
+        return drawing
+
+    def invalidate(self, workflow_id):
+        """Drops the graphs of a Workflow, whose names must start with its id"""
+        with self._lock:
+            for name in [name for name in self._graphs if name[0] == workflow_id]:
+                del self._graphs[name]
+
+    def __len__(self):
+        return len(self._graphs)
@@ -1,16 +1,19 @@
-import itertools as it
-from operator import attrgetter
-
-from flask import Markup, render_template, Blueprint, redirect, url_for, flash, abort, request, g
-from sqlalchemy import desc
+from flask import Markup, render_template, Blueprint, redirect, url_for, flash, abort, request, g, Response, jsonify
+from sqlalchemy import desc, func
 
 from cosmos.api import Workflow, Stage, Task, TaskStatus
-from ..job.JobManager import JobManager
 from . import filters
-from ..graph.draw import draw_task_graph, draw_stage_graph
+from ..graph.draw import draw_task_graph, draw_stage_graph, draw_stage_summary_graph, draw_stage_subgraph
+from .metrics import prometheus_metrics, stage_stats
+from .task_table import TASK_TABLE_COLUMNS, SORT_COLUMNS, task_page, task_row, drm_statuses
+from .taskgraph import GraphCache, graph_key, stage_subgraph
+
+#: Workflows with more Tasks than this are drawn as a graph of their Stages, and only this many Tasks of a Stage are
+#: drawn, so that graphviz lays them out quickly
+MAX_TASK_GRAPH_SIZE = 500
 
 
-def gen_bprint(session):
+def gen_bprint(session, drm_options=None):
 
     def get_workflow(id):
         return session.query(Workflow).filter_by(id=id).one()
@@ -18,11 +21,13 @@ def gen_bprint(session):
     bprint = Blueprint('cosmos', __name__, template_folder='templates', static_folder='static',
                        static_url_path='/cosmos/static')
     filters.add_filters(bprint)
+    graph_cache = GraphCache()
 
     @bprint.route('/workflow/delete/<int:id>')
     def workflow_delete(id):
         e = get_workflow(id)
         e.delete()
+        graph_cache.invalidate(id)
         flash('Deleted %s' % e)
         return redirect(url_for('cosmos.index'))
 
@@ -36,30 +41,83 @@ def gen_bprint(session):
     def home():
         return index()
 
+    @bprint.route('/metrics')
+    def metrics():
+        # ie /metrics?workflow=a&workflow=b to only export some Workflows
+        text = prometheus_metrics(session, request.args.getlist('workflow') or None)
+        session.expire_all()
+        return Response(text, mimetype='text/plain; version=0.0.4')
+
     @bprint.route('/workflow/<name>/')
     # @bprint.route('/workflow/<int:id>/')
     def workflow(name):
         workflow = session.query(Workflow).filter_by(name=name).one()
-        return render_template('cosmos/workflow.html', workflow=workflow)
+        return render_template('cosmos/workflow.html', workflow=workflow,
+                               stage_stats=stage_stats(session, workflow.id))
 
 
-    @bprint.route('/workflow/<workflow_name>/<stage_name>/')
-    def stage(workflow_name, stage_name):
+    def get_stage(workflow_name, stage_name):
         ex = session.query(Workflow).filter_by(name=workflow_name).one()
-        stage = session.query(Stage).filter_by(workflow_id=ex.id, name=stage_name).one()
+        stage = session.query(Stage).filter_by(workflow_id=ex.id, name=stage_name).first()
         if stage is None:
-            return abort(404)
-        submitted = filter(lambda t: t.status == TaskStatus.submitted, stage.tasks)
-        jm = JobManager(get_submit_args=None)
+            abort(404)
+        return stage
 
-        f = attrgetter('drm')
-        drm_statuses = {}
-        for drm, tasks in it.groupby(sorted(submitted, key=f), f):
-            drm_statuses.update(jm.get_drm(drm).drm_statuses(list(tasks), log_errors=False))
+    @bprint.route('/workflow/<workflow_name>/<stage_name>/')
+    def stage(workflow_name, stage_name):
+        # the table of Tasks is read page by page from stage_tasks_datatable
+        stage = get_stage(workflow_name, stage_name)
+        return render_template('cosmos/stage.html', stage=stage,
+                               stats=stage_stats(session, stage.workflow_id, stage.id)[stage.id],
+                               columns=TASK_TABLE_COLUMNS)
+
+    def get_task_page(stage, **kwargs):
+        try:
+            total, filtered, tasks = task_page(session, stage.id, **kwargs)
+        except ValueError as e:
+            abort(400, str(e))
+        statuses = drm_statuses(tasks, drm_options)
+        rows = [task_row(t, statuses.get(t.drm_jobID, '')) for t in tasks]
+        session.expire_all()
+        return total, filtered, rows
 
-        return render_template('cosmos/stage.html', stage=stage, drm_statuses=drm_statuses)
-        # x=filter(lambda t: t.status == TaskStatus.submitted, stage.tasks))
+    @bprint.route('/workflow/<workflow_name>/<stage_name>/tasks.json')
+    def stage_tasks(workflow_name, stage_name):
+        """
+        A page of the Tasks of a Stage, ie ?after=<id of the last Task of the previous page>&limit=100&status=failed.
+        Also takes search, order_by, desc, before and start; see :func:`cosmos.web.task_table.task_page`.
+        """
+        stage = get_stage(workflow_name, stage_name)
+        args = request.args
+        status = args.get('status')
+        if status is not None and status not in TaskStatus.__members__:
+            abort(400, 'unknown status %s' % status)
+        order_by = args.get('order_by', 'id')
+        if order_by not in SORT_COLUMNS:
+            abort(400, 'cannot order by %s' % order_by)
+        limit = min(args.get('limit', 100, type=int), 1000)
+        total, filtered, rows = get_task_page(stage, start=args.get('start', 0, type=int), length=limit,
+                                              search=args.get('search'),
+                                              status=TaskStatus[status] if status is not None else None,
+                                              order_by=order_by, descending=args.get('desc', 0, type=int) == 1,
+                                              after=args.get('after', type=int), before=args.get('before', type=int))
+        return jsonify(total=total, filtered=filtered, tasks=rows,
+                       next_after=rows[-1]['id'] if len(rows) == limit else None)
 
+    @bprint.route('/workflow/<workflow_name>/<stage_name>/tasks/datatable')
+    def stage_tasks_datatable(workflow_name, stage_name):
+        """The server side processing of the stage page's DataTable, which also sends after or before to page by id"""
+        stage = get_stage(workflow_name, stage_name)
+        args = request.args
+        column = TASK_TABLE_COLUMNS[args.get('iSortCol_0', 0, type=int) % len(TASK_TABLE_COLUMNS)]
+        total, filtered, rows = get_task_page(stage, start=args.get('iDisplayStart', 0, type=int),
+                                              length=min(args.get('iDisplayLength', 50, type=int), 1000),
+                                              search=args.get('sSearch') or None,
+                                              order_by=column if column in SORT_COLUMNS else 'id',
+                                              descending=args.get('sSortDir_0') == 'desc',
+                                              after=args.get('after', type=int), before=args.get('before', type=int))
+        return jsonify(sEcho=args.get('sEcho', 0, type=int), iTotalRecords=total, iTotalDisplayRecords=filtered,
+                       aaData=rows)
 
     @bprint.route('/workflow/<int:ex_id>/stage/<stage_name>/delete/<int:delete_descendants>')
     def stage_delete(ex_id, stage_name, delete_descendants):
@@ -69,6 +127,7 @@ def gen_bprint(session):
         flash('Deleted %s' % s)
         ex_url = s.workflow.url
         s.delete(descendants=delete_descendants)
+        graph_cache.invalidate(ex_id)
         return redirect(ex_url)
 
     # @bprint.route('/task/<int:id>/')
@@ -106,18 +165,49 @@ def gen_bprint(session):
     def taskgraph(id, type):
         from ..graph.draw import pygraphviz_available
         ex = get_workflow(id)
+        note = None
+        if type == 'task':
+            num_tasks = session.query(func.count(Task.id)).join(Stage).filter(Stage.workflow_id == ex.id).scalar()
+            if num_tasks > MAX_TASK_GRAPH_SIZE:
+                note = '%s Tasks are too many to draw at once, so the Stages are drawn instead.  Click a Stage to ' \
+                       'draw its Tasks.' % num_tasks
+                type = 'summary'
 
         if pygraphviz_available:
             if type == 'task':
-                svg = Markup(draw_task_graph(ex.task_graph(), url=True))
+                draw = lambda: draw_task_graph(ex.task_graph(), url=True)
+            elif type == 'summary':
+                draw = lambda: draw_stage_summary_graph(ex.stage_graph(), stage_stats(session, ex.id),
+                                                        url=stage_taskgraph_url)
             else:
-                svg = Markup(draw_stage_graph(ex.stage_graph(), url=True))
+                draw = lambda: draw_stage_graph(ex.stage_graph(), url=True)
+            svg = Markup(graph_cache.get((ex.id, type), graph_key(session, ex.id), draw))
         else:
             svg = 'Pygraphviz not installed, cannot visualize.  (Usually: apt-get install graphviz && pip install pygraphviz)'
 
-        return render_template('cosmos/taskgraph.html', workflow=ex, type=type,
+        return render_template('cosmos/taskgraph.html', workflow=ex, type=type, note=note,
                                svg=svg)
 
+    def stage_taskgraph_url(stage):
+        return url_for('.stage_taskgraph', id=stage.workflow_id, stage_id=stage.id)
+
+    @bprint.route('/workflow/<int:id>/taskgraph/stage/<int:stage_id>/')
+    def stage_taskgraph(id, stage_id):
+        from ..graph.draw import pygraphviz_available
+        ex = get_workflow(id)
+        stage = session.query(Stage).filter_by(workflow_id=ex.id, id=stage_id).first()
+        if stage is None:
+            abort(404)
+
+        if pygraphviz_available:
+            draw = lambda: draw_stage_subgraph(stage_subgraph(session, stage, MAX_TASK_GRAPH_SIZE), stage,
+                                               url=stage_taskgraph_url)
+            svg = Markup(graph_cache.get((ex.id, 'stage', stage.id), graph_key(session, ex.id, stage.id), draw))
+        else:
+            svg = 'Pygraphviz not installed, cannot visualize.  (Usually: apt-get install graphviz && pip install pygraphviz)'
+
+        return render_template('cosmos/taskgraph.html', workflow=ex, type='stage', stage=stage, svg=svg)
+
     # @bprint.route('/workflow/<int:id>/taskgraph/svg/<type>/')
     # def taskgraph_svg(id, type, ):
     #     e = get_workflow(id)
@@ -0,0 +1,107 @@
+"""
+Fixtures and stand-ins shared by the tests: a Cosmos database in a tmpdir with a Workflow to run on it, and a
+`FakeTask` for testing the scheduler, JobManager and DRMs without one.
+"""
+import logging
+import os
+
+import pytest
+
+from cosmos.api import Cosmos, TaskStatus, WorkflowStatus
+
+
+def echo(word):
+    return 'echo %s' % word
+
+
+def fail():
+    return 'exit 1'
+
+
+@pytest.fixture
+def database_url(tmpdir):
+    return 'sqlite:///%s' % tmpdir.join('db.sqlite')
+
+
+@pytest.fixture
+def cosmos(database_url):
+    cosmos = Cosmos(database_url, default_drm='local')
+    cosmos.initdb()
+    yield cosmos
+    cosmos.close()
+
+
+@pytest.fixture
+def wf(cosmos):
+    """A Workflow named test.  It is detached from the session afterwards, so its atexit handler still works."""
+    wf = cosmos.start('test', skip_confirm=True, primary_log_path=None)
+    yield wf
+
+    # Workflow.run registers an atexit handler that reads the status of the Workflow, long after this session is gone.
+    # Do what it would while there is a session (the web app removes the one it was in after each request), then load
+    # everything it reads and detach the Workflow, and stop logging to pytest's captured stderr, which is closed by
+    # then.
+    session = cosmos.session
+    if wf not in session:
+        session.expunge_all()
+        session.add(wf)
+    if wf.status in [WorkflowStatus.running, WorkflowStatus.failed_but_running]:
+        wf.terminate(due_to_failure=True)
+    session.refresh(wf)
+    session.expunge(wf)
+    if wf._log is not None:
+        for h in list(wf._log.handlers):
+            h.close()
+            wf._log.removeHandler(h)
+
+
+@pytest.fixture
+def log_out_dir_func(tmpdir):
+    return lambda task: str(tmpdir.join(task.stage.name, task.uid))
+
+
+class FakeTask(object):
+    """
+    A stand-in for a Task with the attributes the scheduler, JobManager and DRMs read.  Anything else is set with
+    keyword arguments, ie FakeTask('1', drm='ge', drm_jobID='101')
+    """
+    NOOP = False
+    status = TaskStatus.no_attempt
+    drm = 'local'
+    drm_jobID = None
+    core_req = 1
+    mem_req = None
+    time_req = None
+    submitted_on = None
+    profile_fields = []
+    log_dir = None
+    log = logging.getLogger('FakeTask')
+
+    def __init__(self, id, **kwargs):
+        self.id = self.uid = id
+        self.resource_req = {}
+        # DRMs log to the task's Workflow
+        self.workflow = self
+        self.__dict__.update(kwargs)
+
+    def _log_path(self, name):
+        return os.path.join(self.log_dir, name) if self.log_dir else None
+
+    @property
+    def output_command_script_path(self):
+        return self._log_path('command.sh')
+
+    @property
+    def output_stdout_path(self):
+        return self._log_path('stdout')
+
+    @property
+    def output_stderr_path(self):
+        return self._log_path('stderr')
+
+    @property
+    def output_profile_path(self):
+        return self._log_path('profile.json')
+
+    def __repr__(self):
+        return '<FakeTask %s>' % self.id
@@ -0,0 +1,42 @@
+import os
+import subprocess
+import tempfile
+
+from cosmos.job.drm.DRM_Base import JobSpec
+from cosmos.job.drm.drm_ge import DRM_GE
+from cosmos.job.drm.drm_lsf import DRM_LSF
+from cosmos.job.drm.drm_slurm import DRM_SLURM
+from cosmos.job.drm.util import create_array_script, expand_index_ranges
+
+
+def test_expand_index_ranges():
+    assert expand_index_ranges('1-3,7,9-13:2') == ['1', '2', '3', '7', '9', '11', '13']
+    assert expand_index_ranges('4-6%2') == ['4', '5', '6']
+    assert expand_index_ranges('undefined') == []
+
+
+def test_array_native_specification():
+    assert DRM_GE(None).array_native_specification('-cwd -pe orte 2 -N "stage[uid]" -q all') == \
+        '-cwd -pe orte 2 -q all'
+    assert DRM_SLURM(None).array_native_specification('-c 2 -J stage[uid] --mem 10') == '-c 2 --mem 10'
+    assert DRM_LSF(None).array_native_specification('-n 2 -J "stage[uid]"') == '-n 2'
+    assert DRM_GE(None).array_native_specification(None) == ''
+
+
+def test_create_array_script():
+    tmp_dir = tempfile.mkdtemp()
+    specs = []
+    for i in range(3):
+        command_script_path = os.path.join(tmp_dir, 'command%d.sh' % i)
+        with open(command_script_path, 'w') as fh:
+            fh.write('#!/bin/bash\necho out %d\necho err %d >&2\n' % (i, i))
+        os.chmod(command_script_path, 0o755)
+        specs.append(JobSpec(command_script_path, os.path.join(tmp_dir, 'std out%d' % i),
+                             os.path.join(tmp_dir, 'stderr%d' % i), None))
+
+    script = create_array_script(specs, 'ARRAY_INDEX')
+    subprocess.check_call([script], env=dict(os.environ, ARRAY_INDEX='2'))
+    assert open(specs[1].stdout_path).read() == 'out 1\n'
+    assert open(specs[1].stderr_path).read() == 'err 1\n'
+    assert not os.path.exists(specs[0].stdout_path)
+    assert subprocess.call([script], env=dict(os.environ, ARRAY_INDEX='4'), stderr=open(os.devnull, 'w')) == 1
@@ -0,0 +1,66 @@
+import sqlalchemy
+
+from conftest import echo
+from cosmos.api import Task, TaskStatus
+from cosmos.models.Task import TaskEdge
+from cosmos.util import sqla
+from cosmos.util.sqla import bulk_insert_pending
+
+
+def edges(session):
+    """:returns: (parent id, child id) tuples.  Task.parents stores a Task's id in TaskEdge.parent_id!"""
+    return sorted(session.query(TaskEdge.child_id, TaskEdge.parent_id))
+
+
+def test_bulk_insert_pending(tmpdir, monkeypatch, cosmos):
+    monkeypatch.chdir(tmpdir)
+    session = cosmos.session
+
+    wf = cosmos.start('test', skip_confirm=True)
+    a = [wf.add_task(echo, dict(word=i), uid=str(i), stage_name='a') for i in range(3)]
+    b = wf.add_task(echo, dict(word='b'), parents=a, uid='b', stage_name='b')
+    # 2 stages, 4 tasks, 3 task edges and 1 stage edge
+    assert bulk_insert_pending(session, wf.stages + wf.tasks) == 10
+    assert [t.id for t in a + [b]] == [1, 2, 3, 4]
+    assert not session.new and all(sqlalchemy.inspect(t).persistent for t in a + [b])
+    session.commit()
+
+    session.expunge_all()
+    assert edges(session) == [(1, 4), (2, 4), (3, 4)]
+    b = session.query(Task).get(4)
+    assert b.stage.name == 'b' and b.stage.parents[0].name == 'a'
+    assert b.status == TaskStatus.no_attempt and b.params == dict(word='b') and b.successful is False
+    for t in session.query(Task):
+        t.successful = True
+    session.commit()
+
+    # new Tasks with persistent parents and children
+    wf = cosmos.start('test', skip_confirm=True)
+    a = [wf.add_task(echo, dict(word=i), uid=str(i), stage_name='a') for i in range(4)]
+    b = wf.add_task(echo, dict(word='b'), parents=a, uid='b', stage_name='b')
+    c = wf.add_task(echo, dict(word='c'), parents=[b, a[3]], uid='c', stage_name='c')
+    # Stage c, 2 Tasks, 3 Task edges and 2 Stage edges
+    assert bulk_insert_pending(session, wf.stages + wf.tasks) == 8
+    assert (a[3].id, c.id) == (5, 6)
+    session.commit()
+    assert edges(session) == [(1, 4), (2, 4), (3, 4), (4, 6), (5, 4), (5, 6)]
+    assert [s.name for s in c.stage.parents] in (['a', 'b'], ['b', 'a'])
+
+
+def test_bulk_insert_pending_in_order(tmpdir, monkeypatch, cosmos):
+    monkeypatch.chdir(tmpdir)
+    wf = cosmos.start('test', skip_confirm=True)
+    tasks = [wf.add_task(echo, dict(word=i), uid=str(i), stage_name='ab'[i % 2]) for i in range(4)]
+    bulk_insert_pending(cosmos.session, wf.stages + tasks)
+    assert [t.id for t in tasks] == [1, 2, 3, 4]
+
+
+def test_bulk_insert_pending_flushes_without_id_allocation(tmpdir, monkeypatch, cosmos):
+    monkeypatch.chdir(tmpdir)
+    monkeypatch.setattr(sqla, 'ID_ALLOCATING_DIALECTS', ())
+    wf = cosmos.start('test', skip_confirm=True)
+    a = wf.add_task(echo, dict(word='a'), uid='a', stage_name='a')
+    b = wf.add_task(echo, dict(word='b'), parents=[a], uid='b', stage_name='b')
+    assert bulk_insert_pending(cosmos.session, wf.stages + wf.tasks) == 4
+    cosmos.session.commit()
+    assert edges(cosmos.session) == [(a.id, b.id)]
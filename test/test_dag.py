@@ -0,0 +1,53 @@
+import pytest
+
+from cosmos.graph.dag import DAG
+
+
+def diamond():
+    """1 -> 2, 1 -> 3, (2, 3) -> 4, and 5 on its own.  The edge to 6 is ignored."""
+    return DAG([4, 3, 2, 1, 5], [(1, 2), (1, 3), (2, 4), (3, 4), (4, 6), (1, 2)])
+
+
+def test_structure():
+    g = diamond()
+    assert len(g) == 5 and list(g) == [1, 2, 3, 4, 5]
+    assert g.children(1) == [2, 3] and g.parents(4) == [2, 3]
+    assert [g.in_degree(n) for n in g] == [0, 1, 1, 2, 0]
+    assert g.sources() == [1, 5]
+    assert sorted(g.edges()) == [(1, 2), (1, 3), (2, 4), (3, 4)]
+    assert g.descendants(1) == {2, 3, 4}
+    order = g.topological_order()
+    assert order.index(1) < order.index(2) < order.index(4) and order.index(3) < order.index(4)
+
+
+def test_remove():
+    g = diamond()
+    assert g.remove(1) == [2, 3]
+    assert g.remove(2) == []
+    assert g.in_degree(4) == 1 and g.parents(4) == [3]
+    assert 2 not in g and len(g) == 3
+    assert g.remove(3) == [4]
+
+    g = diamond()
+    g.remove(1)
+    assert sorted(g.remove_with_descendants(2)) == [2, 4]
+    assert list(g) == [3, 5] and g.children(3) == [] and g.topological_order() == [3, 5]
+    with pytest.raises(AssertionError):
+        g.remove(4)
+
+
+def test_subgraph_and_networkx():
+    g = diamond()
+    sub = g.subgraph([2, 3, 4, 7])
+    assert list(sub) == [2, 3, 4] and sub.sources() == [2, 3]
+
+    nodes = {n: 'node_%s' % n for n in g}
+    nx_graph = g.to_networkx(nodes)
+    assert sorted(nx_graph.edges()) == [('node_1', 'node_2'), ('node_1', 'node_3'),
+                                        ('node_2', 'node_4'), ('node_3', 'node_4')]
+    assert 'node_5' in nx_graph
+
+
+def test_cycles_are_detected():
+    with pytest.raises(AssertionError):
+        DAG([1, 2], [(1, 2), (2, 1)]).topological_order()
@@ -0,0 +1,33 @@
+from conftest import echo
+from cosmos.models.Stage import Stage, StageEdge
+from cosmos.models.Task import Task, TaskEdge
+
+
+def test_delete_descendants(tmpdir, monkeypatch, cosmos):
+    monkeypatch.chdir(tmpdir)
+    session = cosmos.session
+
+    wf = cosmos.start('test', skip_confirm=True)
+    a = [wf.add_task(echo, dict(word=i), uid=str(i), stage_name='a') for i in range(3)]
+    b = [wf.add_task(echo, dict(word=i), parents=[a[i]], uid=str(i), stage_name='b') for i in range(3)]
+    c = wf.add_task(echo, dict(word='c'), parents=b, uid='0', stage_name='c')
+    session.commit()
+    a_ids, b_ids = [t.id for t in a], [t.id for t in b]
+
+    assert b[0].descendants() == {c}
+    a[0].delete(descendants=True)
+    assert sorted(t for t, in session.query(Task.id)) == sorted(a_ids[1:] + b_ids[1:])
+    assert sorted(session.query(TaskEdge.child_id, TaskEdge.parent_id)) == [(a_ids[1], b_ids[1]),
+                                                                            (a_ids[2], b_ids[2])]
+    # the DAG is kept, without the deleted Tasks
+    assert sorted(wf.task_dag()) == sorted(a_ids[1:] + b_ids[1:])
+
+    # the descendants of the other Tasks of `a` don't include the Tasks that were already deleted
+    assert wf.task_dag().descendants(a_ids[1]) == {b_ids[1]}
+
+    b[2].delete()
+    assert sorted(t for t, in session.query(Task.id)) == sorted(a_ids[1:] + b_ids[1:2])
+
+    wf.stages[0].delete(descendants=True)
+    assert session.query(Stage).count() == 0
+    assert session.query(Task).count() == session.query(TaskEdge).count() == session.query(StageEdge).count() == 0
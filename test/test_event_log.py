@@ -0,0 +1,92 @@
+import json
+
+import pytest
+
+from conftest import echo, fail
+from cosmos import signal_task_status_change
+from cosmos.api import Cosmos, TaskStatus, read_events, replay_event_log
+from cosmos.models import Workflow
+from cosmos.models.Task import Task
+
+
+@pytest.fixture
+def event_log(tmpdir, wf, log_out_dir_func):
+    """:returns: the path of the event log of a run of a Workflow that failed"""
+    a = [wf.add_task(echo, dict(word=i), uid=str(i), stage_name='a') for i in range(3)]
+    wf.add_task(fail, parents=a, uid='b', stage_name='b', max_attempts=2)
+    path = str(tmpdir.join('events.ndjson'))
+    assert not wf.run(event_log=path, log_out_dir_func=log_out_dir_func)
+    return path
+
+
+def test_run_records_events(event_log):
+    events = list(read_events(event_log))
+
+    b = [(e['status'], e['attempt']) for e in events if e['event'] == 'task' and e['uid'] == 'b']
+    assert b == [('submitted', 1), ('failed', 1), ('no_attempt', 2), ('submitted', 2), ('failed', 2)]
+    a = [e for e in events if e['event'] == 'task' and e['stage'] == 'a' and e['status'] == 'successful']
+    assert len(a) == 3 and all(e['exit_status'] == 0 and e['wall_time'] is not None for e in a)
+
+    assert [e['status'] for e in events if e['event'] == 'workflow'] == ['running', 'failed_but_running', 'failed']
+    assert any(e['event'] == 'poll' and e['drm'] == 'local' for e in events)
+    queue = [(e['queued'], e['running']) for e in events if e['event'] == 'queue']
+    assert queue[-1] == (0, 0) and all(q != r for q, r in zip(queue, queue[1:]))
+    times = [e['t'] for e in events]
+    assert times == sorted(times)
+    assert set((e['workflow_id'], e['run']) for e in events) == {(1, events[0]['run'])}
+
+
+def test_replay(database_url, event_log):
+    # lose everything the run committed, as if it was killed before committing
+    other = Cosmos(database_url)
+    other.session.query(Task).update(dict(_status=TaskStatus.no_attempt, successful=False))
+    other.session.commit()
+
+    assert replay_event_log(event_log, other.session) == 4 + 2 + 1
+    statuses = dict(other.session.query(Task.uid, Task._status))
+    assert statuses == {'0': TaskStatus.successful, '1': TaskStatus.successful, '2': TaskStatus.successful,
+                        'b': TaskStatus.failed}
+    assert other.session.query(Task).filter_by(uid='b').one().attempt == 2
+
+
+def test_replay_only_the_last_run(database_url, event_log):
+    path = event_log
+    session = Cosmos(database_url).session
+    b_id = session.query(Task.id).filter_by(uid='b').scalar()
+
+    def event(run, **fields):
+        return json.dumps(dict(fields, event='task', workflow_id=1, run=run, t=run, stage='b', attempt=1, drm='local',
+                               drm_jobID=None)) + '\n'
+
+    # an earlier run of a Workflow, with the same ids, in a database that has since been deleted
+    with open(path) as fh:
+        events = fh.read()
+    with open(path, 'w') as fh:
+        fh.write(event(0, id=b_id, uid='gone', status='killed') + event(0, id=b_id + 1, uid='gone', status='failed') +
+                 events)
+    assert replay_event_log(path, session) == 4 + 2 + 1
+    assert session.query(Task._status).filter_by(uid='b').scalar() == TaskStatus.failed
+
+    # a later run in another database
+    with open(path, 'a') as fh:
+        fh.write(event(1e10, id=b_id, uid='other', status='successful'))
+    with pytest.raises(ValueError):
+        replay_event_log(path, session)
+
+
+def test_run_that_raises_closes_the_event_log(tmpdir, monkeypatch, wf):
+    def _run(workflow, session, task_queue):
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(Workflow, '_run', _run)
+    wf.add_task(echo, dict(word='a'), uid='a')
+    receivers = len(signal_task_status_change.receivers)
+    with pytest.raises(KeyboardInterrupt):
+        wf.run(event_log=str(tmpdir.join('events.ndjson')))
+    assert len(signal_task_status_change.receivers) == receivers and wf.event_log is None
+
+
+def test_truncated_last_line(tmpdir):
+    path = tmpdir.join('events.ndjson')
+    path.write('{"event": "queue", "queued": 1, "running": 0, "t": 0}\n{"event": "qu')
+    assert len(list(read_events(str(path)))) == 1
@@ -0,0 +1,102 @@
+import os
+import tempfile
+
+from conftest import FakeTask
+from cosmos.job.drm.drm_ge import AccountingFile, parse_qstat_xml, _is_corrupt
+
+QSTAT_XML = """<?xml version='1.0'?>
+<job_info  xmlns:xsd="http://arc.liv.ac.uk/repos/darcs/sge/source/dist/util/resources/schemas/qstat/qstat.xsd">
+  <queue_info>
+    <job_list state="running">
+      <JB_job_number>100</JB_job_number>
+      <JB_name>stage_a</JB_name>
+      <state>r</state>
+      <slots>1</slots>
+    </job_list>
+    <job_list state="running">
+      <JB_job_number>101</JB_job_number>
+      <JB_name>stage_b</JB_name>
+      <state>r</state>
+      <slots>1</slots>
+      <tasks>1</tasks>
+    </job_list>
+  </queue_info>
+  <job_info>
+    <job_list state="pending">
+      <JB_job_number>101</JB_job_number>
+      <JB_name>stage_b</JB_name>
+      <state>qw</state>
+      <slots>1</slots>
+      <tasks>2-4:1</tasks>
+    </job_list>
+  </job_info>
+</job_info>
+"""
+
+
+def accounting_record(job_number, task_number=0, start_time=1500000010, exit_status=0):
+    return ('all.q:node1:grp:user:job:{job_number}:sge:0:1500000000:{start_time}:1500000070:0:{exit_status}:60:'
+            '50.5:1.5:2048:0:0:0:0:0:0:0:8:16:0:0:0:100:5:NONE:defaultdepartment:NONE:1:{task_number}:52.0:'
+            '1.0:0.5:-U x:0.0:NONE:4194304.0:0:0\n').format(**locals())
+
+
+def test_parse_qstat_xml():
+    qjobs = parse_qstat_xml(QSTAT_XML)
+    assert qjobs['100']['state'] == 'r'
+    assert qjobs['101.1']['state'] == 'r'
+    assert [qjobs['101.%d' % i]['state'] for i in [2, 3, 4]] == ['qw'] * 3
+    assert '101.5' not in qjobs
+    assert parse_qstat_xml('not xml') == {}
+
+
+def test_accounting_file():
+    path = os.path.join(tempfile.mkdtemp(), 'accounting')
+    with open(path, 'w') as fh:
+        fh.write('# Version: 8.1.9\n' + accounting_record(99))
+
+    accounting = AccountingFile(path)
+    with open(path, 'a') as fh:
+        fh.write(accounting_record(100, start_time=0))
+        fh.write(accounting_record(101, task_number=3, exit_status=1))
+        fh.write(accounting_record(102))
+        fh.write(accounting_record(103)[:20])
+
+    accounting.read({'99', '100', '101.3', '103'})
+    assert sorted(accounting.records) == ['100', '101.3']
+    assert _is_corrupt(accounting.records['100'])
+    assert accounting.records['101.3']['exit_status'] == '1'
+    assert accounting.records['101.3']['ru_maxrss'] == '2048K'
+
+    # a valid record replaces a corrupt one, and the partially written line is read once it is complete
+    with open(path, 'a') as fh:
+        fh.write(accounting_record(103)[20:])
+        fh.write(accounting_record(100))
+    accounting.read({'100', '103'})
+    assert not _is_corrupt(accounting.records['100'])
+    assert '103' in accounting.records
+
+
+def test_accounting_timeout_restarts_when_job_reappears(monkeypatch):
+    from cosmos.job.drm import drm_ge
+
+    now = [1000.0]
+    qstat = [{}]
+    monkeypatch.setattr(drm_ge.time, 'time', lambda: now[0])
+    monkeypatch.setattr(drm_ge, '_qstat_all', lambda: qstat[0])
+    monkeypatch.setattr(drm_ge, '_qacct', lambda job_id: None)
+    drm = drm_ge.DRM_GE(None)
+    drm._accounting = False
+    task = FakeTask('100', drm='ge', drm_jobID='100')
+
+    # a qstat hiccup: the job is missing, and has no accounting record
+    assert list(drm.filter_is_done([task])) == []
+    # it is running again
+    qstat[0] = {'100': dict(state='r')}
+    now[0] += drm.accounting_timeout
+    assert list(drm.filter_is_done([task])) == []
+    # it finished long after the hiccup, and its record isn't written yet
+    qstat[0] = {}
+    now[0] += drm.accounting_timeout
+    assert list(drm.filter_is_done([task])) == []
+    now[0] += drm.accounting_timeout
+    assert list(drm.filter_is_done([task])) == [(task, dict(exit_status=None))]
@@ -0,0 +1,50 @@
+from cosmos.core.history import ResourcePredictor, quantile, linear_fit
+
+
+def predictor(rows, **kwargs):
+    """A ResourcePredictor whose history for Stage 'align' is `rows` of (wall_time, cpu_time, max_rss_mem_kb,
+    input_size_kb)"""
+    p = ResourcePredictor(session=None, **kwargs)
+    p._history.update(align=rows, never_run=[])
+    return p
+
+
+def test_quantile_and_fit():
+    assert quantile([3, 1, 2, 4, 5], 0.5) == 3
+    assert quantile([0, 10], 0.95) == 9.5
+    assert linear_fit([1, 2, 3], [3, 5, 7]) == (1, 2, 1)
+    assert linear_fit([1, 1], [3, 5]) is None
+
+
+def test_predict_from_quantiles():
+    rows = [(60 * i, 120 * i, 1024 * 100 * i, None) for i in range(1, 11)]
+    p = predictor(rows, quantile=0.5, margin=1)
+    assert p.predict('align') == dict(mem_req=550, time_req=330, core_req=2)
+    assert p.predict('never_run') == {}
+
+    assert predictor(rows, quantile=1, margin=1.5, time_unit=60).predict('align') == \
+           dict(mem_req=1500, time_req=15, core_req=2)
+    assert predictor(rows[:4], min_samples=5).predict('align') == {}
+
+
+def test_predict_from_input_size():
+    # memory is 2x the input size, wall time does not depend on it
+    rows = [(600 + 60 * (i % 2), 600, 2 * 1024 * 100 * i, 1024 * 100 * i) for i in range(1, 11)]
+    p = predictor(rows, quantile=1, margin=1)
+    assert p.predict('align', size_kb=1024 * 5000)['mem_req'] == 10000
+    assert p.predict('align', size_kb=1024 * 5000)['time_req'] == 660
+    # without an input size, fall back to the quantile
+    assert p.predict('align')['mem_req'] == 2000
+
+
+def align(mem_req=4096):
+    return 'echo align'
+
+
+def test_add_task_prefers_signature_defaults_to_predictions(wf):
+    wf.resource_predictor = predictor([(600, 1800, 1024 * 100, None)] * 10, quantile=1, margin=1)
+
+    task = wf.add_task(align, uid='a')
+    assert (task.mem_req, task.core_req, task.time_req) == (4096, 3, 600)
+    task = wf.add_task(align, dict(mem_req=10), uid='b', core_req=1)
+    assert (task.mem_req, task.core_req) == (10, 1)
@@ -0,0 +1,41 @@
+import pytest
+
+from conftest import echo
+
+
+def test_stage_and_task_indexes_survive_resume_and_deletion(tmpdir, monkeypatch, cosmos):
+    monkeypatch.chdir(tmpdir)
+
+    wf = cosmos.start('test', skip_confirm=True)
+    a = [wf.add_task(echo, dict(word=i), uid=str(i), stage_name='a') for i in range(3)]
+    b = wf.add_task(echo, dict(word='b'), parents=a, uid='0', stage_name='b')
+    assert [s.name for s in wf.stages] == ['a', 'b']
+    assert wf.stages[0].get_task('1') is a[1]
+    assert wf.stages[1].get_task('0') is b
+    assert wf.stages[0].get_task('3', None) is None
+    with pytest.raises(ValueError):
+        wf.add_task(echo, dict(word=0), uid='0', stage_name='a')
+
+    for t in a[:2]:
+        t.successful = True
+    cosmos.session.commit()
+    a0_id = a[0].id
+
+    # resuming deletes the unsuccessful Tasks
+    wf = cosmos.start('test', skip_confirm=True)
+    stage_a = wf.stages[0]
+    assert sorted(t.uid for t in stage_a.tasks) == ['0', '1']
+    assert wf.add_task(echo, dict(word=0), uid='0', stage_name='a').id == a0_id
+    a2 = wf.add_task(echo, dict(word=2), uid='2', stage_name='a')
+    assert a2.id is None and stage_a.get_task('2') is a2
+    b = wf.add_task(echo, dict(word='b'), parents=stage_a.tasks, uid='0', stage_name='b')
+    assert wf.stages[1].name == 'b' and wf.stages[1].get_task('0') is b
+    cosmos.session.commit()
+
+    stage_a.get_task('1').delete()
+    assert stage_a.get_task('1', None) is None
+    assert sorted(t.uid for t in stage_a.tasks) == ['0', '2']
+
+    wf.stages[1].delete()
+    assert [s.name for s in wf.stages] == ['a']
+    assert wf.add_task(echo, dict(word='b'), uid='0', stage_name='b').stage.name == 'b'
@@ -0,0 +1,75 @@
+from conftest import echo, fail
+from cosmos.core.history import quantile
+from cosmos.models.Stage import Stage
+from cosmos.models.Task import Task
+from cosmos.models.Workflow import Workflow
+from cosmos.web.metrics import stage_stats, _wall_time_quantiles
+
+
+def parse(text):
+    """:returns: (dict) the samples of Prometheus text, as metric name -> {frozenset of labels: value}"""
+    samples = {}
+    for line in text.splitlines():
+        if line.startswith('#'):
+            continue
+        series, value = line.rsplit(' ', 1)
+        name, labels = series.rstrip('}').split('{')
+        labels = frozenset(tuple(kv.split('=')) for kv in labels.split(','))
+        samples.setdefault(name, {})[labels] = float(value)
+    return samples
+
+
+def get(samples, name, **labels):
+    return samples[name][frozenset((k, '"%s"' % v) for k, v in labels.items())]
+
+
+def test_metrics_endpoint(cosmos, wf, log_out_dir_func):
+    a = [wf.add_task(echo, dict(word=i), uid=str(i), stage_name='a', core_req=2) for i in range(3)]
+    wf.add_task(fail, parents=a, uid='b', stage_name='b', max_attempts=2)
+    assert not wf.run(log_out_dir_func=log_out_dir_func)
+
+    client = cosmos.init_flask().test_client()
+    response = client.get('/metrics?workflow=test')
+    assert response.status_code == 200 and response.mimetype == 'text/plain'
+    samples = parse(response.data)
+
+    assert get(samples, 'cosmos_workflow_status', workflow='test', status='failed') == 1
+    assert get(samples, 'cosmos_tasks', workflow='test', stage='a', status='successful') == 3
+    assert get(samples, 'cosmos_tasks', workflow='test', stage='b', status='failed') == 1
+    assert get(samples, 'cosmos_tasks', workflow='test', stage='b', status='submitted') == 0
+    assert get(samples, 'cosmos_running_cores', workflow='test', stage='a') == 0
+    assert get(samples, 'cosmos_task_submissions_total', workflow='test', stage='a') == 3
+    assert get(samples, 'cosmos_task_submissions_total', workflow='test', stage='b') == 2
+    assert get(samples, 'cosmos_task_retries_total', workflow='test', stage='b') == 1
+    assert get(samples, 'cosmos_task_finishes_total', workflow='test', stage='a') == 3
+    assert 0 <= get(samples, 'cosmos_task_queue_wait_seconds', workflow='test', stage='a') < 60
+    assert get(samples, 'cosmos_task_wall_time_seconds', workflow='test', stage='a', quantile='0.95') >= 0
+    # no Task of b succeeded
+    assert not [labels for labels in samples['cosmos_task_wall_time_seconds'] if ('stage', '"b"') in labels]
+
+    assert 'cosmos_tasks{' not in client.get('/metrics?workflow=other').data
+
+    # the quantiles taken by the database match the ones taken in Python
+    for wall_time, uid in zip([7, 1, 4], ['0', '1', '2']):
+        cosmos.session.query(Task).filter_by(uid=uid).update(dict(wall_time=wall_time))
+    cosmos.session.commit()
+    query = cosmos.session.query(Task).join(Stage, Stage.id == Task.stage_id) \
+        .join(Workflow, Workflow.id == Stage.workflow_id)
+    assert _wall_time_quantiles(cosmos.session, query, [0, 0.5, 0.95, 1]) == \
+        {('test', 'a'): [quantile([7, 1, 4], q) for q in [0, 0.5, 0.95, 1]]}
+
+
+def test_stage_stats_and_workflow_page(cosmos, wf, log_out_dir_func):
+    a = [wf.add_task(echo, dict(word=i), uid=str(i), stage_name='a', core_req=i + 1) for i in range(3)]
+    wf.add_task(fail, parents=a, uid='b', stage_name='b')
+    assert not wf.run(log_out_dir_func=log_out_dir_func)
+    stage_a, stage_b = wf.stages
+
+    stats = stage_stats(cosmos.session, wf.id)
+    assert (stats[stage_a.id].num_successful, stats[stage_a.id].num_tasks, stats[stage_a.id].num_failed) == (3, 3, 0)
+    assert stats[stage_a.id].avg('core_req') == 2 and stats[stage_a.id].avg('io_wait') is None
+    assert stats[stage_b.id].percent_failed() == 100 and stats[stage_b.id].percent_successful() == 0
+
+    response = cosmos.init_flask().test_client().get('/workflow/test/')
+    assert response.status_code == 200
+    assert '3/3' in response.data and '0/1' in response.data
@@ -0,0 +1,143 @@
+import threading
+import time
+
+import pytest
+
+import datetime
+
+from conftest import FakeTask, echo
+from cosmos.api import AdaptivePollPolicy
+from cosmos.job.JobManager import JobManager
+from cosmos.job.drm.DRM_Base import DRM
+
+
+class FakeDRM(DRM):
+    """Jobs are done once they are in `done`.  Polls take `delay` seconds."""
+
+    def __init__(self, name, poll_interval, delay=0):
+        super(FakeDRM, self).__init__(None)
+        self.name = name
+        self.poll_interval = poll_interval
+        self.delay = delay
+        self.done = set()
+        self.polls = 0
+        self.threads = set()
+
+    def filter_is_done(self, tasks):
+        self.polls += 1
+        self.threads.add(threading.current_thread().name)
+        time.sleep(self.delay)
+        return [(t, dict(exit_status=0)) for t in tasks if t.drm_jobID in self.done]
+
+
+def job_manager(concurrent_polling, *drms):
+    jm = JobManager(get_submit_args=None, concurrent_polling=concurrent_polling)
+    jm.drms = {drm.name: drm for drm in drms}
+    return jm
+
+
+def test_drms_are_polled_on_their_own_cadence():
+    fast, slow = FakeDRM('fast', 0), FakeDRM('slow', 60)
+    jm = job_manager(False, fast, slow)
+    jm.running_tasks = [FakeTask('1', drm='fast', drm_jobID='1'), FakeTask('2', drm='slow', drm_jobID='2')]
+
+    for _ in range(3):
+        assert list(jm.get_finished_tasks()) == []
+    assert (fast.polls, slow.polls) == (3, 1)
+    assert jm.poll_interval == 0
+
+    fast.done.add('1')
+    assert [t.id for t in jm.get_finished_tasks()] == ['1']
+    assert 55 < jm.poll_interval <= 60
+
+
+def test_slow_drm_does_not_hold_up_others():
+    fast, slow = FakeDRM('fast', 0.01), FakeDRM('slow', 0.01, delay=2)
+    jm = job_manager(True, fast, slow)
+    tasks = [FakeTask('1', drm='fast', drm_jobID='1'), FakeTask('2', drm='slow', drm_jobID='2')]
+    jm.running_tasks = list(tasks)
+    fast.done.add('1')
+    slow.done.add('2')
+
+    start = time.time()
+    finished = []
+    while len(finished) < 1:
+        finished += jm.get_finished_tasks()
+        jm.wait(jm.poll_interval)
+    assert finished == tasks[:1] and finished[0].exit_status == 0
+    assert time.time() - start < 1
+
+    while len(finished) < 2:
+        finished += jm.get_finished_tasks()
+        jm.wait(jm.poll_interval)
+    assert finished == tasks and slow.polls == 1
+    assert fast.threads == {'cosmos_poll_fast'} and slow.threads == {'cosmos_poll_slow'}
+    jm.terminate()
+
+
+def test_poll_waits_for_submission():
+    drm = FakeDRM('fast', 0)
+    drm.done.add('1')
+    jm = job_manager(True, drm)
+    jm.running_tasks = [FakeTask('1', drm='fast', drm_jobID='1')]
+
+    # as JobManager does while submitting to or killing the jobs of the DRM
+    with drm.lock:
+        assert list(jm.get_finished_tasks()) == []
+        jm.wait(0.2)
+        assert drm.polls == 0
+    jm.wait(5)
+    assert [t.id for t in jm.get_finished_tasks()] == ['1']
+    jm.terminate()
+
+
+def test_poll_errors_are_raised():
+    broken = FakeDRM('broken', 0)
+    broken.filter_is_done = lambda tasks: 1 / 0
+    jm = job_manager(True, broken)
+    jm.running_tasks = [FakeTask('1', drm='broken', drm_jobID='1')]
+
+    assert list(jm.get_finished_tasks()) == []
+    jm.wait(5)
+    with pytest.raises(ZeroDivisionError):
+        list(jm.get_finished_tasks())
+
+
+def test_run_with_concurrent_polling(wf, log_out_dir_func):
+    a = [wf.add_task(echo, dict(word=i), uid=str(i), stage_name='a') for i in range(3)]
+    wf.add_task(echo, dict(word='b'), parents=a, uid='b', stage_name='b')
+    assert wf.run(concurrent_polling=True, poll_policy=AdaptivePollPolicy(), log_out_dir_func=log_out_dir_func)
+    assert all(t.successful and t.exit_status == 0 for t in wf.tasks)
+
+
+def test_adaptive_poll_policy():
+    drm = FakeDRM('slow', 5)
+    now = datetime.datetime(2020, 1, 1)
+    task = FakeTask('1', drm='slow', drm_jobID='1')
+    task.submitted_on = now - datetime.timedelta(seconds=100)
+    policy = AdaptivePollPolicy(max_interval=60, estimate=lambda t: None)
+
+    # back off while nothing finishes, and start again when something does
+    assert [policy.next_interval(drm, [task], 0, now) for _ in range(5)] == [10, 20, 40, 60, 60]
+    assert policy.next_interval(drm, [task], 1, now) == 5
+
+    # poll often while the Task is expected to finish, between 200 and 600 seconds after it was submitted
+    policy.estimate = lambda t: 400
+    assert policy.next_interval(drm, [task], 0, now) == 10
+    assert policy.next_interval(drm, [task], 0, now) == 20
+    assert policy.next_interval(drm, [task], 0, now + datetime.timedelta(seconds=90)) == 10
+    assert policy.next_interval(drm, [task], 0, now + datetime.timedelta(seconds=100)) == 5
+    # overdue Tasks are ignored
+    assert policy.next_interval(drm, [task], 0, now + datetime.timedelta(seconds=501)) == 60
+
+
+def test_poll_metrics():
+    drm = FakeDRM('fast', 0)
+    jm = job_manager(False, drm)
+    jm.running_tasks = [FakeTask('1', drm='fast', drm_jobID='1'), FakeTask('2', drm='fast', drm_jobID='2')]
+    list(jm.get_finished_tasks())
+    drm.done.add('1')
+    list(jm.get_finished_tasks())
+    assert (jm.poll_metrics.polls['fast'], jm.poll_metrics.empty_polls['fast'], jm.poll_metrics.finished['fast']) == \
+        (2, 1, 1)
+    assert jm.poll_metrics.report().splitlines()[1].split()[:4] == ['fast', '2', '1', '1']
@@ -0,0 +1,35 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from cosmos.job.drm import profiler
+
+
+def run_profiler(cmd, interval):
+    """Run the profiler in its own process group, as DRM_Local does"""
+    output = os.path.join(tempfile.mkdtemp(), 'profile.json')
+    exit_code = subprocess.call([sys.executable, profiler.__file__.replace('.pyc', '.py'), '--interval', str(interval),
+                                 '--output', output, '--'] + cmd, preexec_fn=os.setsid)
+    with open(output) as fh:
+        return exit_code, json.load(fh)
+
+
+def test_profiler():
+    exit_code, profile = run_profiler(['bash', '-c', 'sleep 0.3 & sleep 0.3; wait; exit 3'], interval=0.05)
+
+    assert exit_code == 3
+    assert profile['exit_status'] == 3
+    assert profile['wall_time'] >= 0.3
+    assert profile['num_polls'] > 0
+    # bash and its two sleeps
+    assert profile['max_num_threads'] == 3
+    assert profile['max_rss_mem_kb'] > 0
+    assert profile['names'] == ['bash', 'sleep']
+
+
+def test_profiler_killed():
+    exit_code, profile = run_profiler(['bash', '-c', 'kill -9 $$'], interval=1)
+    assert exit_code == 128 + 9
+    assert profile['exit_status'] == -9
@@ -0,0 +1,79 @@
+import datetime
+import multiprocessing
+import time
+
+from conftest import FakeTask
+from cosmos.job.drm.DRM_Base import DRM
+from cosmos.job.drm.queue_cache import QueueCache, epoch_seconds
+
+
+class Fetch(object):
+    def __init__(self, jobs):
+        self.jobs = jobs
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return dict(self.jobs)
+
+
+def test_listing_is_shared_until_it_expires(tmpdir):
+    fetch = Fetch({'1': {'state': 'r'}, '2': {'state': 'qw'}})
+    # two caches of the same file, like two processes on the host
+    a, b = QueueCache('ge', 60, str(tmpdir)), QueueCache('ge', 60, str(tmpdir))
+    assert a.get(fetch, ['1', '3']) == {'1': {'state': 'r'}}
+    assert b.get(fetch) == {'1': {'state': 'r'}, '2': {'state': 'qw'}}
+    assert fetch.calls == 1
+
+    # a job submitted after the listing was fetched may not be in it
+    assert b.get(fetch, ['1'], newer_than=time.time()) == {'1': {'state': 'r'}}
+    assert fetch.calls == 2
+
+    b.ttl = 0
+    b.get(fetch)
+    assert fetch.calls == 3
+
+
+def test_empty_listings_are_not_cached(tmpdir):
+    fetch = Fetch({})
+    cache = QueueCache('slurm', 60, str(tmpdir))
+    assert cache.get(fetch, ['1']) == {} and cache.get(fetch, ['1']) == {}
+    assert fetch.calls == 2
+
+
+def fetch_once(cache_dir, calls_path):
+    def fetch():
+        with open(calls_path, 'a') as fh:
+            fh.write('.')
+        time.sleep(0.5)
+        return {'1': {'state': 'r'}}
+    return QueueCache('ge', 60, cache_dir).get(fetch, ['1'])
+
+
+def _get(args):
+    return fetch_once(*args)
+
+
+def test_one_fetch_per_ttl_across_processes(tmpdir):
+    calls_path = str(tmpdir.join('calls'))
+    pool = multiprocessing.Pool(4)
+    try:
+        results = pool.map(_get, [(str(tmpdir), calls_path)] * 8)
+    finally:
+        pool.close()
+    assert results == [{'1': {'state': 'r'}}] * 8
+    assert open(calls_path).read() == '.'
+
+
+def test_drm_queue_jobs(tmpdir):
+    drm = DRM(None)
+    drm.name = 'ge'
+    fetch = Fetch({'1': {'state': 'r'}, '2': {'state': 'r'}})
+    tasks = [FakeTask('1', drm='ge', drm_jobID='1', submitted_on=datetime.datetime.now())]
+    assert drm.queue_jobs(fetch, tasks) == fetch.jobs
+
+    drm.queue_cache_ttl, drm.queue_cache_dir = 60, str(tmpdir)
+    assert drm.queue_jobs(fetch, tasks) == {'1': {'state': 'r'}}
+    assert drm.queue_jobs(fetch, tasks) == {'1': {'state': 'r'}}
+    assert fetch.calls == 2
+    assert abs(epoch_seconds(tasks[0].submitted_on) - time.time()) < 5
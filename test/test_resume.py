@@ -0,0 +1,36 @@
+from conftest import echo
+from cosmos.models.Stage import Stage, StageEdge
+from cosmos.models.Task import Task, TaskEdge
+
+
+def test_resume_deletes_unsuccessful_tasks_and_empty_stages(tmpdir, monkeypatch, cosmos):
+    monkeypatch.chdir(tmpdir)
+    session = cosmos.session
+
+    wf = cosmos.start('test', skip_confirm=True)
+    a = [wf.add_task(echo, dict(word=i), uid=str(i), stage_name='a') for i in range(3)]
+    b = [wf.add_task(echo, dict(word=i), parents=[a[i]], uid=str(i), stage_name='b') for i in range(3)]
+    c = wf.add_task(echo, dict(word='c'), parents=b, uid='0', stage_name='c')
+    session.commit()
+    for t in a + b[:1]:
+        t.successful = True
+    session.commit()
+    a_ids = [t.id for t in a]
+    b0_id = b[0].id
+    session.expunge_all()
+
+    wf = cosmos.start('test', skip_confirm=True)
+    assert [s.name for s in wf.stages] == ['a', 'b']
+    assert session.query(Task).count() == 4
+    assert sorted(session.query(TaskEdge.parent_id, TaskEdge.child_id)) == [(b0_id, a_ids[0])]
+    assert session.query(StageEdge).count() == 1
+
+    # successful Tasks are returned, and their parents are only loaded if they changed
+    a = [wf.add_task(echo, dict(word=i), uid=str(i), stage_name='a') for i in range(3)]
+    assert [t.id for t in a] == a_ids
+    b0 = wf.add_task(echo, dict(word=0), parents=[a[0]], uid='0', stage_name='b')
+    assert b0.id == b0_id and 'parents' not in b0.__dict__
+    b0 = wf.add_task(echo, dict(word=0), parents=[a[0], a[1]], uid='0', stage_name='b')
+    assert b0.parents == [a[0], a[1]]
+    session.commit()
+    assert sorted(session.query(TaskEdge.parent_id, TaskEdge.child_id)) == [(b0_id, a_ids[0]), (b0_id, a_ids[1])]
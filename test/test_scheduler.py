@@ -0,0 +1,162 @@
+import pytest
+
+from conftest import FakeTask, echo
+from cosmos import TaskStatus
+from cosmos.core.scheduler import TaskQueue, ResourceLimits, critical_path_lengths
+
+
+def diamond():
+    """a -> b, a -> c, (b, c) -> d"""
+    a, b, c, d = tasks = [FakeTask(i) for i in range(4)]
+    return tasks, [(a, b), (a, c), (b, d), (c, d)]
+
+
+def submit(tasks):
+    for t in tasks:
+        t.status = TaskStatus.submitted
+    return tasks
+
+
+def test_children_become_ready_when_all_parents_complete():
+    (a, b, c, d), edges = diamond()
+    q = TaskQueue([a, b, c, d], edges)
+
+    assert submit(q.pop_ready()) == [a]
+    assert q.pop_ready() == []
+    q.complete(a)
+    assert submit(q.pop_ready()) == [b, c]
+    q.complete(b)
+    assert q.pop_ready() == []
+    q.complete(c)
+    assert submit(q.pop_ready()) == [d]
+    q.complete(d)
+    assert len(q) == 0
+
+
+def test_excluded_parents_are_skipped():
+    (a, b, c, d), edges = diamond()
+    q = TaskQueue([b, c, d], edges)
+    assert q.pop_ready() == [b, c]
+
+
+def test_remove_prunes_descendants():
+    (a, b, c, d), edges = diamond()
+    q = TaskQueue([a, b, c, d], edges)
+    submit(q.pop_ready())
+    q.complete(a)
+    submit(q.pop_ready())
+    assert q.remove(b) == {b, d}
+    assert list(q) == [c]
+    q.complete(c)
+    assert len(q) == 0 and not q.has_ready()
+
+
+def test_requeue_and_predicate():
+    tasks = [FakeTask(i, core_req=i + 1) for i in range(3)]
+    q = TaskQueue(tasks, [])
+    cores_left = [3]
+
+    def fits(t):
+        if t.core_req <= cores_left[0]:
+            cores_left[0] -= t.core_req
+            return True
+        return False
+
+    assert submit(q.pop_ready(fits)) == tasks[:2]
+    assert q.has_ready()
+
+    # a reattempted task becomes ready again
+    tasks[0].status = TaskStatus.no_attempt
+    q.requeue(tasks[0])
+    assert q.pop_ready() == [tasks[0], tasks[2]]
+
+
+def test_resource_limits_pack_cores_memory_and_custom_resources():
+    limits = ResourceLimits(dict(cores=8, mem=1000, gpu=1))
+    big_mem = FakeTask(0, core_req=1, mem_req=800)
+    gpu = [FakeTask(i, resource_req={'gpu': 1}) for i in [1, 2]]
+    small = [FakeTask(i, core_req=2, mem_req=100) for i in [3, 4, 5]]
+
+    selected = limits.select([big_mem] + gpu + small, running_tasks=[])
+    # only one gpu Task, and the memory hog still leaves room for two of the small Tasks
+    assert big_mem in selected
+    assert len(set(gpu) & set(selected)) == 1
+    assert len(set(small) & set(selected)) == 2
+
+
+def test_resource_req_is_stored_with_the_task(cosmos, wf, log_out_dir_func):
+    gpu = [wf.add_task(echo, dict(word=i), uid=str(i), resource_req={'gpu': 1}) for i in range(2)]
+    cpu = wf.add_task(echo, dict(word='cpu'), uid='cpu', stage_name='cpu')
+    assert wf.run(resources={'gpu': 1}, starvation_time=60, log_out_dir_func=log_out_dir_func)
+    assert wf.resource_limits.starvation_time == 60
+
+    cosmos.session.expire_all()
+    assert [t.resource_req for t in gpu] == [{'gpu': 1}, {'gpu': 1}]
+    assert cpu.resource_req == {} and cpu.extra == {}
+
+
+def test_resource_limits_skip_instead_of_blocking_and_reserve_for_starving_tasks():
+    limits = ResourceLimits(dict(cores=4), starvation_time=60)
+    running = [FakeTask(0, core_req=2)]
+    big = FakeTask(1, core_req=4)
+    small = FakeTask(2, core_req=1)
+
+    # the big Task does not fit, but does not block the small ones
+    assert limits.select([big, small], running, now=0) == [small]
+    another_small = FakeTask(3)
+    assert limits.select([big, another_small], running + [small], now=30) == [another_small]
+    # now the big Task has been passed over for a minute, so its cores are reserved
+    assert limits.select([big, FakeTask(4)], running, now=60) == []
+    assert limits.select([big, FakeTask(5)], [], now=90) == [big]
+
+    with pytest.raises(ValueError):
+        limits.check(FakeTask(6, core_req=5))
+
+
+def test_resource_limits_forget_tasks_that_are_no_longer_ready():
+    limits = ResourceLimits(dict(cores=1))
+    big, failed = FakeTask(0, core_req=1), FakeTask(1, core_req=1)
+    assert limits.select([big, failed], [FakeTask(2)], now=0) == []
+    # `failed` was removed from the queue, ie it failed on another attempt
+    assert limits.select([big], [FakeTask(2)], now=30) == []
+    assert limits._skipped_since == {big: 0}
+
+
+def test_resource_limits_admit_only_packs_when_something_changed():
+    limits = ResourceLimits(dict(cores=2), starvation_time=60)
+    packed = []
+    select = limits.select
+    limits.select = lambda *args: packed.append(1) or select(*args)
+    running = [FakeTask(0, core_req=2)]
+    big, small = FakeTask(1, core_req=2), FakeTask(2)
+
+    assert limits.admit([big], running, now=0) == []
+    assert limits.waiting == [big]
+    # nothing became ready or finished, and big isn't starving yet
+    for now in [10, 20, 59]:
+        assert limits.admit([], running, now=now) == []
+    assert len(packed) == 1
+
+    assert limits.admit([small], running, now=59) == []
+    assert limits.waiting == [big, small] and len(packed) == 2
+    # big starts starving, and once the running Task finishes, it gets the cores before small
+    assert limits.admit([], running, now=61) == []
+    assert len(packed) == 3
+    assert limits.admit([], [], now=62) == [big]
+    assert limits.admit([], [big], now=63) == []
+    assert limits.waiting == [small] and len(packed) == 4
+
+
+def test_critical_path_starts_long_chains_first():
+    """a -> b -> c is a long chain, d and e are independent"""
+    (a, b, c, d, e) = tasks = [FakeTask(i) for i in range(5)]
+    wall_time = {a: 10, b: 20, c: 30, d: 40, e: 1}
+    lengths = critical_path_lengths(tasks, [(a, b), (b, c)], wall_time.get)
+    assert lengths == {a: 60, b: 50, c: 30, d: 40, e: 1}
+
+    key = lambda t: (-lengths[t], t.id)
+    q = TaskQueue(tasks, [(a, b), (b, c)], key=key)
+    assert q.pop_ready() == [a, d, e]
+
+    # the priority also decides which Tasks fit under resource limits
+    assert ResourceLimits(dict(cores=2), key=key).select([e, d, a], []) == [a, d]
@@ -0,0 +1,51 @@
+from cosmos.job.drm import drm_slurm
+
+SACCT_OUTPUT = """\
+100|COMPLETED|0:0|0:0|125|01:02.500|01:00.250|00:02.250|||||||2019-01-01T00:00:00|2019-01-01T00:02:05
+100.batch|COMPLETED|0:0||125|01:02.500|01:00.250|00:02.250|2048K|1024K|4G|2G|1.5M|10M||
+100.extern|COMPLETED|0:0||125|00:00:00|00:00:00|00:00:00|4096K|10K|100K|100K|0|0||
+101_3|CANCELLED by 1234|0:15|0:0|10|00:01.000|00:01.000|00:00:00|||||||2019-01-01T00:00:00|2019-01-01T00:00:10
+"""
+
+
+def test_sacct_all(monkeypatch):
+    monkeypatch.setattr(drm_slurm.sp, 'check_output', lambda *args, **kwargs: SACCT_OUTPUT)
+    records = drm_slurm._sacct_all(['100', '101_3', '102'])
+
+    assert sorted(records) == ['100', '101_3']
+    assert records['100']['State'] == 'COMPLETED'
+    assert records['100']['MaxRSS'] == '4096K'
+    assert records['100']['MaxVMSize'] == '4G'
+    assert records['101_3']['State'] == 'CANCELLED'
+    assert drm_slurm._exit_code(records['101_3']['ExitCode'], records['101_3']['DerivedExitCode']) == 128 + 15
+
+
+def test_exit_code():
+    assert drm_slurm._exit_code('0:0', '0:0') == 0
+    assert drm_slurm._exit_code('9:0', '0:0') == 9
+    # killed by SIGKILL is not the same as exiting with 9
+    assert drm_slurm._exit_code('0:9', '0:0') == 128 + 9
+    assert drm_slurm._exit_code('', '2:0') == 2
+    assert drm_slurm._exit_code('', '') is None
+
+
+def test_sacct_all_skips_failed_chunk(monkeypatch):
+    calls = []
+
+    def check_output(args, **kwargs):
+        calls.append(args[2])
+        if len(calls) == 1:
+            raise drm_slurm.sp.CalledProcessError(1, args)
+        return SACCT_OUTPUT
+
+    monkeypatch.setattr(drm_slurm.sp, 'check_output', check_output)
+    records = drm_slurm._sacct_all(['103', '104', '100', '101_3'], chunk_size=2)
+
+    assert calls == ['103,104', '100,101_3']
+    assert sorted(records) == ['100', '101_3']
+
+
+def test_parse_sacct_time():
+    assert drm_slurm.parse_sacct_time('01:02.500') == 62.5
+    assert drm_slurm.parse_sacct_time('1-01:00:00') == 25 * 60 * 60
+    assert drm_slurm.parse_sacct_time('') is None
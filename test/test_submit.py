@@ -0,0 +1,45 @@
+import os
+import threading
+import time
+
+from conftest import FakeTask
+from cosmos import TaskStatus
+from cosmos.job.JobManager import JobManager
+from cosmos.job.drm.DRM_Base import DRM
+
+
+class FakeDRM(DRM):
+    name = 'fake'
+    submit_concurrency = 4
+
+    def __init__(self):
+        super(FakeDRM, self).__init__(None)
+        self.submit_threads = set()
+        self.result_threads = set()
+
+    def submit_spec(self, spec):
+        self.submit_threads.add(threading.current_thread().name)
+        time.sleep(0.05)
+        return 'job_%s' % os.path.basename(os.path.dirname(spec.command_script_path))
+
+    def set_submission_result(self, task, drm_jobID, error):
+        self.result_threads.add(threading.current_thread().name)
+        super(FakeDRM, self).set_submission_result(task, drm_jobID, error)
+
+
+def test_concurrent_submission(tmpdir):
+    drm = FakeDRM()
+    jm = JobManager(get_submit_args=lambda task: '', log_out_dir_func=lambda task: str(tmpdir.join(task.uid)))
+    jm.drms = {drm.name: drm}
+    tasks = [FakeTask(str(i), drm='fake') for i in range(8)]
+
+    num_threads = threading.active_count()
+    jm._submit_task_batch(drm, tasks, ['echo %s' % t.uid for t in tasks])
+
+    assert [(t.drm_jobID, t.status) for t in tasks] == [('job_%s' % t.uid, TaskStatus.submitted) for t in tasks]
+    assert tmpdir.join('3', 'command.sh').read() == 'echo 3'
+    # submitted from the pool, but the Tasks (and so the database) were only touched from this thread
+    assert len(drm.submit_threads) > 1 and threading.current_thread().name not in drm.submit_threads
+    assert drm.result_threads == {threading.current_thread().name}
+    # the pool's threads have exited
+    assert threading.active_count() == num_threads
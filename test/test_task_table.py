@@ -0,0 +1,44 @@
+import json
+
+from conftest import echo, fail
+from cosmos.api import TaskStatus
+from cosmos.web.task_table import task_page
+
+
+def test_task_pages(cosmos, wf, log_out_dir_func):
+    for i in range(7):
+        wf.add_task(echo, dict(word='word_%s' % i), uid=str(i), stage_name='a')
+    wf.add_task(fail, uid='f', stage_name='a')
+    assert not wf.run(log_out_dir_func=log_out_dir_func)
+    stage = wf.stages[0]
+    session = cosmos.session
+    ids = sorted(t.id for t in stage.tasks)
+
+    # walking by id gives the same pages as offsets, in either direction
+    for descending in [False, True]:
+        order = ids[::-1] if descending else ids
+        pages = [task_page(session, stage.id, start, 3, descending=descending)[2] for start in (0, 3, 6)]
+        assert [[t.id for t in page] for page in pages] == [order[0:3], order[3:6], order[6:]]
+        assert task_page(session, stage.id, length=3, descending=descending, after=pages[0][-1].id)[2] == pages[1]
+        assert task_page(session, stage.id, length=3, descending=descending, before=pages[2][0].id)[2] == pages[1]
+
+    assert task_page(session, stage.id, search='word_1')[:2] == (8, 1)
+    assert [t.uid for t in task_page(session, stage.id, status=TaskStatus.failed)[2]] == ['f']
+    assert [t.uid for t in task_page(session, stage.id, order_by='task', descending=True, length=2)[2]] == ['f', '6']
+
+    client = cosmos.init_flask().test_client()
+    r = json.loads(client.get('/workflow/test/a/tasks.json?limit=5').data)
+    assert (r['total'], r['filtered'], len(r['tasks']), r['next_after']) == (8, 8, 5, ids[4])
+    r = json.loads(client.get('/workflow/test/a/tasks.json?limit=5&after=%s' % ids[4]).data)
+    assert [t['id'] for t in r['tasks']] == ids[5:] and r['next_after'] is None
+    assert client.get('/workflow/test/a/tasks.json?status=nope').status_code == 400
+    assert client.get('/workflow/test/a/tasks.json?order_by=status&after=1').status_code == 400
+
+    r = json.loads(client.get('/workflow/test/a/tasks/datatable?sEcho=2&iDisplayStart=0&iDisplayLength=50'
+                              '&sSearch=failed&iSortCol_0=0&sSortDir_0=asc').data)
+    assert (r['sEcho'], r['iTotalRecords'], r['iTotalDisplayRecords']) == (2, 8, 1)
+    assert r['aaData'][0]['status'] == 'failed' and r['aaData'][0]['successful'] is False
+
+    response = client.get('/workflow/test/a/')
+    assert response.status_code == 200 and '7/8' in response.data
+    assert client.get('/workflow/test/nope/').status_code == 404
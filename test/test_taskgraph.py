@@ -0,0 +1,85 @@
+from conftest import echo
+from cosmos.api import Task, TaskStatus
+from cosmos.graph import draw
+from cosmos.web import views
+from cosmos.web.taskgraph import GraphCache, graph_key, stage_subgraph
+
+
+def test_graph_key_and_stage_subgraph(monkeypatch, cosmos, wf, log_out_dir_func):
+    a = [wf.add_task(echo, dict(word=i), uid=str(i), stage_name='a') for i in range(3)]
+    b = wf.add_task(echo, dict(word='b'), parents=a, uid='b', stage_name='b')
+    assert wf.run(log_out_dir_func=log_out_dir_func)
+    session = cosmos.session
+    stage_a, stage_b = wf.stages
+
+    assert sorted((u.uid, v.uid) for u, v in wf.task_graph().edges()) == [('0', 'b'), ('1', 'b'), ('2', 'b')]
+
+    g = stage_subgraph(session, stage_b)
+    assert set(g.nodes()) == {b, stage_a} and list(g.edges()) == [(stage_a, b)]
+    g = stage_subgraph(session, stage_a, max_tasks=2)
+    assert set(g.nodes()) == {a[0], a[1], stage_b, '+ 1 more Tasks'}
+    assert set(g.edges()) == {(a[0], stage_b), (a[1], stage_b)}
+
+    keys = [graph_key(session, wf.id), graph_key(session, wf.id, stage_a.id), graph_key(session, wf.id, stage_b.id)]
+    assert graph_key(session, wf.id) == keys[0]
+
+    def set_status(task_id, status):
+        session.query(Task).filter_by(id=task_id).update(dict(_status=status))
+        session.commit()
+
+    set_status(a[0].id, TaskStatus.failed)
+    new_keys = [graph_key(session, wf.id), graph_key(session, wf.id, stage_a.id), graph_key(session, wf.id, stage_b.id)]
+    assert new_keys[0] != keys[0] and new_keys[1] != keys[1] and new_keys[2] == keys[2]
+    # two Tasks swapping statuses
+    set_status(a[0].id, TaskStatus.successful)
+    set_status(a[1].id, TaskStatus.failed)
+    assert graph_key(session, wf.id) not in (keys[0], new_keys[0])
+
+    # pygraphviz may not be installed, so count the drawings instead
+    drawn = []
+    monkeypatch.setattr(draw, 'pygraphviz_available', True)
+    for name in ['draw_task_graph', 'draw_stage_summary_graph', 'draw_stage_subgraph']:
+        monkeypatch.setattr(views, name, lambda graph, *args, **kwargs: drawn.append(graph) or '<svg/>')
+
+    client = cosmos.init_flask().test_client()
+    urls = ['/workflow/%s/taskgraph/%s/' % (wf.id, view) for view in ('summary', 'task', 'stage/%s' % stage_a.id)]
+    b_id = b.id
+    missing_stage = '/workflow/%s/taskgraph/stage/%s/' % (wf.id, stage_b.id + 1)
+    for url in urls + urls:
+        assert client.get(url).status_code == 200
+    assert client.get(missing_stage).status_code == 404
+    # each was drawn once
+    assert len(drawn) == 3 and len(drawn[1].nodes()) == 4
+    set_status(b_id, TaskStatus.failed)
+    client.get(urls[0])
+    client.get(urls[2])
+    assert len(drawn) == 4
+
+
+def test_graph_cache():
+    drawn = []
+
+    def render(name):
+        drawn.append(name)
+        return 'svg of %s' % name
+
+    cache = GraphCache(max_size=2)
+    assert cache.get((1, 'task'), 'k1', lambda: render('a')) == 'svg of a'
+    assert cache.get((1, 'task'), 'k1', lambda: render('b')) == 'svg of a'
+    assert cache.get((1, 'task'), 'k2', lambda: render('c')) == 'svg of c'
+    assert drawn == ['a', 'c'] and len(cache) == 1
+
+    cache.get((1, 'summary'), 'k1', lambda: render('d'))
+    cache.get((1, 'task'), 'k2', lambda: render('e'))
+    # the least recently used graph is dropped
+    cache.get((2, 'task'), 'k1', lambda: render('f'))
+    cache.get((1, 'task'), 'k2', lambda: render('g'))
+    cache.get((1, 'summary'), 'k1', lambda: render('h'))
+    assert drawn == ['a', 'c', 'd', 'f', 'h']
+
+    cache.invalidate(2)
+    assert len(cache) == 2
+    cache.invalidate(1)
+    assert len(cache) == 0
+    cache.get((1, 'task'), 'k2', lambda: render('i'))
+    assert drawn[-1] == 'i'
@@ -0,0 +1,46 @@
+import pstats
+
+from conftest import echo
+from cosmos.util.timing import Histogram, PhaseTimings, NullTimings
+
+
+def test_histogram_percentiles():
+    h = Histogram()
+    for ms in range(1, 101):
+        h.add(ms / 1000.0)
+    assert h.count == 100 and abs(h.total - 5.05) < 1e-9 and h.max == 0.1
+    # buckets are 10 ** 0.1 (26%) wide
+    assert 0.05 <= h.percentile(50) < 0.05 * 1.26
+    assert 0.09 <= h.percentile(90) < 0.09 * 1.26
+    assert h.percentile(100) == 0.1
+
+
+def test_null_timings_record_nothing():
+    timings = NullTimings()
+    with timings.phase('commit'):
+        pass
+    timings.record('slurm.poll', 1)
+    assert not timings.histograms
+
+    timings = PhaseTimings()
+    with timings.phase('commit'):
+        pass
+    assert timings.histograms['commit'].count == 1
+    assert timings.report().splitlines()[1].split()[:2] == ['commit', '1']
+
+
+def test_run_with_timings(tmpdir, wf, log_out_dir_func):
+    a = [wf.add_task(echo, dict(word=i), uid=str(i), stage_name='a') for i in range(3)]
+    wf.add_task(echo, dict(word='b'), parents=a, uid='b', stage_name='b')
+    path = str(tmpdir.join('run.prof'))
+    assert wf.run(cprofile=path, log_out_dir_func=log_out_dir_func)
+
+    histograms = wf.timings.histograms
+    assert histograms['call_cmd_fxn'].count == 4
+    assert histograms['create_command_sh'].count == 4
+    assert histograms['local.submit'].count == 4 and histograms['local.popen'].count == 4
+    assert histograms['signal_handlers'].count == 4
+    assert all(histograms[phase].count for phase in ['stage_graph', 'insert', 'task_dag', 'task_queue', 'schedule',
+                                                      'commit', 'wait', 'local.poll'])
+    stats = pstats.Stats(path)
+    assert any(func[2] == '_run' for func in stats.stats)
@@ -0,0 +1,54 @@
+from conftest import echo
+from cosmos.api import Cosmos
+from cosmos.models.Task import Task
+from cosmos.util.sqla import WriteBehind
+
+
+def test_commits_after_interval_or_size(tmpdir, monkeypatch, cosmos):
+    monkeypatch.chdir(tmpdir)
+    session = cosmos.session
+    wf = cosmos.start('test', skip_confirm=True)
+    tasks = [wf.add_task(echo, dict(word=i), uid=str(i)) for i in range(3)]
+    session.commit()
+
+    now = [0]
+    write_behind = WriteBehind(session, flush_interval=10, flush_size=3, clock=lambda: now[0])
+    tasks[0].drm_jobID = '1'
+    assert not write_behind.commit() and write_behind.num_pending() == 1
+    now[0] = 10
+    assert write_behind.commit() and write_behind.num_pending() == 0
+
+    for t in tasks:
+        t.drm_jobID = '2'
+    assert write_behind.commit() and write_behind.num_flushes == 2
+
+
+def test_crash_loses_only_uncommitted_changes(tmpdir, monkeypatch, database_url, cosmos):
+    monkeypatch.chdir(tmpdir)
+    session = cosmos.session
+    wf = cosmos.start('test', skip_confirm=True)
+    a = wf.add_task(echo, dict(word='a'), uid='a')
+    b = wf.add_task(echo, dict(word='b'), uid='b')
+    session.commit()
+
+    write_behind = WriteBehind(session, flush_interval=3600)
+    a.successful = True
+    write_behind.flush()
+    b.successful = True
+    assert not write_behind.commit()
+
+    # the process dies here; another process only sees what was committed, and reruns b when resuming
+    other = Cosmos(database_url)
+    assert sorted(other.session.query(Task.uid, Task.successful)) == [('a', True), ('b', False)]
+    wf = other.start('test', skip_confirm=True)
+    assert [t.uid for t in wf.tasks] == ['a']
+
+
+def test_run_with_flush_interval(database_url, wf, log_out_dir_func):
+    a = [wf.add_task(echo, dict(word=i), uid=str(i), stage_name='a') for i in range(3)]
+    wf.add_task(echo, dict(word='b'), parents=a, uid='b', stage_name='b')
+    assert wf.run(flush_interval=3600, log_out_dir_func=log_out_dir_func)
+
+    other = Cosmos(database_url)
+    assert other.session.query(Task).filter(Task.successful == False).count() == 0
+    assert other.session.query(Task).count() == 4